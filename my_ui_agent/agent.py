@@ -2,25 +2,37 @@
 UI Analysis Agent
 Core functionality for analyzing UI elements in images
 """
+import io
 import os
-import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Any
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import numpy as np
 
-# Google Cloud Vision imports (optional)
-try:
-    from google.cloud import vision
-    HAS_VISION_API = True
-except ImportError:
-    HAS_VISION_API = False
+from lazy_imports import module_available, import_optional
+
+# Google Cloud Vision (optional). The library is heavy, so it is only
+# imported when the client is first needed.
+HAS_VISION_API = module_available('google.cloud.vision')
+if not HAS_VISION_API:
     logging.warning("Google Cloud Vision API not available")
 
-from .constants import MOBILE_GAMING_UI_TAXONOMY, ANALYSIS_CONFIG, UI_COLORS
-from .config import GOOGLE_CLOUD_CONFIG, ANALYSIS_SETTINGS
+from constants import MOBILE_GAMING_UI_TAXONOMY, ANALYSIS_CONFIG, ALL_UI_TAGS
+from config import GOOGLE_CLOUD_CONFIG, ANALYSIS_SETTINGS, IMAGE_SERVING_SETTINGS, OCR_SETTINGS
+from tiling import compute_tiles, offset_elements
+from box_ops import dedupe_elements, to_boxes
+from element_table import ElementTable
+from element_classifier import classify_boxes, texts_for_boxes
+from local_ocr import LocalOCR, ocr_available
+from vision_batch_client import VisionBatchClient
+from result_io import dump_results
+from image_renditions import existing_rendition
+from annotation_renderer import render_annotated_image
+from taxonomy_index import TAXONOMY_INDEX, TagMatch
 
 class UIAnalysisAgent:
     """
@@ -29,24 +41,91 @@ class UIAnalysisAgent:
     
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self.vision_client = None
-        self._initialize_vision_client()
+        self._vision_client = None
+        self._vision_client_initialized = False
+        # Trained element_classifier.ElementClassifier; rules are used without it
+        self.element_model = None
+        self._ocr = None
+        self._vision_batch = None
+        self._tile_vision_batch = None
+    
+    @property
+    def vision_client(self):
+        """Google Cloud Vision client, created on first use"""
+        if not self._vision_client_initialized:
+            self._vision_client_initialized = True
+            self._initialize_vision_client()
+        return self._vision_client
+    
+    @vision_client.setter
+    def vision_client(self, client):
+        self._vision_client = client
+        self._vision_client_initialized = True
+    
+    @property
+    def vision_batch(self) -> VisionBatchClient:
+        """One batched annotate call per request for all enabled Vision features"""
+        if self._vision_batch is None or self._vision_batch.client is not self.vision_client:
+            self._vision_batch = VisionBatchClient(self.vision_client)
+        return self._vision_batch
+    
+    @property
+    def tile_vision_batch(self) -> VisionBatchClient:
+        """Batched text detection only: tiled mode keeps text and would discard objects"""
+        if self._tile_vision_batch is None or self._tile_vision_batch.client is not self.vision_client:
+            self._tile_vision_batch = VisionBatchClient(self.vision_client, {
+                **ANALYSIS_SETTINGS, 'enable_object_detection': False, 'enable_face_detection': False
+            })
+        return self._tile_vision_batch
         
+    @property
+    def ocr(self) -> LocalOCR:
+        """Local Tesseract OCR backend, created on first use"""
+        if self._ocr is None:
+            self._ocr = LocalOCR()
+        return self._ocr
+    
+    def _text_backend(self) -> Optional[str]:
+        """Text backend for this run: 'google', 'local' or None (see OCR_SETTINGS['backend'])"""
+        backend = OCR_SETTINGS['backend']
+        if backend in ('google', 'auto') and self.vision_client:
+            return 'google'
+        if backend in ('local', 'auto') and ocr_available():
+            return 'local'
+        return None
+    
+    def _local_text_elements(self, image: Image.Image, ui_elements: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Local OCR on the whole image or only inside the detector boxes"""
+        regions = to_boxes(ui_elements) if OCR_SETTINGS['restrict_to_detections'] else None
+        try:
+            return self.ocr.recognize(image, regions)
+        except Exception as e:
+            self.logger.warning(f"Local OCR failed: {e}")
+            return []
+    
     def _initialize_vision_client(self):
         """Initialize Google Cloud Vision client if available"""
         if HAS_VISION_API and GOOGLE_CLOUD_CONFIG.get('credentials_path'):
             try:
+                vision = import_optional('google.cloud.vision', 'google-cloud-vision')
                 self.vision_client = vision.ImageAnnotatorClient()
                 self.logger.info("Google Cloud Vision API initialized")
             except Exception as e:
                 self.logger.warning(f"Failed to initialize Vision API: {e}")
     
-    def analyze_image(self, image_path: str) -> Dict[str, Any]:
+    def analyze_image(self, image_path: str, tiled: Optional[bool] = None,
+                      as_table: bool = False) -> Dict[str, Any]:
         """
         Analyze an image for UI elements
         
         Args:
             image_path: Path to the image file
+            tiled: Analyze overlapping tiles instead of the whole image.
+                   Keeps small icons on very large or tall screenshots.
+                   None - automatically when the longer side exceeds
+                   ANALYSIS_SETTINGS['tile_auto_min_side']
+            as_table: Return text and UI elements as ElementTable instead of
+                      lists of dicts (much smaller for OCR-heavy screenshots)
             
         Returns:
             Dictionary containing analysis results
@@ -70,17 +149,54 @@ class UIAnalysisAgent:
                 'mode': image.mode
             }
             
-            # Analyze with Vision API if available
-            if self.vision_client:
-                vision_results = self._analyze_with_vision_api(image_path)
-                results['text_elements'] = vision_results.get('text_elements', [])
-                results['detected_objects'] = vision_results.get('objects', [])
-            
-            # Analyze colors
-            results['colors'] = self._analyze_colors(image)
-            
-            # Find potential UI elements using basic computer vision
-            results['ui_elements'] = self._find_ui_elements(image)
+            text_backend = self._text_backend()
+            results['metadata']['text_backend'] = text_backend
+            
+            if tiled is None:
+                tiled = max(image.size) > ANALYSIS_SETTINGS['tile_auto_min_side']
+            results['metadata']['tiled'] = tiled
+            
+            if tiled:
+                tiled_results = self._analyze_tiled(image, text_backend)
+                results['text_elements'] = tiled_results['text_elements']
+                results['ui_elements'] = tiled_results['ui_elements']
+                results['metadata']['tiles'] = tiled_results['tiles']
+            else:
+                # Analyze with Vision API if available
+                if text_backend == 'google':
+                    vision_results = self._analyze_with_vision_api(image_path)
+                    results['text_elements'] = vision_results.get('text_elements', [])
+                    results['detected_objects'] = vision_results.get('objects', [])
+                
+                # Find potential UI elements using basic computer vision
+                results['ui_elements'] = self._find_ui_elements(image)
+                
+                if text_backend == 'local':
+                    results['text_elements'] = self._local_text_elements(image, results['ui_elements'])
+            
+            ui_elements = results['ui_elements']
+            ui_table = ElementTable.from_elements(ui_elements, source='detector')
+            kept = ui_table.dedupe_indices(ANALYSIS_SETTINGS['nms_iou_threshold'])
+            ui_table = ui_table[kept]
+            retyped = np.zeros(0, dtype=np.intp)
+            if ANALYSIS_SETTINGS['classify_elements']:
+                retyped = self._classify_ui_table(image, ui_table, results['text_elements'])
+            
+            if as_table:
+                results['ui_elements'] = ui_table
+                results['text_elements'] = ElementTable.from_elements(
+                    results['text_elements'], source='ocr' if text_backend == 'local' else 'vision_text')
+            else:
+                # The detector dicts are kept as they are (polygons, precision);
+                # only reclassified elements get a new type and confidence
+                ui_elements = [ui_elements[i] for i in kept.tolist()]
+                for i in retyped.tolist():
+                    ui_elements[i] = {**ui_elements[i], 'type': ui_table.type_name(i),
+                                      'confidence': round(float(ui_table.confidence[i]), 4)}
+                results['ui_elements'] = ui_elements
+            
+            # Analyze colors on the small cached rendition
+            results['colors'] = self._analyze_colors(self._colors_image(image_path, image))
             
             self.logger.info(f"Analysis completed for {image_path}")
             
@@ -90,42 +206,145 @@ class UIAnalysisAgent:
             
         return results
     
+    def _analyze_tiled(self, image: Image.Image, text_backend: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analyze overlapping tiles in parallel and merge the results
+        
+        Coordinates are mapped back to the full image and duplicates found
+        by neighbouring tiles across a seam are merged.
+        """
+        tile_size = ANALYSIS_SETTINGS['tile_size']
+        overlap = ANALYSIS_SETTINGS['tile_overlap']
+        tiles = compute_tiles(image.width, image.height, tile_size, overlap)
+        
+        # PIL cannot decode a region of a PNG/JPEG stream, so the image is
+        # decoded once and shared (the classifier reads it too). Tiles are cut
+        # inside the workers one row of tiles at a time, and encoded tiles for
+        # the Vision API are sent as soon as a batch fills up, so per-tile
+        # memory does not grow with the image.
+        image.load()
+        
+        tile_results: List[Dict[str, Any]] = []
+        pending: List[Dict[str, Any]] = []
+        
+        def send_pending():
+            annotated = self.tile_vision_batch.annotate_contents([results.pop('content') for results in pending])
+            for results, vision_results in zip(pending, annotated):
+                results['text_elements'] = vision_results['text_elements']
+            pending.clear()
+        
+        with ThreadPoolExecutor(max_workers=ANALYSIS_SETTINGS['tile_workers']) as executor:
+            for _, row in groupby(tiles, key=lambda tile: tile[1]):
+                row_results = list(executor.map(lambda tile: self._analyze_tile(image, tile, text_backend), row))
+                tile_results.extend(row_results)
+                if text_backend == 'google':
+                    # Vision API: text of many tiles per batched request instead of one call per tile
+                    pending.extend(row_results)
+                    if len(pending) >= self.tile_vision_batch.batch_size:
+                        send_pending()
+        if pending:
+            send_pending()
+        
+        text_elements, ui_elements = [], []
+        for (x, y, _, _), results in zip(tiles, tile_results):
+            text_elements.extend(offset_elements(results['text_elements'], x, y))
+            ui_elements.extend(offset_elements(results['ui_elements'], x, y))
+        
+        # Copies cut by a seam lie inside the full copy from the neighbouring tile
+        iou_threshold = ANALYSIS_SETTINGS['tile_merge_iou']
+        containment = ANALYSIS_SETTINGS['containment_threshold']
+        return {
+            'text_elements': dedupe_elements(text_elements, iou_threshold, containment, keep='outer',
+                                             class_key=None),
+            'ui_elements': dedupe_elements(ui_elements, iou_threshold, containment, keep='outer'),
+            'tiles': len(tiles)
+        }
+    
+    def _classify_ui_table(self, image: Image.Image, ui_table: ElementTable,
+                           text_elements: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Map detector types that are not taxonomy tags onto the taxonomy
+        
+        All such boxes of the image are classified in one vectorized call
+        (element_classifier) using their geometry, colors and the OCR text
+        inside them; the table is updated in place.
+        
+        Returns:
+            Indices of the reclassified rows
+        """
+        untyped = np.flatnonzero(ui_table.type_ids >= len(ALL_UI_TAGS))
+        if not len(untyped):
+            return untyped
+        
+        boxes = ui_table.boxes[untyped]
+        texts = texts_for_boxes(boxes, to_boxes(text_elements),
+                                [element.get('text') or '' for element in text_elements])
+        tags, confidence = classify_boxes(image, boxes, texts, self.element_model)
+        ui_table.type_ids[untyped] = [ui_table.type_id(tag) for tag in tags]
+        ui_table.confidence[untyped] = np.minimum(ui_table.confidence[untyped], confidence)
+        return untyped
+    
+    def _deduplicate_ui_elements(self, elements: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Suppress overlapping detections of the same type"""
+        return dedupe_elements(elements, ANALYSIS_SETTINGS['nms_iou_threshold'])
+    
+    def _analyze_tile(self, image: Image.Image, tile: Tuple[int, int, int, int],
+                      text_backend: Optional[str] = None) -> Dict[str, Any]:
+        """Run the detector and text backend on a single tile"""
+        x, y, w, h = tile
+        crop = image.crop((x, y, x + w, y + h))
+        results = {'text_elements': [], 'ui_elements': self._find_ui_elements(crop)}
+        
+        if text_backend == 'google':
+            # Encoded here, sent together with the other tiles by _analyze_tiled
+            buffer = io.BytesIO()
+            crop.save(buffer, format='PNG')
+            results['content'] = buffer.getvalue()
+        elif text_backend == 'local':
+            results['text_elements'] = self._local_text_elements(crop, results['ui_elements'])
+        
+        return results
+    
     def _analyze_with_vision_api(self, image_path: str) -> Dict[str, Any]:
         """Analyze image using Google Cloud Vision API"""
-        results = {'text_elements': [], 'objects': []}
-        
         try:
             with open(image_path, 'rb') as image_file:
                 content = image_file.read()
-            
-            image = vision.Image(content=content)
-            
-            # Text detection
-            text_response = self.vision_client.text_detection(image=image)
-            for text in text_response.text_annotations:
-                if text.description.strip():
-                    bounds = text.bounding_poly.vertices
-                    results['text_elements'].append({
-                        'text': text.description,
-                        'bounds': [(v.x, v.y) for v in bounds],
-                        'confidence': getattr(text, 'confidence', 0.9)
-                    })
-            
-            # Object detection
-            object_response = self.vision_client.object_localization(image=image)
-            for obj in object_response.localized_object_annotations:
-                bounds = obj.bounding_poly.normalized_vertices
-                results['objects'].append({
-                    'name': obj.name,
-                    'confidence': obj.score,
-                    'bounds': [(v.x, v.y) for v in bounds]
-                })
-                
-        except Exception as e:
+        except OSError as e:
             self.logger.warning(f"Vision API analysis failed: {e}")
-            
+            return {'text_elements': [], 'objects': []}
+        
+        return self._analyze_vision_content(content)
+    
+    def _analyze_vision_content(self, content: bytes) -> Dict[str, Any]:
+        """Analyze encoded image bytes: all enabled features in a single annotate request"""
+        results = self.vision_batch.annotate_contents([content])[0]
+        if 'error' in results:
+            self.logger.warning(f"Vision API analysis failed: {results.pop('error')}")
         return results
     
+    def _colors_image(self, image_path: str, image: Image.Image) -> Image.Image:
+        """
+        Small copy for color analysis
+        
+        Web uploads already have a 'colors' rendition, which is reused;
+        everywhere else (CLI, batch, watcher) the image is downscaled in
+        memory so analysis never writes to the rendition cache.
+        """
+        path = existing_rendition(image_path, 'colors')
+        if path is not None:
+            try:
+                with Image.open(path) as small:
+                    small.load()
+                    return small
+            except OSError as e:
+                self.logger.warning(f"Colors rendition unreadable, resizing in memory: {e}")
+        
+        max_side = IMAGE_SERVING_SETTINGS['renditions']['colors']['max_side']
+        scale = min(1.0, max_side / max(image.size))
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    
     def _analyze_colors(self, image: Image.Image) -> List[Dict[str, Any]]:
         """Extract dominant colors from image"""
         try:
@@ -133,8 +352,8 @@ class UIAnalysisAgent:
             if image.mode != 'RGB':
                 image = image.convert('RGB')
             
-            # Resize for performance
-            image_small = image.resize((100, 100))
+            # Resize for performance (cached renditions are already small)
+            image_small = image if image.width * image.height <= 100 * 100 else image.resize((100, 100))
             
             # Get pixel data
             pixels = np.array(image_small).reshape(-1, 3)
@@ -198,7 +417,8 @@ class UIAnalysisAgent:
         return elements
     
     def create_annotated_image(self, image_path: str, analysis_results: Dict[str, Any], 
-                             output_path: str) -> str:
+                             output_path: str, scale: Optional[float] = None,
+                             fmt: Optional[str] = None) -> str:
         """
         Create an annotated version of the image with detected elements highlighted
         
@@ -206,43 +426,21 @@ class UIAnalysisAgent:
             image_path: Original image path
             analysis_results: Results from analyze_image()
             output_path: Where to save the annotated image
+            scale: Output scale (default RENDER_SETTINGS['scale'])
+            fmt: 'png', 'jpeg' or 'webp' (default: from output_path)
             
         Returns:
             Path to the annotated image
         """
         try:
-            image = Image.open(image_path)
-            draw = ImageDraw.Draw(image)
-            
-            # Try to load a font
-            try:
-                font = ImageFont.truetype("arial.ttf", 12)
-            except:
-                font = ImageFont.load_default()
-            
-            # Draw text elements
-            for text_elem in analysis_results.get('text_elements', []):
-                bounds = text_elem['bounds']
-                if bounds:
-                    draw.polygon(bounds, outline=UI_COLORS['text'], width=2)
-                    if len(bounds) > 0:
-                        draw.text(bounds[0], text_elem.get('text', '')[:20], 
-                                fill=UI_COLORS['text'], font=font)
-            
-            # Draw UI elements
-            for ui_elem in analysis_results.get('ui_elements', []):
-                bounds = ui_elem['bounds']
-                if bounds:
-                    color = UI_COLORS.get(ui_elem.get('type', 'buttons'), UI_COLORS['buttons'])
-                    draw.polygon(bounds, outline=color, width=3)
-                    if len(bounds) > 0:
-                        draw.text(bounds[0], ui_elem.get('type', 'element'), 
-                                fill=color, font=font)
-            
-            # Add legend
-            self._add_legend(draw, font, image.width, image.height)
-            
-            image.save(output_path)
+            ui_elements = analysis_results.get('ui_elements', [])
+            if isinstance(ui_elements, ElementTable):
+                ui_elements = ui_elements.dedupe(ANALYSIS_SETTINGS['nms_iou_threshold'])
+            else:
+                ui_elements = self._deduplicate_ui_elements(ui_elements)
+            
+            render_annotated_image(image_path, {**analysis_results, 'ui_elements': ui_elements},
+                                   output_path, scale=scale, fmt=fmt)
             self.logger.info(f"Annotated image saved to {output_path}")
             return output_path
             
@@ -250,45 +448,29 @@ class UIAnalysisAgent:
             self.logger.error(f"Failed to create annotated image: {e}")
             return image_path
     
-    def _add_legend(self, draw: ImageDraw.Draw, font, width: int, height: int):
-        """Add a legend to the annotated image"""
-        legend_items = [
-            ("Text", UI_COLORS['text']),
-            ("Buttons", UI_COLORS['buttons']),
-            ("Containers", UI_COLORS['containers'])
-        ]
-        
-        legend_x = width - 150
-        legend_y = 10
-        
-        for i, (label, color) in enumerate(legend_items):
-            y_pos = legend_y + i * 20
-            draw.rectangle([legend_x, y_pos, legend_x + 15, y_pos + 15], 
-                         outline=color, width=2)
-            draw.text((legend_x + 20, y_pos), label, fill=color, font=font)
-    
     def save_analysis_data(self, analysis_results: Dict[str, Any], 
-                          output_dir: str) -> str:
+                          output_dir: str, fmt: Optional[str] = None,
+                          compression: Optional[str] = 'default') -> str:
         """
-        Save analysis results to JSON file
+        Save analysis results to disk
         
         Args:
             analysis_results: Results from analyze_image()
             output_dir: Directory to save the data
+            fmt: json / msgpack / cbor (default from SERIALIZATION_SETTINGS)
+            compression: None / gzip / zstd (default from SERIALIZATION_SETTINGS)
             
         Returns:
-            Path to the saved JSON file
+            Path to the saved file
         """
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"ui_analysis_{timestamp}.json"
-            filepath = os.path.join(output_dir, filename)
-            
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(analysis_results, f, indent=2, ensure_ascii=False)
+            filepath = dump_results(analysis_results,
+                                    os.path.join(output_dir, f"ui_analysis_{timestamp}"),
+                                    fmt, compression)
             
             self.logger.info(f"Analysis data saved to {filepath}")
-            return filepath
+            return str(filepath)
             
         except Exception as e:
             self.logger.error(f"Failed to save analysis data: {e}")
@@ -302,17 +484,22 @@ class UIAnalysisAgent:
         """
         Classify a UI element based on its description
         
+        The most specific taxonomy tag mentioned in the description wins
+        ('play button' over 'button'), see taxonomy_index.
+        
         Args:
             element_description: Description of the element
             
         Returns:
             Category name from taxonomy
         """
-        description_lower = element_description.lower()
-        
-        for category, elements in MOBILE_GAMING_UI_TAXONOMY.items():
-            for element in elements:
-                if element.replace('_', ' ') in description_lower:
-                    return category
+        return TAXONOMY_INDEX.classify(element_description)
+    
+    def classify_elements(self, descriptions: List[str]) -> List[Optional[TagMatch]]:
+        """
+        Classify many descriptions (e.g. all OCR strings of a screenshot) at once
         
-        return 'interactive'  # Default category
\ No newline at end of file
+        Returns:
+            Per description: TagMatch(category, tag, start, end) or None
+        """
+        return TAXONOMY_INDEX.classify_many(descriptions)
\ No newline at end of file
@@ -4,6 +4,8 @@ from pathlib import Path
 from dotenv import load_dotenv
 import logging
 
+from lazy_imports import module_available
+
 # Загрузка переменных окружения
 load_dotenv()
 
@@ -43,63 +45,39 @@ class AIVisionConfig:
         self._print_status()
     
     def _check_google_vision(self) -> bool:
-        """Проверка Google Cloud Vision API"""
-        try:
-            # Проверка переменных окружения
-            gcp_credentials = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-            if gcp_credentials and Path(gcp_credentials).exists():
-                from google.cloud import vision
-                client = vision.ImageAnnotatorClient()
-                self.logger.info("✅ Google Cloud Vision: ДОСТУПЕН")
-                return True
-            else:
-                self.logger.warning("⚠️ Google Cloud Vision: ОТСУТСТВУЮТ CREDENTIALS")
-                return False
-        except ImportError:
+        """Проверка Google Cloud Vision API (без импорта библиотеки и создания клиента)"""
+        if not module_available('google.cloud.vision'):
             self.logger.error("❌ Google Cloud Vision: БИБЛИОТЕКА НЕ УСТАНОВЛЕНА")
             return False
-        except Exception as e:
-            self.logger.error(f"❌ Google Cloud Vision: ОШИБКА - {str(e)}")
-            return False
+        
+        gcp_credentials = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+        if gcp_credentials and Path(gcp_credentials).exists():
+            self.logger.info("✅ Google Cloud Vision: ДОСТУПЕН")
+            return True
+        self.logger.warning("⚠️ Google Cloud Vision: ОТСУТСТВУЮТ CREDENTIALS")
+        return False
     
     def _check_claude(self) -> bool:
-        """Проверка Anthropic Claude API"""
-        try:
-            api_key = os.getenv('ANTHROPIC_API_KEY')
-            if api_key:
-                from anthropic import Anthropic
-                client = Anthropic(api_key=api_key)
-                self.logger.info("✅ Anthropic Claude: ДОСТУПЕН")
-                return True
-            else:
-                self.logger.warning("⚠️ Anthropic Claude: ОТСУТСТВУЕТ API_KEY")
-                return False
-        except ImportError:
+        """Проверка Anthropic Claude API (без импорта библиотеки и создания клиента)"""
+        if not module_available('anthropic'):
             self.logger.error("❌ Anthropic Claude: БИБЛИОТЕКА НЕ УСТАНОВЛЕНА")
             return False
-        except Exception as e:
-            self.logger.error(f"❌ Anthropic Claude: ОШИБКА - {str(e)}")
-            return False
+        
+        if os.getenv('ANTHROPIC_API_KEY'):
+            self.logger.info("✅ Anthropic Claude: ДОСТУПЕН")
+            return True
+        self.logger.warning("⚠️ Anthropic Claude: ОТСУТСТВУЕТ API_KEY")
+        return False
     
     def _check_phi(self) -> bool:
-        """Проверка Phi Vision (PyTorch + Transformers)"""
-        try:
-            import torch
-            from transformers import AutoModelForCausalLM, AutoProcessor
-            
-            # Проверка доступности CUDA
-            cuda_available = torch.cuda.is_available()
-            if cuda_available:
-                self.logger.info("✅ Phi Vision: ДОСТУПЕН (CUDA)")
-            else:
-                self.logger.info("✅ Phi Vision: ДОСТУПЕН (CPU)")
-            return True
-        except ImportError as e:
-            self.logger.error(f"❌ Phi Vision: БИБЛИОТЕКИ НЕ УСТАНОВЛЕНЫ - {str(e)}")
-            return False
-        except Exception as e:
-            self.logger.error(f"❌ Phi Vision: ОШИБКА - {str(e)}")
+        """Проверка Phi Vision (PyTorch + Transformers) без импорта torch"""
+        missing = [name for name in ('torch', 'transformers') if not module_available(name)]
+        if missing:
+            self.logger.error(f"❌ Phi Vision: БИБЛИОТЕКИ НЕ УСТАНОВЛЕНЫ - {', '.join(missing)}")
             return False
+        
+        self.logger.info("✅ Phi Vision: ДОСТУПЕН (устройство определится при загрузке модели)")
+        return True
     
     def _print_status(self):
         """Вывод статуса всех сервисов"""
@@ -0,0 +1,352 @@
+"""
+Отрисовка размеченных изображений
+
+Страница аннотации рисует рамки сама, на canvas поверх оригинала, по
+компактной геометрии из element_geometry; растровые копии с рамками
+нужны только для экспорта (обзорные листы, выгрузка).
+
+Все рамки рисуются в один индексный слой (режим 'L', байт на пиксель):
+элементы класса пачкой, значением-номером класса. Слой переводится в
+цвета через палитру и накладывается на изображение одной операцией.
+Шрифты и растры повторяющихся подписей (типы элементов) кэшируются в
+процессе. При scale < 1 изображение уменьшается до отрисовки, поэтому
+рисование и кодирование идут на выходном размере.
+Пакеты (обзорные листы для тысяч скриншотов) отрисовываются в пуле
+процессов.
+
+Использование:
+    python annotation_renderer.py results.jsonl review/ --scale 0.5 --format jpeg
+"""
+import argparse
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from config import RENDER_SETTINGS
+from constants import MOBILE_GAMING_UI_TAXONOMY, UI_COLORS
+from dataset_entries import bounds_to_bbox
+from element_table import ElementTable
+
+# Категория таксономии -> класс цвета в UI_COLORS
+CATEGORY_COLOR_CLASSES = {
+    'interactive': 'buttons',
+    'navigational': 'navigation',
+    'informational': 'containers',
+    'structural': 'containers',
+    'gaming_specific': 'gaming'
+}
+TYPE_COLOR_CLASSES = {
+    tag: CATEGORY_COLOR_CLASSES[category]
+    for category, tags in MOBILE_GAMING_UI_TAXONOMY.items()
+    for tag in tags
+}
+TEXT_COLOR_CLASS = 'text'
+DEFAULT_COLOR_CLASS = 'buttons'
+
+LEGEND_LABELS = {
+    'text': 'Text',
+    'buttons': 'Buttons',
+    'containers': 'Containers',
+    'navigation': 'Navigation',
+    'gaming': 'Gaming'
+}
+
+FONT_CANDIDATES = ('arial.ttf', 'DejaVuSans.ttf', 'LiberationSans-Regular.ttf')
+
+PIL_FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP'}
+
+
+@lru_cache(maxsize=None)
+def get_font(size: int):
+    """Шрифт нужного размера (ищется один раз на процесс)"""
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1: только растровый шрифт без размера
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=4096)
+def _label_mask(text: str, font_size: int) -> Image.Image:
+    """Растр подписи (маска 'L'); типы элементов повторяются на каждом изображении"""
+    font = get_font(font_size)
+    left, top, right, bottom = font.getbbox(text)
+    mask = Image.new('L', (max(1, right), max(1, bottom)), 0)
+    ImageDraw.Draw(mask).text((0, 0), text, fill=255, font=font)
+    return mask
+
+
+def color_class(element_type: Optional[str]) -> str:
+    """Класс цвета для типа элемента (по категории таксономии)"""
+    if element_type in UI_COLORS:
+        return element_type
+    return TYPE_COLOR_CLASSES.get(element_type, DEFAULT_COLOR_CLASS)
+
+
+def _iter_shapes(elements) -> Iterator[Tuple[Optional[str], List[Tuple[float, float]], Optional[str]]]:
+    """(тип, вершины, текст) для списка словарей или ElementTable"""
+    if isinstance(elements, ElementTable):
+        for i, (x1, y1, x2, y2) in enumerate(elements.boxes.tolist()):
+            yield elements.type_name(i), [(x1, y1), (x2, y1), (x2, y2), (x1, y2)], elements.text(i)
+        return
+    for element in elements:
+        bounds = element.get('bounds') or element.get('bounding_poly')
+        if isinstance(bounds, dict):  # формат страницы аннотации / Vision API
+            bounds = [(vertex.get('x') or 0, vertex.get('y') or 0) for vertex in bounds.get('vertices') or []]
+        if bounds:
+            yield element.get('type'), [tuple(point) for point in bounds], element.get('text')
+
+
+def group_shapes(analysis_results: Dict) -> Dict[str, List[Tuple[List[Tuple[float, float]], str]]]:
+    """Вершины и подписи элементов, сгруппированные по классу цвета"""
+    groups: Dict[str, List] = {}
+    for _, vertices, text in _iter_shapes(analysis_results.get('text_elements', [])):
+        groups.setdefault(TEXT_COLOR_CLASS, []).append((vertices, (text or '')[:20]))
+    for element_type, vertices, _ in _iter_shapes(analysis_results.get('ui_elements', [])):
+        groups.setdefault(color_class(element_type), []).append((vertices, element_type or 'element'))
+    return groups
+
+
+def _geometry_box(item: Dict) -> List[int]:
+    bbox = bounds_to_bbox(item.get('bounds') or item.get('bounding_poly'))
+    return [round(v) for v in bbox] if bbox else [0, 0, 0, 0]
+
+
+def _percent(confidence) -> Optional[int]:
+    return None if confidence is None else round(float(confidence) * 100)
+
+
+def element_geometry(analysis: Dict, width: int, height: int) -> Dict:
+    """
+    Компактная геометрия элементов для отрисовки на клиенте
+
+    Рамки - плоские списки [x1, y1, x2, y2, ...] в пикселях оригинала,
+    классы UI элементов - индексы в classes, уверенность - проценты.
+    Порядок элементов совпадает с идентификаторами аннотаций
+    annotate.html ('text-<i>', 'ui-<i>').
+    """
+    text = {'boxes': [], 'confidence': [], 'labels': []}
+    for item in analysis.get('texts') or analysis.get('text_elements') or []:
+        text['boxes'].extend(_geometry_box(item))
+        text['confidence'].append(_percent(item.get('confidence')))
+        text['labels'].append(item.get('description') or item.get('text') or '')
+
+    classes: List[str] = []
+    class_ids: Dict[str, int] = {}
+    ui = {'boxes': [], 'class_ids': [], 'confidence': []}
+    for item in analysis.get('ui_elements') or []:
+        name = item.get('type') or 'element'
+        if name not in class_ids:
+            class_ids[name] = len(classes)
+            classes.append(name)
+        ui['boxes'].extend(_geometry_box(item))
+        ui['class_ids'].append(class_ids[name])
+        ui['confidence'].append(_percent(item.get('confidence')))
+
+    return {
+        'image': {'width': width, 'height': height},
+        'classes': classes,
+        'colors': [UI_COLORS[color_class(name)] for name in classes],
+        'text_color': UI_COLORS[TEXT_COLOR_CLASS],
+        'text': text,
+        'ui': ui
+    }
+
+
+def _load_scaled(image_path, scale: float) -> Image.Image:
+    """RGB-изображение выходного размера (JPEG декодируется сразу уменьшенным)"""
+    with Image.open(image_path) as source:
+        if scale == 1:
+            return source.convert('RGB')
+        size = (max(1, round(source.width * scale)), max(1, round(source.height * scale)))
+        source.draft('RGB', size)
+        return source.convert('RGB').resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+
+def _draw_legend(image: Image.Image, groups: Dict[str, List], font):
+    """Легенда в правом верхнем углу: классы на изображении и число элементов"""
+    draw = ImageDraw.Draw(image)
+    entries = [(f"{LEGEND_LABELS.get(name, name)} ({len(groups[name])})", UI_COLORS[name])
+               for name in UI_COLORS if name in groups]
+    if not entries:
+        return
+    line_height = round(font.size * 1.6) if hasattr(font, 'size') else 16
+    swatch = line_height - 4
+    text_width = max(draw.textlength(label, font=font) for label, _ in entries)
+    x = max(0, image.width - int(text_width) - swatch - 16)
+    for i, (label, color) in enumerate(entries):
+        y = 6 + i * line_height
+        draw.rectangle([x, y, x + swatch, y + swatch], outline=color, width=2)
+        draw.text((x + swatch + 6, y), label, fill=color, font=font)
+
+
+def _save_options(image_format: str) -> Dict[str, Any]:
+    if image_format == 'JPEG':
+        return {'quality': RENDER_SETTINGS['jpeg_quality']}
+    if image_format == 'PNG':
+        return {'compress_level': RENDER_SETTINGS['png_compress_level']}
+    if image_format == 'WEBP':
+        return {'quality': RENDER_SETTINGS['webp_quality']}
+    return {}
+
+
+def render_annotated_image(image_path, analysis_results: Dict, output_path,
+                           scale: Optional[float] = None, fmt: Optional[str] = None,
+                           draw_labels: Optional[bool] = None, legend: bool = True) -> str:
+    """
+    Изображение с рамками найденных элементов
+
+    Args:
+        image_path: Исходное изображение
+        analysis_results: Результаты с text_elements / ui_elements
+                          (списки словарей или ElementTable)
+        output_path: Куда сохранить
+        scale: Масштаб выходного изображения (координаты пересчитываются)
+        fmt: 'png', 'jpeg' или 'webp'; по умолчанию по расширению output_path
+        draw_labels: Подписывать элементы
+        legend: Добавить легенду
+
+    Returns:
+        Путь к сохраненному изображению
+    """
+    scale = scale or RENDER_SETTINGS['scale']
+    draw_labels = RENDER_SETTINGS['draw_labels'] if draw_labels is None else draw_labels
+    fmt = (fmt or RENDER_SETTINGS['format'] or Path(output_path).suffix.lstrip('.') or 'png').lower()
+    image_format = PIL_FORMATS.get(fmt, fmt.upper())
+
+    image = _load_scaled(image_path, scale)
+    font_size = max(RENDER_SETTINGS['min_font_size'], round(RENDER_SETTINGS['font_size'] * scale))
+    groups = group_shapes(analysis_results)
+
+    # Индексный слой: 0 - пусто, i - i-й класс в palette
+    layer = Image.new('L', image.size, 0)
+    draw = ImageDraw.Draw(layer)
+    palette = [0, 0, 0]
+    labels = []
+    for index, (name, shapes) in enumerate(groups.items(), 1):
+        palette.extend(ImageColor.getrgb(UI_COLORS[name]))
+        base_width = RENDER_SETTINGS['text_line_width' if name == TEXT_COLOR_CLASS else 'ui_line_width']
+        line_width = max(1, round(base_width * scale))
+
+        for vertices, label in shapes:
+            points = [(x * scale, y * scale) for x, y in vertices]
+            if len(points) >= 3:
+                draw.polygon(points, outline=index, width=line_width)
+            elif len(points) == 2:
+                (x1, y1), (x2, y2) = points
+                draw.rectangle([min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)],
+                               outline=index, width=line_width)
+            if draw_labels and label:
+                labels.append(((int(points[0][0]), int(points[0][1])), label, palette[-3:]))
+
+    # Одно наложение рамок: слой -> цвета по палитре, маска - ненулевые пиксели
+    bbox = layer.getbbox()
+    if bbox:
+        layer = layer.crop(bbox)
+        colored = layer.copy()
+        colored.putpalette(palette)
+        mask = layer.point([0] + [255] * 255)
+        image.paste(colored.convert('RGB'), bbox, mask)
+
+    # Подписи поверх рамок: сглаженные растры из кэша, заливка только в их границах
+    for position, label, color in labels:
+        image.paste(tuple(color), position, _label_mask(label, font_size))
+
+    if legend:
+        _draw_legend(image, groups, get_font(font_size))
+
+    image.save(output_path, image_format, **_save_options(image_format))
+    return str(output_path)
+
+
+def _render_job(job: Tuple[str, Any, str, Dict]) -> Tuple[str, Optional[str]]:
+    """Отрисовка в процессе пула; результаты могут быть путем к сохраненному анализу"""
+    image_path, analysis, output_path, options = job
+    try:
+        if not isinstance(analysis, dict):
+            from result_io import load_results
+            analysis = load_results(analysis, restore_tables=True)
+        return render_annotated_image(image_path, analysis, output_path, **options), None
+    except Exception as e:
+        return output_path, str(e)
+
+
+def render_batch(jobs: Iterable[Tuple[Any, Any, Any]], workers: Optional[int] = None,
+                 **options) -> List[Dict[str, Optional[str]]]:
+    """
+    Пакетная отрисовка в пуле процессов
+
+    Args:
+        jobs: Тройки (изображение, результаты или путь к ним, выходной файл)
+        workers: Число процессов (по умолчанию RENDER_SETTINGS['workers'] или по числу ядер)
+        **options: Параметры render_annotated_image (scale, fmt, draw_labels, legend)
+
+    Returns:
+        [{'output_path': ..., 'error': None или текст ошибки}, ...] в порядке jobs
+    """
+    jobs = [(str(image_path), analysis, str(output_path), options)
+            for image_path, analysis, output_path in jobs]
+    workers = workers or RENDER_SETTINGS['workers'] or os.cpu_count() or 1
+
+    if workers <= 1 or len(jobs) <= 1:
+        rendered = list(map(_render_job, jobs))
+    else:
+        # Крупные порции уменьшают накладные расходы на передачу заданий
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            rendered = list(executor.map(_render_job, jobs, chunksize=chunksize))
+
+    report = []
+    for output_path, error in rendered:
+        if error:
+            logging.error(f"❌ {output_path}: {error}")
+        report.append({'output_path': output_path, 'error': error})
+    return report
+
+
+def _jobs_from_batch_results(results_path, output_dir: Path, fmt: str) -> Iterator[Tuple[str, Dict, Path]]:
+    """Задания из JSONL пакетного анализа (batch_writer)"""
+    from batch_manifest import batch_id
+    from batch_writer import iter_batch_results
+
+    for record in iter_batch_results(results_path):
+        image_path = record.get('image_path')
+        if not image_path or record.get('error'):
+            continue
+        # Записи расширенного агента хранят элементы в google_vision
+        analysis = record.get('google_vision', record)
+        name = f"{Path(image_path).stem}_{batch_id(image_path)}_annotated.{fmt}"
+        yield image_path, analysis, output_dir / name
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Обзорные изображения по результатам пакетного анализа")
+    parser.add_argument('results', help="JSONL с результатами пакетного анализа")
+    parser.add_argument('output_dir', help="папка для размеченных изображений")
+    parser.add_argument('--scale', type=float, default=None, help="масштаб (например, 0.5)")
+    parser.add_argument('--format', default='jpeg', choices=sorted(PIL_FORMATS), help="формат файлов")
+    parser.add_argument('--workers', type=int, default=None, help="число процессов")
+    parser.add_argument('--no-labels', action='store_true', help="без подписей элементов")
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report = render_batch(
+        _jobs_from_batch_results(args.results, output_dir, args.format),
+        workers=args.workers, scale=args.scale, fmt=args.format,
+        draw_labels=False if args.no_labels else None
+    )
+    failed = sum(1 for item in report if item['error'])
+    print(f"✅ Отрисовано: {len(report) - failed}, ошибок: {failed}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,319 @@
+"""
+Асинхронный (ASGI) вариант веб-приложения
+
+Те же маршруты и шаблоны, что в web_app (Flask), но на Quart: запрос -
+это корутина, а не поток, поэтому один процесс держит сотни
+одновременных запросов, которые ждут ответа внешних API (Claude, Google
+Vision), и на каждый ожидающий запрос тратятся килобайты, а не стек
+потока. Асинхронные агенты (HybridUIVisionAgent.smart_ui_analysis)
+вызываются через await напрямую; синхронный клиент Google Vision и
+локальная модель Phi работают в пуле потоков (asyncio.to_thread), не
+блокируя цикл событий.
+
+Подготовка данных сессии и датасета общая с web_app.
+
+Запуск:
+    python run_web_app.py --asgi [--workers N]
+    uvicorn asgi_app:app --workers 4
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Optional
+
+from quart import Quart, abort, flash, jsonify, redirect, render_template, request, send_file, url_for
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+from annotation_renderer import PIL_FORMATS, render_annotated_image
+from config import Config, SERVER_SETTINGS
+from image_renditions import (content_digest, image_info, prefetch_renditions, rendition_path,
+                              set_immutable, set_revalidate)
+from lazy_imports import module_available
+from result_io import to_serializable
+from web_app import (allowed_file, build_session_analysis, cleanup_session_files, get_ui_agent,
+                     get_ui_taxonomy, list_dataset_entries, load_session, save_to_dataset,
+                     session_geometry, tiled_option)
+
+app = Quart(__name__)
+app.config.from_object(Config)
+
+# Методы анализа при загрузке: google - как в web_app, остальные -
+# стратегии гибридного агента (выполняются одновременно с Google Vision)
+ANALYSIS_METHODS = ('google', 'auto', 'hybrid', 'phi', 'claude', 'local', 'roi')
+
+# Создаются при старте цикла событий (before_serving)
+_analysis_slots: Optional[asyncio.Semaphore] = None
+_hybrid_agent = None
+_hybrid_agent_lock: Optional[asyncio.Lock] = None
+
+
+@app.before_serving
+async def startup():
+    """Агент и пул потоков для синхронных бэкендов - один раз на процесс"""
+    global _analysis_slots, _hybrid_agent_lock
+    _analysis_slots = asyncio.Semaphore(SERVER_SETTINGS['max_concurrent_analyses'])
+    _hybrid_agent_lock = asyncio.Lock()
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=SERVER_SETTINGS['async_backend_threads'], thread_name_prefix='backend')
+    )
+    await asyncio.to_thread(get_ui_agent)
+    app.logger.info(f"ASGI воркер {os.getpid()}: UI агент инициализирован")
+
+
+async def get_hybrid_agent():
+    """
+    Гибридный агент процесса (или None, если ни Phi, ни Claude недоступны)
+
+    Создается при первом запросе: загрузка модели Phi занимает время и
+    выполняется в потоке.
+    """
+    global _hybrid_agent
+    async with _hybrid_agent_lock:
+        if _hybrid_agent is None:
+            from hybrid_vision_agent import HybridUIVisionAgent
+            api_key = os.getenv('ANTHROPIC_API_KEY')
+            try:
+                agent = await asyncio.to_thread(
+                    HybridUIVisionAgent, anthropic_api_key=api_key, enable_claude=bool(api_key)
+                )
+            except Exception as e:
+                app.logger.error(f"Ошибка инициализации гибридного агента: {e}")
+                return None
+            if agent.get_available_services():
+                _hybrid_agent = agent
+    return _hybrid_agent
+
+
+async def analyze_upload(filepath: str, analysis_method: str, tiled: Optional[bool] = None) -> Dict:
+    """
+    Анализ загруженного изображения
+
+    Google Vision дает рамки элементов для страницы аннотации; при
+    гибридном методе описание от Phi/Claude запрашивается параллельно.
+    tiled - как в UIAnalysisAgent.analyze_image (None - по размеру).
+    """
+    async with _analysis_slots:
+        google_task = asyncio.to_thread(get_ui_agent().analyze_image, filepath, tiled)
+        if analysis_method == 'google':
+            return build_session_analysis(await google_task)
+
+        hybrid_agent = await get_hybrid_agent()
+        if hybrid_agent is None:
+            app.logger.warning("Гибридный анализ недоступен, используется только Google Vision")
+            return build_session_analysis(await google_task)
+
+        results, hybrid_results = await asyncio.gather(
+            google_task, hybrid_agent.smart_ui_analysis(filepath, analysis_method)
+        )
+        analysis = build_session_analysis(results)
+        analysis['hybrid_vision'] = hybrid_results
+        return analysis
+
+
+def _write_json(path: str, data: Dict):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, default=to_serializable)
+
+
+def _read_json(path: str) -> Dict:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+@app.route('/')
+async def index():
+    """Главная страница с формой загрузки"""
+    return await render_template('index.html', taxonomy=get_ui_taxonomy())
+
+
+@app.route('/upload', methods=['POST'])
+async def upload_file():
+    """Обработка загруженного файла"""
+    files = await request.files
+    if 'file' not in files:
+        return jsonify({'error': 'Не выбран файл'}), 400
+
+    file = files['file']
+    if file.filename == '':
+        return jsonify({'error': 'Не выбран файл'}), 400
+
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Недопустимый тип файла'}), 400
+
+    form = await request.form
+    analysis_method = form.get('analysis_method', 'google')
+    if analysis_method not in ANALYSIS_METHODS:
+        return jsonify({'error': f'Неизвестный метод анализа: {analysis_method}'}), 400
+
+    # Генерируем уникальное имя файла
+    original_filename = secure_filename(file.filename)
+    unique_filename = f"{uuid.uuid4().hex}_{original_filename}"
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
+    await file.save(filepath)
+
+    # Копии создаются в фоне, пока идет анализ
+    renditions = asyncio.wrap_future(await asyncio.to_thread(prefetch_renditions, filepath))
+    analysis = await analyze_upload(filepath, analysis_method, tiled_option(form))
+    renditions = await renditions
+    session_data = {
+        'filename': unique_filename,
+        'original_filename': original_filename,
+        'timestamp': analysis['timestamp'],
+        'image': image_info(renditions),
+        'analysis_result': analysis
+    }
+    await asyncio.to_thread(_write_json, f"{filepath}.json", session_data)
+
+    return redirect(url_for('annotate', filename=unique_filename))
+
+
+@app.route('/annotate/<filename>')
+async def annotate(filename):
+    """Страница аннотации с результатами анализа"""
+    session_data = await asyncio.to_thread(load_session, filename)
+    if session_data is None:
+        await flash('Данные сессии не найдены')
+        return redirect(url_for('index'))
+
+    return await render_template('annotate.html',
+                                 session_data=session_data,
+                                 taxonomy=get_ui_taxonomy())
+
+
+@app.route('/api/elements/<filename>')
+async def api_elements(filename):
+    """Компактная геометрия элементов: annotate.html рисует рамки сам"""
+    session_data = await asyncio.to_thread(load_session, filename)
+    if session_data is None:
+        return jsonify({'error': 'Данные сессии не найдены'}), 404
+
+    response = jsonify(session_geometry(session_data))
+    await response.add_etag()
+    return set_revalidate(await response.make_conditional(request))
+
+
+@app.route('/export/<filename>')
+async def export_annotated(filename):
+    """Растровая копия с рамками - только для выгрузки (?format=png|jpeg|webp&scale=0.5)"""
+    session_data = await asyncio.to_thread(load_session, filename)
+    if session_data is None:
+        abort(404)
+    fmt = request.args.get('format', 'png').lower()
+    if fmt not in PIL_FORMATS:
+        return jsonify({'error': f'Неподдерживаемый формат: {fmt}'}), 400
+    scale = min(max(request.args.get('scale', 1.0, type=float), 0.05), 1.0)
+
+    buffer = io.BytesIO()
+    await asyncio.to_thread(render_annotated_image, os.path.join(app.config['UPLOAD_FOLDER'], filename),
+                            session_data['analysis_result'], buffer, scale=scale, fmt=fmt)
+    buffer.seek(0)
+    download_name = f"{os.path.splitext(session_data['original_filename'])[0]}_annotated.{fmt}"
+    return await send_file(buffer, mimetype=f"image/{PIL_FORMATS[fmt].lower()}",
+                           as_attachment=True, attachment_filename=download_name)
+
+
+@app.route('/save_annotations', methods=['POST'])
+async def save_annotations():
+    """Сохранение аннотаций пользователя"""
+    data = await request.get_json()
+    filename = data.get('filename')
+
+    if not filename:
+        return jsonify({'error': 'Не указан файл'}), 400
+
+    session_file = os.path.join(app.config['UPLOAD_FOLDER'], f"{filename}.json")
+
+    if not os.path.exists(session_file):
+        return jsonify({'error': 'Данные сессии не найдены'}), 404
+
+    session_data = await asyncio.to_thread(_read_json, session_file)
+    session_data['user_annotations'] = data.get('annotations', [])
+    session_data['user_feedback'] = data.get('feedback', '')
+    session_data['annotation_timestamp'] = datetime.now().isoformat()
+    await asyncio.to_thread(_write_json, session_file, session_data)
+
+    try:
+        await asyncio.to_thread(save_to_dataset, session_data)
+        await asyncio.to_thread(cleanup_session_files, filename)
+        return jsonify({'success': True, 'message': 'Аннотации сохранены в датасет'})
+    except Exception as e:
+        return jsonify({'error': f'Ошибка при сохранении: {str(e)}'}), 500
+
+
+async def _send_cached(path: str, etag: str):
+    """Файл с заданным ETag, ответами 304 и поддержкой Range"""
+    response = await send_file(path, add_etags=False)
+    response.set_etag(etag)
+    return await response.make_conditional(request, accept_ranges=True,
+                                           complete_length=os.path.getsize(path))
+
+
+@app.route('/uploads/<filename>')
+async def uploaded_file(filename):
+    """Отдача загруженных файлов с ETag по хешу содержимого"""
+    path = safe_join(str(app.config['UPLOAD_FOLDER']), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    digest = await asyncio.to_thread(content_digest, path)
+    return set_revalidate(await _send_cached(path, digest))
+
+
+@app.route('/media/<digest>/<kind>')
+async def media_file(digest, kind):
+    """Оригинал или уменьшенная копия по хешу содержимого (кэшируется навсегда)"""
+    path = rendition_path(digest, kind)
+    if path is None:
+        abort(404)
+    return set_immutable(await _send_cached(str(path), f"{digest}-{kind}"))
+
+
+@app.route('/dataset')
+async def dataset_overview():
+    """Обзор созданного датасета"""
+    entries = await asyncio.to_thread(list_dataset_entries)
+    return await render_template('dataset.html', entries=entries)
+
+
+@app.route('/api/taxonomy')
+async def api_taxonomy():
+    """API endpoint для получения таксономии"""
+    return jsonify(get_ui_taxonomy())
+
+
+def run_asgi(host: Optional[str] = None, port: Optional[int] = None, workers: Optional[int] = None):
+    """
+    Запуск ASGI-сервера: uvicorn (несколько процессов), иначе hypercorn
+
+    Args:
+        host: Адрес (по умолчанию из SERVER_SETTINGS)
+        port: Порт
+        workers: Число процессов; каждый обслуживает запросы одним циклом событий
+    """
+    host = host or SERVER_SETTINGS['host']
+    port = port or SERVER_SETTINGS['port']
+    workers = workers or 1
+
+    if module_available('uvicorn'):
+        import uvicorn
+        logging.info(f"🚀 uvicorn: {workers} воркеров на {host}:{port}")
+        uvicorn.run('asgi_app:app', host=host, port=port, workers=workers)
+    elif module_available('hypercorn'):
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config as HypercornConfig
+        config = HypercornConfig()
+        config.bind = [f"{host}:{port}"]
+        logging.info(f"🚀 hypercorn на {host}:{port}")
+        asyncio.run(serve(app, config))
+    else:
+        raise ImportError("Нет ASGI-сервера. Установите: pip install uvicorn")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_asgi()
@@ -0,0 +1,231 @@
+"""
+Манифест пакета массового анализа
+
+Для каждого входного изображения хранится хэш содержимого, статус,
+число попыток и место результата (JSONL-файл и смещение строки).
+Повторный запуск той же команды обрабатывает только новые, измененные
+и упавшие изображения; упавшие - пока не исчерпан лимит попыток
+из BATCH_SETTINGS. Хэш пересчитывается только при изменении размера
+или времени модификации файла.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+from config import BATCH_SETTINGS
+
+MANIFEST_VERSION = 1
+
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def file_sha256(path, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def retry_delay(attempt: int) -> float:
+    """Пауза перед попыткой номер attempt (1 - первая, без паузы)"""
+    if attempt <= 1:
+        return 0.0
+    delay = BATCH_SETTINGS['retry_base_delay'] * BATCH_SETTINGS['retry_backoff'] ** (attempt - 2)
+    return min(delay, BATCH_SETTINGS['retry_max_delay'])
+
+
+async def run_with_retries(analyze: Callable[[], Awaitable[Dict]], image_path,
+                           manifest: Optional['BatchManifest'] = None) -> Dict:
+    """
+    Анализ изображения с повторами по политике BATCH_SETTINGS
+
+    Неудачная попытка - исключение или результат с ключом error: так
+    агенты сообщают об ошибках бэкендов (например, 429 от API), не
+    прерывая анализ. Когда попытки исчерпаны, возвращается результат
+    последней попытки с error и attempts - его отмечают mark_failed.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        if manifest:
+            manifest.mark_attempt(image_path)
+
+        try:
+            result = await analyze()
+        except Exception as e:
+            result = {
+                "timestamp": datetime.now().isoformat(),
+                "image_path": str(image_path),
+                "error": str(e)
+            }
+        if not result.get("error"):
+            return result
+
+        logging.error(f"❌ Ошибка обработки {Path(image_path).name} (попытка {attempt}): {result['error']}")
+        attempts_left = (manifest.attempts_left(image_path) if manifest
+                         else BATCH_SETTINGS['max_attempts'] - attempt)
+        if attempts_left <= 0:
+            result["attempts"] = attempt
+            return result
+        await asyncio.sleep(retry_delay(attempt + 1))
+
+
+def batch_id(*parts) -> str:
+    """Стабильный идентификатор пакета по параметрам команды"""
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()[:12]
+
+
+class BatchManifest:
+    """Состояние пакета между запусками"""
+
+    def __init__(self, path, max_attempts: Optional[int] = None, save_every: Optional[int] = None):
+        """
+        Args:
+            path: JSON-файл манифеста (создается при первом сохранении)
+            max_attempts: Лимит попыток на изображение по всем запускам
+            save_every: Сохранять манифест каждые N обновлений
+        """
+        self.path = Path(path)
+        self.max_attempts = max_attempts or BATCH_SETTINGS['max_attempts']
+        self.save_every = save_every or BATCH_SETTINGS['manifest_save_every']
+        self.items: Dict[str, Dict] = {}
+        self.created = datetime.now().isoformat()
+        self._unsaved = 0
+
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.items = data.get('items', {})
+            self.created = data.get('created', self.created)
+
+    def _fingerprint(self, image_path: Path, item: Optional[Dict]) -> Dict:
+        """Размер, mtime и хэш; хэш берется из манифеста, если файл не менялся"""
+        stat = image_path.stat()
+        if item and item.get('size') == stat.st_size and item.get('mtime_ns') == stat.st_mtime_ns:
+            sha256 = item['sha256']
+        else:
+            sha256 = file_sha256(image_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256}
+
+    def iter_plan(self, image_paths: Iterable, retry_failed: bool = False) -> Iterator[Path]:
+        """
+        Изображения, которые нужно обработать в этом запуске, по мере проверки
+
+        Работает потоково: входной список может быть ленивым генератором
+        (см. file_discovery), обработка начинается с первого же файла.
+
+        Args:
+            image_paths: Все входные изображения
+            retry_failed: Повторить и те, у которых исчерпан лимит попыток
+        """
+        planned = skipped = exhausted = 0
+        for image_path in image_paths:
+            image_path = Path(image_path)
+            key = str(image_path)
+            item = self.items.get(key)
+            try:
+                fingerprint = self._fingerprint(image_path, item)
+            except FileNotFoundError:
+                continue
+
+            if item is None or item['sha256'] != fingerprint['sha256']:
+                # Новое или измененное изображение: счетчик попыток с нуля
+                item = {'status': STATUS_PENDING, 'attempts': 0, 'output': None, 'error': None}
+                self.items[key] = item
+            item.update(fingerprint)
+
+            if item['status'] == STATUS_DONE:
+                skipped += 1
+                continue
+            if item['attempts'] >= self.max_attempts and not retry_failed:
+                skipped += 1
+                exhausted += 1
+                continue
+            planned += 1
+            yield image_path
+
+        logging.info(f"📋 Манифест: к обработке {planned}, пропущено {skipped}"
+                     + (f" (лимит попыток исчерпан: {exhausted})" if exhausted else ""))
+        self.save()
+
+    def plan(self, image_paths: Iterable, retry_failed: bool = False) -> List[Path]:
+        """Список изображений для обработки (см. iter_plan)"""
+        return list(self.iter_plan(image_paths, retry_failed))
+
+    def attempts_left(self, image_path) -> int:
+        """Сколько попыток осталось у изображения"""
+        item = self.items[str(image_path)]
+        return max(self.max_attempts - item['attempts'], 0)
+
+    def mark_attempt(self, image_path):
+        """Учет начатой попытки"""
+        item = self.items[str(image_path)]
+        item['attempts'] += 1
+        item['updated'] = datetime.now().isoformat()
+
+    def mark_done(self, image_path, results_path, offset: int):
+        """Успешный результат записан в results_path по смещению offset"""
+        item = self.items[str(image_path)]
+        item.update({
+            'status': STATUS_DONE,
+            'output': {'path': str(results_path), 'offset': offset},
+            'error': None,
+            'updated': datetime.now().isoformat()
+        })
+        self._touch()
+
+    def mark_failed(self, image_path, error: str, results_path=None, offset: Optional[int] = None):
+        """Попытка завершилась ошибкой"""
+        item = self.items[str(image_path)]
+        item.update({
+            'status': STATUS_FAILED,
+            'output': {'path': str(results_path), 'offset': offset} if results_path else None,
+            'error': error,
+            'updated': datetime.now().isoformat()
+        })
+        self._touch()
+
+    def _touch(self):
+        self._unsaved += 1
+        if self._unsaved >= self.save_every:
+            self.save()
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        """Число изображений по статусам"""
+        counts = {STATUS_PENDING: 0, STATUS_DONE: 0, STATUS_FAILED: 0}
+        for item in self.items.values():
+            counts[item['status']] += 1
+        return counts
+
+    def save(self):
+        """Атомарная запись манифеста"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            'version': MANIFEST_VERSION,
+            'created': self.created,
+            'updated': datetime.now().isoformat(),
+            'max_attempts': self.max_attempts,
+            'counts': self.counts,
+            'items': self.items
+        }
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+    def __enter__(self) -> 'BatchManifest':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.save()
@@ -0,0 +1,205 @@
+"""
+Потоковая запись результатов массового анализа
+
+Каждый результат дописывается отдельной строкой в JSONL-файл сразу после
+обработки изображения, поэтому память не растет с размером пакета, а сбой
+в середине не теряет уже готовые результаты. Рядом поддерживается сводка
+<имя>.summary.json, которая обновляется при каждом сбросе на диск.
+
+Режим продолжения (resume) перечитывает существующий файл и пропускает
+изображения, для которых уже есть успешный результат; изображения с
+ошибкой обрабатываются повторно.
+"""
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set
+
+from config import BATCH_SETTINGS
+from result_io import to_serializable
+
+SUMMARY_SUFFIX = '.summary.json'
+
+
+def summary_path_for(results_path) -> Path:
+    """Путь сводки для файла результатов"""
+    results_path = Path(results_path)
+    return results_path.with_name(results_path.stem + SUMMARY_SUFFIX)
+
+
+def new_results_path(directory, prefix: str) -> Path:
+    """Новый файл результатов <prefix>_<timestamp>.jsonl, не затирающий существующие"""
+    directory = Path(directory)
+    stem = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    path = directory / f"{stem}.jsonl"
+    counter = 1
+    while path.exists():
+        path = directory / f"{stem}_{counter}.jsonl"
+        counter += 1
+    return path
+
+
+def read_batch_result(results_path, offset: int) -> Dict:
+    """Чтение одного результата по смещению из манифеста"""
+    with open(results_path, 'rb') as f:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+
+def iter_batch_results(results_path) -> Iterator[Dict]:
+    """
+    Построчное чтение JSONL-файла результатов
+
+    Недописанная последняя строка (обрыв при сбое) пропускается.
+    """
+    with open(results_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logging.warning(f"⚠️ Пропущена поврежденная строка {line_number} в {results_path}")
+
+
+class BatchResultWriter:
+    """Append-only запись результатов пакета с инкрементальной сводкой"""
+
+    def __init__(self, results_path, resume: bool = False, key_field: str = 'image_path',
+                 flush_every: Optional[int] = None, flush_interval: Optional[float] = None):
+        """
+        Args:
+            results_path: Путь к JSONL-файлу
+            resume: Продолжить существующий файл вместо перезаписи
+            key_field: Поле результата, идентифицирующее изображение
+            flush_every: Сбрасывать на диск каждые N результатов (по умолчанию из BATCH_SETTINGS)
+            flush_interval: ... или не реже чем раз в столько секунд
+        """
+        self.results_path = Path(results_path)
+        self.summary_path = summary_path_for(self.results_path)
+        self.key_field = key_field
+        self.flush_every = flush_every or BATCH_SETTINGS['flush_every']
+        self.flush_interval = flush_interval or BATCH_SETTINGS['flush_interval']
+
+        # Для сводки хватает статуса по ключу и суммы confidence успешных
+        self._succeeded: Set[str] = set()
+        self._failed: Set[str] = set()
+        self._confidence_sum = 0.0
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self.started = datetime.now().isoformat()
+
+        self.results_path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and self.results_path.exists():
+            self._load_existing()
+            logging.info(f"🔁 Продолжение пакета: {len(self._succeeded)} изображений уже обработано")
+            mode = 'ab'
+        else:
+            mode = 'wb'
+        self._file = open(self.results_path, mode)
+        self._offset = self._file.seek(0, os.SEEK_END)
+
+    def _load_existing(self):
+        """Восстанавливает состояние сводки по уже записанным результатам"""
+        self._truncate_partial_line()
+        for result in iter_batch_results(self.results_path):
+            self._account(result)
+
+    def _truncate_partial_line(self):
+        """Обрезает недописанную при сбое последнюю строку, чтобы дозапись не склеилась с ней"""
+        with open(self.results_path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            position = size
+            while position > 0:
+                step = min(64 * 1024, position)
+                f.seek(position - step)
+                newline = f.read(step).rfind(b'\n')
+                if newline >= 0:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position < size:
+                f.truncate(position)
+                logging.warning(f"⚠️ Обрезана недописанная строка в {self.results_path}")
+
+    def _account(self, result: Dict):
+        """Учет результата в сводке"""
+        key = str(result.get(self.key_field))
+        if 'error' in result:
+            if key not in self._succeeded:
+                self._failed.add(key)
+        elif key not in self._succeeded:
+            self._failed.discard(key)
+            self._succeeded.add(key)
+            self._confidence_sum += result.get('confidence_score', 0) or 0
+
+    def is_done(self, key) -> bool:
+        """Есть ли уже успешный результат для изображения"""
+        return str(key) in self._succeeded
+
+    def write(self, result: Dict) -> int:
+        """
+        Дописывает результат; сброс на диск по счетчику или по времени
+
+        Returns:
+            Смещение строки результата в файле
+        """
+        offset = self._offset
+        line = json.dumps(result, ensure_ascii=False, default=to_serializable).encode('utf-8') + b'\n'
+        self._file.write(line)
+        self._offset += len(line)
+        self._account(result)
+        self._pending += 1
+
+        if (self._pending >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+        return offset
+
+    def flush(self):
+        """Сброс результатов на диск и обновление сводки"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._write_summary()
+
+    @property
+    def summary(self) -> Dict:
+        """Текущая сводка пакета"""
+        successful = len(self._succeeded)
+        total = successful + len(self._failed)
+        return {
+            "timestamp": self.started,
+            "updated": datetime.now().isoformat(),
+            "results_path": str(self.results_path),
+            "total_files": total,
+            "successful": successful,
+            "failed": len(self._failed),
+            "success_rate": successful / total if total else 0,
+            "average_confidence": self._confidence_sum / successful if successful else 0,
+            "failed_files": sorted(self._failed)
+        }
+
+    def _write_summary(self):
+        """Атомарная запись сводки"""
+        tmp_path = self.summary_path.with_name(self.summary_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.summary, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.summary_path)
+
+    def close(self):
+        """Финальный сброс и закрытие файла"""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self) -> 'BatchResultWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,298 @@
+"""
+Векторизованные операции над прямоугольниками элементов
+
+Прямоугольники хранятся как массив numpy формы (N, 4) в формате
+[x1, y1, x2, y2]. Модуль используется всеми источниками элементов:
+агентом анализа, тайловым режимом, рендерером аннотаций и экспортерами
+датасета.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def to_boxes(elements: Sequence[Dict], key: str = 'bounds') -> np.ndarray:
+    """
+    Массив (N, 4) из списка элементов с вершинами [(x, y), ...]
+
+    Элементы без координат дают строку из нулей.
+    """
+    boxes = np.zeros((len(elements), 4), dtype=np.float32)
+    for i, element in enumerate(elements):
+        vertices = element.get(key)
+        if vertices:
+            points = np.asarray(vertices, dtype=np.float32).reshape(-1, 2)
+            boxes[i, :2] = points.min(axis=0)
+            boxes[i, 2:] = points.max(axis=0)
+    return boxes
+
+
+def box_to_bounds(box) -> List[tuple]:
+    """Прямоугольник [x1, y1, x2, y2] -> 4 вершины по часовой стрелке"""
+    x1, y1, x2, y2 = (int(round(float(v))) for v in box)
+    return [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+
+
+def areas(boxes: np.ndarray) -> np.ndarray:
+    """Площади прямоугольников"""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def intersection_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Площади попарных пересечений (N, M)"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    return np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Попарный IoU (N, M)"""
+    inter = intersection_matrix(a, b)
+    union = areas(a)[:, None] + areas(b)[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def containment_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Доля площади a[i], лежащая внутри b[j] (N, M)"""
+    inter = intersection_matrix(a, b)
+    area_a = areas(a)[:, None]
+    return np.divide(inter, area_a, out=np.zeros_like(inter), where=area_a > 0)
+
+
+def _class_labels(classes: Sequence) -> np.ndarray:
+    """Метки классов как массив, пригодный для сравнения и np.unique"""
+    labels = np.asarray(classes)
+    if labels.dtype.kind not in 'iub':
+        labels = labels.astype(object).astype(str)
+    return labels
+
+
+def _class_offsets(boxes: np.ndarray, classes: Optional[Sequence]) -> np.ndarray:
+    """
+    Разносит прямоугольники разных классов так, чтобы они не пересекались
+
+    Позволяет выполнить NMS по классам одним вызовом.
+    """
+    if classes is None or len(boxes) == 0:
+        return boxes
+    _, class_ids = np.unique(_class_labels(classes), return_inverse=True)
+    offset = float(boxes.max() - boxes.min()) + 1.0  # размах координат, в том числе отрицательных
+    return boxes + (class_ids.astype(np.float32) * offset)[:, None]
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float = 0.5,
+        classes: Optional[Sequence] = None) -> np.ndarray:
+    """
+    Жадный non-maximum suppression
+
+    Args:
+        boxes: (N, 4)
+        scores: (N,)
+        iou_threshold: Порог подавления
+        classes: Метки классов; подавление только внутри класса
+
+    Returns:
+        Индексы сохраненных прямоугольников в порядке убывания score
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    boxes = _class_offsets(np.asarray(boxes, dtype=np.float32), classes)
+    box_areas = areas(boxes)
+    order = np.argsort(-np.asarray(scores, dtype=np.float32), kind='stable')
+
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter = intersection_matrix(boxes[i:i + 1], boxes[rest])[0]
+        union = box_areas[i] + box_areas[rest] - inter
+        iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+        order = rest[iou <= iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+def soft_nms(boxes: np.ndarray, scores: np.ndarray, sigma: float = 0.5,
+             score_threshold: float = 0.001, iou_threshold: float = 0.3,
+             method: str = 'gaussian', classes: Optional[Sequence] = None):
+    """
+    Soft-NMS: вместо удаления перекрывающихся прямоугольников снижает их score
+
+    Args:
+        method: 'gaussian' или 'linear'
+
+    Returns:
+        (индексы, новые scores) для прямоугольников со score выше порога
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+    boxes = _class_offsets(np.asarray(boxes, dtype=np.float32), classes)
+    scores = np.asarray(scores, dtype=np.float32).copy()
+    remaining = np.arange(len(boxes))
+    keep, kept_scores = [], []
+
+    while remaining.size:
+        top = remaining[np.argmax(scores[remaining])]
+        if scores[top] < score_threshold:
+            break
+        keep.append(top)
+        kept_scores.append(scores[top])
+        remaining = remaining[remaining != top]
+        if not remaining.size:
+            break
+
+        iou = iou_matrix(boxes[top:top + 1], boxes[remaining])[0]
+        if method == 'linear':
+            decay = np.where(iou > iou_threshold, 1.0 - iou, 1.0)
+        else:
+            decay = np.exp(-(iou ** 2) / sigma)
+        scores[remaining] *= decay
+
+    return np.asarray(keep, dtype=np.int64), np.asarray(kept_scores, dtype=np.float32)
+
+
+def merge_contained(boxes: np.ndarray, scores: Optional[np.ndarray] = None,
+                    containment_threshold: float = 0.9, keep: str = 'outer',
+                    classes: Optional[Sequence] = None) -> np.ndarray:
+    """
+    Объединение по вложенности
+
+    Args:
+        keep: 'outer' - выбрасывать прямоугольники, лежащие внутри другого
+              (обрезанные дубликаты); 'inner' - выбрасывать контейнеры,
+              внутри которых лежат хотя бы два других (например, общий
+              текстовый блок Google Vision поверх отдельных слов)
+        classes: Учитывать вложенность только внутри одного класса
+
+    Returns:
+        Индексы сохраненных прямоугольников по возрастанию
+    """
+    n = len(boxes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    boxes = np.asarray(boxes, dtype=np.float32)
+    contained = containment_matrix(boxes, boxes) >= containment_threshold
+    np.fill_diagonal(contained, False)
+
+    if classes is not None:
+        labels = _class_labels(classes)
+        contained &= labels[:, None] == labels[None, :]
+
+    if keep == 'inner':
+        drop = contained.sum(axis=0) >= 2
+    else:
+        # Из двух почти одинаковых прямоугольников оставляем один: с большим score
+        if scores is None:
+            scores = areas(boxes)
+        scores = np.asarray(scores, dtype=np.float32)
+        mutual = contained & contained.T
+        loses_tie = (scores[:, None] < scores[None, :]) | \
+            ((scores[:, None] == scores[None, :]) & (np.arange(n)[:, None] > np.arange(n)[None, :]))
+        drop = (contained & ~mutual).any(axis=1) | (mutual & loses_tie).any(axis=1)
+
+    return np.flatnonzero(~drop)
+
+
+def group_words_into_lines(boxes: np.ndarray, min_vertical_overlap: float = 0.5,
+                           max_gap_ratio: float = 1.0) -> List[List[int]]:
+    """
+    Группирует слова в строки
+
+    Слова попадают в одну строку, если перекрываются по вертикали не
+    меньше чем на min_vertical_overlap от меньшей высоты и горизонтальный
+    зазор не больше max_gap_ratio высоты строки.
+
+    Returns:
+        Списки индексов слов, слева направо; строки сверху вниз
+    """
+    n = len(boxes)
+    if n == 0:
+        return []
+
+    boxes = np.asarray(boxes, dtype=np.float32)
+    heights = np.clip(boxes[:, 3] - boxes[:, 1], 1e-6, None)
+
+    overlap = np.clip(np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+                      - np.maximum(boxes[:, None, 1], boxes[None, :, 1]), 0, None)
+    same_row = overlap >= min_vertical_overlap * np.minimum(heights[:, None], heights[None, :])
+
+    gap = np.maximum(boxes[None, :, 0] - boxes[:, None, 2], boxes[:, None, 0] - boxes[None, :, 2])
+    close = gap <= max_gap_ratio * np.maximum(heights[:, None], heights[None, :])
+
+    adjacency = same_row & close
+
+    # Компоненты связности графа соседства
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in zip(*np.nonzero(np.triu(adjacency, k=1))):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[root_j] = root_i
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+
+    lines = [sorted(members, key=lambda k: boxes[k, 0]) for members in groups.values()]
+    lines.sort(key=lambda members: (boxes[members, 1].min(), boxes[members, 0].min()))
+    return lines
+
+
+def dedupe_elements(elements: List[Dict], iou_threshold: float = 0.5,
+                    containment_threshold: Optional[float] = None, keep: str = 'outer',
+                    class_key: Optional[str] = 'type') -> List[Dict]:
+    """
+    Удаление дубликатов в списке элементов-словарей
+
+    Сначала объединение по вложенности (если задан порог), затем NMS
+    по confidence. Порядок исходного списка сохраняется.
+    """
+    candidates = [e for e in elements if e.get('bounds')]
+    if len(candidates) < 2:
+        return candidates
+
+    boxes = to_boxes(candidates)
+    scores = np.asarray([e.get('confidence') or 0.0 for e in candidates], dtype=np.float32)
+    classes = [e.get(class_key) for e in candidates] if class_key else None
+
+    indices = np.arange(len(candidates))
+    if containment_threshold is not None:
+        indices = merge_contained(boxes, scores, containment_threshold, keep=keep, classes=classes)
+        boxes, scores = boxes[indices], scores[indices]
+        if classes is not None:
+            classes = [classes[i] for i in indices]
+
+    kept = nms(boxes, scores, iou_threshold, classes=classes)
+    return [candidates[i] for i in sorted(indices[kept])]
+
+
+def lines_from_words(text_elements: List[Dict], min_vertical_overlap: float = 0.5,
+                     max_gap_ratio: float = 1.0) -> List[Dict]:
+    """Объединяет текстовые элементы-слова в элементы-строки"""
+    if not text_elements:
+        return []
+
+    boxes = to_boxes(text_elements)
+    lines = []
+    for members in group_words_into_lines(boxes, min_vertical_overlap, max_gap_ratio):
+        line_box = np.concatenate([boxes[members, :2].min(axis=0), boxes[members, 2:].max(axis=0)])
+        confidences = [text_elements[i].get('confidence') or 0.0 for i in members]
+        lines.append({
+            'text': ' '.join(text_elements[i].get('text', '') for i in members),
+            'bounds': box_to_bounds(line_box),
+            'confidence': float(np.mean(confidences)),
+            'word_indices': members
+        })
+    return lines
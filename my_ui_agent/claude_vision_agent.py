@@ -1,15 +1,20 @@
 import asyncio
 import base64
+import io
 import json
 import logging
+import mimetypes
 from typing import Dict, List, Optional, Union
 from pathlib import Path
 
-try:
-    from anthropic import Anthropic
-    ANTHROPIC_AVAILABLE = True
-except ImportError:
-    ANTHROPIC_AVAILABLE = False
+from PIL import Image
+
+from lazy_imports import module_available, import_optional
+from image_renditions import get_rendition
+
+# Сам anthropic импортируется только при создании агента
+ANTHROPIC_AVAILABLE = module_available('anthropic')
+if not ANTHROPIC_AVAILABLE:
     logging.warning("Anthropic не установлен. Claude Vision будет недоступен.")
 
 class ClaudeVisionAgent:
@@ -20,7 +25,9 @@ class ClaudeVisionAgent:
         if not api_key:
             raise ValueError("API ключ Anthropic обязателен")
         
-        self.client = Anthropic(api_key=api_key)
+        anthropic = import_optional('anthropic')
+        # Асинхронный клиент: ожидание ответа не блокирует цикл событий
+        self.client = anthropic.AsyncAnthropic(api_key=api_key)
         logging.info("ClaudeVisionAgent инициализирован")
     
     def encode_image(self, image_path: str) -> str:
@@ -32,12 +39,29 @@ class ClaudeVisionAgent:
             logging.error(f"Ошибка кодирования изображения {image_path}: {str(e)}")
             raise
     
+    def _prepare_image_source(self, image_path: str) -> Dict:
+        """Блок изображения для запроса: копия размера для анализа из кэша копий"""
+        try:
+            path = get_rendition(image_path, 'analysis')
+        except OSError as e:
+            logging.warning(f"Кэш копий недоступен, отправляется оригинал: {e}")
+            path = Path(image_path)
+        return {
+            "type": "base64",
+            "media_type": mimetypes.guess_type(str(path))[0] or "image/jpeg",
+            "data": self.encode_image(str(path))
+        }
+    
+    async def image_source(self, image_path: str) -> Dict:
+        """Подготовка изображения в потоке, не блокируя цикл событий"""
+        return await asyncio.to_thread(self._prepare_image_source, image_path)
+    
     async def analyze_image(self, image_path: str, prompt: str = "Describe this image") -> str:
         """Анализ изображения через Claude Vision"""
         try:
-            image_data = self.encode_image(image_path)
+            image_source = await self.image_source(image_path)
             
-            response = self.client.messages.create(
+            response = await self.client.messages.create(
                 model="claude-3-5-sonnet-20241022",
                 max_tokens=1000,
                 messages=[
@@ -46,11 +70,7 @@ class ClaudeVisionAgent:
                         "content": [
                             {
                                 "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": "image/jpeg",
-                                    "data": image_data
-                                }
+                                "source": image_source
                             },
                             {
                                 "type": "text",
@@ -65,6 +85,36 @@ class ClaudeVisionAgent:
             logging.error(f"Ошибка анализа через Claude: {str(e)}")
             return f"Claude analysis error: {str(e)}"
     
+    @staticmethod
+    def _pil_image_source(image: Image.Image) -> Dict:
+        """Блок изображения из PIL (вырезки, листы): PNG без записи на диск"""
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return {
+            "type": "base64",
+            "media_type": "image/png",
+            "data": base64.b64encode(buffer.getvalue()).decode('utf-8')
+        }
+    
+    async def analyze_images(self, images: List[Image.Image], prompt: str, max_tokens: int = 1000) -> str:
+        """
+        Несколько изображений PIL и промпт одним запросом
+
+        В отличие от analyze_ui_* ошибки API (429, сеть) не превращаются в
+        текст ответа, а пробрасываются: вызывающий (roi_analysis) отличает
+        сбой запроса от ответа без тегов.
+        """
+        sources = await asyncio.to_thread(lambda: [self._pil_image_source(image) for image in images])
+        content = [{"type": "image", "source": source} for source in sources]
+        content.append({"type": "text", "text": prompt})
+        
+        response = await self.client.messages.create(
+            model="claude-3-5-sonnet-20241022",
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": content}]
+        )
+        return response.content[0].text
+    
     async def analyze_ui_comprehensive(self, image_path: str, ui_taxonomy: List[str], gaming_tags: List[str]) -> str:
         """Комплексный анализ UI элементов"""
         prompt = f"""
@@ -148,15 +198,11 @@ class ClaudeVisionAgent:
             content = []
             
             # Добавляем изображения
-            for i, image_path in enumerate(image_paths):
-                image_data = self.encode_image(image_path)
+            sources = await asyncio.gather(*(self.image_source(path) for path in image_paths))
+            for image_source in sources:
                 content.append({
                     "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/jpeg",
-                        "data": image_data
-                    }
+                    "source": image_source
                 })
             
             # Добавляем текстовый промпт
@@ -175,7 +221,7 @@ class ClaudeVisionAgent:
 """
             })
             
-            response = self.client.messages.create(
+            response = await self.client.messages.create(
                 model="claude-3-5-sonnet-20241022",
                 max_tokens=1500,
                 messages=[{"role": "user", "content": content}]
@@ -0,0 +1,360 @@
+"""
+Колоночный экспорт обучающего датасета в Parquet / Arrow IPC
+
+Разворачивает записи training_dataset/entry_* в три таблицы:
+    images   - одна строка на изображение
+    elements - одна строка на bbox с тегом и категорией таксономии
+    feedback - комментарии пользователя к записи и заметки к элементам
+
+Каждая таблица хранится как папка с part-файлами, поэтому обновление
+дописывает только новые записи. Чтение идет через memory map с
+фильтрами, которые проталкиваются в Parquet (статистика row groups).
+"""
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+    logging.warning("pyarrow не установлен. Колоночный экспорт недоступен.")
+
+from config import Config, DATASET_SETTINGS
+from dataset_entries import (
+    iter_entry_dirs, load_entry, entry_image_size, entry_elements
+)
+
+TABLES = ('images', 'elements', 'feedback')
+MANIFEST_FILENAME = '_manifest.json'
+FORMAT_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+if HAS_PYARROW:
+    SCHEMAS = {
+        'images': pa.schema([
+            ('entry_id', pa.string()),
+            ('image_filename', pa.string()),
+            ('width', pa.int32()),
+            ('height', pa.int32()),
+            ('analysis_timestamp', pa.string()),
+            ('annotation_timestamp', pa.string()),
+            ('taxonomy_version', pa.string()),
+            ('num_elements', pa.int32()),
+            ('num_labeled', pa.int32()),
+        ]),
+        'elements': pa.schema([
+            ('entry_id', pa.string()),
+            ('element_id', pa.string()),
+            ('source', pa.string()),
+            ('x1', pa.float32()),
+            ('y1', pa.float32()),
+            ('x2', pa.float32()),
+            ('y2', pa.float32()),
+            ('width', pa.float32()),
+            ('height', pa.float32()),
+            ('area', pa.float32()),
+            ('tag', pa.string()),
+            ('category', pa.string()),
+            ('labels', pa.list_(pa.string())),
+            ('predicted_type', pa.string()),
+            ('text', pa.string()),
+            ('confidence', pa.float32()),
+            ('annotation_confidence', pa.float32()),
+            ('verified', pa.bool_()),
+        ]),
+        'feedback': pa.schema([
+            ('entry_id', pa.string()),
+            ('element_id', pa.string()),
+            ('annotation_timestamp', pa.string()),
+            ('text', pa.string()),
+        ]),
+    }
+
+
+def flatten_entry(entry_id: str, data: Dict, image_size=None) -> Dict[str, List[Dict]]:
+    """Разворачивает одну запись датасета в строки трех таблиц"""
+    elements = entry_elements(data)
+    width, height = image_size or (None, None)
+    annotation_timestamp = data.get('annotation_timestamp')
+
+    rows = {
+        'images': [{
+            'entry_id': entry_id,
+            'image_filename': data.get('image_filename'),
+            'width': width,
+            'height': height,
+            'analysis_timestamp': data.get('analysis_timestamp'),
+            'annotation_timestamp': annotation_timestamp,
+            'taxonomy_version': data.get('taxonomy_version'),
+            'num_elements': len(elements),
+            'num_labeled': sum(1 for e in elements if e['verified']),
+        }],
+        'elements': [],
+        'feedback': [],
+    }
+
+    for element in elements:
+        x1, y1, x2, y2 = element['bbox']
+        rows['elements'].append({
+            'entry_id': entry_id,
+            'element_id': element['element_id'],
+            'source': element['source'],
+            'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2,
+            'width': x2 - x1,
+            'height': y2 - y1,
+            'area': (x2 - x1) * (y2 - y1),
+            'tag': element['tag'],
+            'category': element['category'],
+            'labels': element['labels'],
+            'predicted_type': element['predicted_type'],
+            'text': element['text'],
+            'confidence': element['confidence'],
+            'annotation_confidence': element['annotation_confidence'],
+            'verified': element['verified'],
+        })
+        if element['notes']:
+            rows['feedback'].append({
+                'entry_id': entry_id,
+                'element_id': element['element_id'],
+                'annotation_timestamp': annotation_timestamp,
+                'text': element['notes'],
+            })
+
+    if data.get('user_feedback'):
+        rows['feedback'].append({
+            'entry_id': entry_id,
+            'element_id': None,
+            'annotation_timestamp': annotation_timestamp,
+            'text': data['user_feedback'],
+        })
+
+    return rows
+
+
+class ColumnarDatasetExporter:
+    """Экспорт и инкрементальное обновление колоночной копии датасета"""
+
+    def __init__(self, dataset_dir=None, output_dir=None, file_format: str = 'parquet'):
+        if not HAS_PYARROW:
+            raise ImportError("pyarrow не установлен. Установите: pip install pyarrow")
+        if file_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Неизвестный формат: {file_format}")
+
+        self.dataset_dir = Path(dataset_dir or Config.DATASET_FOLDER)
+        self.output_dir = Path(output_dir or DATASET_SETTINGS['columnar_dir'])
+        self.file_format = file_format
+        self.manifest_path = self.output_dir / MANIFEST_FILENAME
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self) -> Dict:
+        """Загружает манифест уже экспортированных записей"""
+        if self.manifest_path.exists():
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('format') != self.file_format:
+                raise ValueError(
+                    f"Папка {self.output_dir} содержит формат {manifest.get('format')}, "
+                    f"а запрошен {self.file_format}"
+                )
+            return manifest
+        return {'format': self.file_format, 'next_part': 0, 'entries': {}}
+
+    def _save_manifest(self):
+        """Атомарно сохраняет манифест"""
+        self.manifest['updated'] = datetime.now().isoformat()
+        tmp_path = self.manifest_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def export(self) -> Dict[str, int]:
+        """Полный экспорт: старые part-файлы удаляются"""
+        for table in TABLES:
+            table_dir = self.output_dir / table
+            if table_dir.exists():
+                for part in table_dir.iterdir():
+                    part.unlink()
+        self.manifest = {'format': self.file_format, 'next_part': 0, 'entries': {}}
+        return self.update()
+
+    def update(self) -> Dict[str, int]:
+        """
+        Инкрементальное обновление
+
+        Новые записи дописываются отдельным part-файлом; измененные и
+        удаленные записи вычищаются из part-файлов, где они лежали.
+
+        Returns:
+            Статистика: added / changed / removed / unchanged
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        known = self.manifest['entries']
+
+        current = {}
+        for entry_dir in iter_entry_dirs(self.dataset_dir):
+            current[entry_dir.name] = (entry_dir, (entry_dir / 'data.json').stat().st_mtime_ns)
+
+        added = [e for e in current if e not in known]
+        changed = [e for e in current if e in known and known[e]['mtime_ns'] != current[e][1]]
+        removed = [e for e in known if e not in current]
+
+        stale = changed + removed
+        if stale:
+            self._drop_entries(stale)
+            for entry_id in removed:
+                del known[entry_id]
+
+        to_write = added + changed
+        if to_write:
+            rows = {table: [] for table in TABLES}
+            written = []
+            for entry_id in to_write:
+                entry_dir, mtime_ns = current[entry_id]
+                data = load_entry(entry_dir)
+                if data is None:
+                    known.pop(entry_id, None)
+                    continue
+                entry_rows = flatten_entry(entry_id, data, entry_image_size(entry_dir, data))
+                for table in TABLES:
+                    rows[table].extend(entry_rows[table])
+                written.append((entry_id, mtime_ns))
+
+            part_name = self._write_part(rows)
+            for entry_id, mtime_ns in written:
+                known[entry_id] = {'mtime_ns': mtime_ns, 'part': part_name}
+
+        self._save_manifest()
+
+        stats = {
+            'added': len(added),
+            'changed': len(changed),
+            'removed': len(removed),
+            'unchanged': len(current) - len(added) - len(changed)
+        }
+        logging.info(f"📦 Колоночный датасет обновлен: {stats}")
+        return stats
+
+    def _write_part(self, rows: Dict[str, List[Dict]]) -> str:
+        """Записывает новый part-файл для каждой таблицы"""
+        part_name = f"part-{self.manifest['next_part']:05d}{FORMAT_EXTENSIONS[self.file_format]}"
+        self.manifest['next_part'] += 1
+
+        # Сортировка по тегу делает статистику row groups полезной для фильтров
+        rows['elements'].sort(key=lambda r: (r['category'] or '', r['tag'] or ''))
+
+        for table in TABLES:
+            table_dir = self.output_dir / table
+            table_dir.mkdir(exist_ok=True)
+            arrow_table = pa.Table.from_pylist(rows[table], schema=SCHEMAS[table])
+            self._write_table(arrow_table, table_dir / part_name)
+
+        return part_name
+
+    def _write_table(self, table, path: Path):
+        """Запись таблицы в выбранном формате"""
+        if self.file_format == 'parquet':
+            pq.write_table(table, path, compression='zstd', row_group_size=64 * 1024)
+        else:
+            with pa.OSFile(str(path), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+    def _read_part(self, path: Path):
+        """Чтение одного part-файла"""
+        if self.file_format == 'parquet':
+            return pq.read_table(path, memory_map=True)
+        with pa.memory_map(str(path), 'r') as source:
+            return pa.ipc.open_file(source).read_all()
+
+    def _drop_entries(self, entry_ids: List[str]):
+        """Удаляет строки записей из part-файлов, где они хранятся"""
+        parts = {self.manifest['entries'][e]['part'] for e in entry_ids}
+        drop = pa.array(entry_ids, pa.string())
+
+        for part_name in parts:
+            for table in TABLES:
+                path = self.output_dir / table / part_name
+                if not path.exists():
+                    continue
+                table_data = self._read_part(path)
+                mask = pc.invert(pc.is_in(table_data['entry_id'], value_set=drop))
+                kept = table_data.filter(mask)
+                if kept.num_rows:
+                    tmp_path = path.with_name(path.name + '.tmp')
+                    self._write_table(kept, tmp_path)
+                    os.replace(tmp_path, path)
+                else:
+                    path.unlink()
+
+    def compact(self):
+        """Сливает все part-файлы каждой таблицы в один"""
+        part_name = f"part-{self.manifest['next_part']:05d}{FORMAT_EXTENSIONS[self.file_format]}"
+        self.manifest['next_part'] += 1
+
+        for table in TABLES:
+            table_dir = self.output_dir / table
+            if not table_dir.exists():
+                continue
+            old_parts = sorted(table_dir.iterdir())
+            merged = read_table(self.output_dir, table)
+            self._write_table(merged, table_dir / part_name)
+            for part in old_parts:
+                part.unlink()
+
+        for entry in self.manifest['entries'].values():
+            entry['part'] = part_name
+        self._save_manifest()
+
+
+def read_table(output_dir=None, table: str = 'elements', columns: Optional[List[str]] = None,
+               filters=None):
+    """
+    Чтение таблицы колоночного датасета
+
+    Args:
+        output_dir: Папка экспорта
+        table: images / elements / feedback
+        columns: Список нужных колонок (остальные не читаются)
+        filters: Фильтр в формате pyarrow, например [('tag', '=', 'button')]
+                 или pyarrow.compute.Expression
+
+    Returns:
+        pyarrow.Table
+    """
+    if not HAS_PYARROW:
+        raise ImportError("pyarrow не установлен. Установите: pip install pyarrow")
+    if table not in TABLES:
+        raise ValueError(f"Неизвестная таблица: {table}")
+
+    output_dir = Path(output_dir or DATASET_SETTINGS['columnar_dir'])
+    manifest_path = output_dir / MANIFEST_FILENAME
+    file_format = 'parquet'
+    if manifest_path.exists():
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            file_format = json.load(f).get('format', 'parquet')
+
+    table_dir = output_dir / table
+    if not table_dir.exists() or not any(table_dir.iterdir()):
+        return SCHEMAS[table].empty_table()
+
+    if file_format == 'parquet':
+        return pq.read_table(table_dir, columns=columns, filters=filters, memory_map=True)
+
+    if filters is not None and not isinstance(filters, ds.Expression):
+        filters = pq.filters_to_expression(filters)
+    dataset = ds.dataset(table_dir, format='ipc')
+    return dataset.to_table(columns=columns, filter=filters)
+
+
+if __name__ == "__main__":
+    file_format = sys.argv[1] if len(sys.argv) > 1 else 'parquet'
+    exporter = ColumnarDatasetExporter(file_format=file_format)
+    print(exporter.update())
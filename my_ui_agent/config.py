@@ -13,7 +13,7 @@ class Config:
     UPLOAD_FOLDER = BASE_DIR / 'uploads'
     TRAINING_DATASET_FOLDER = BASE_DIR / 'training_dataset'
     LEARNING_DATA_FOLDER = BASE_DIR / 'learning_data'
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file upload
+    MAX_CONTENT_LENGTH = 64 * 1024 * 1024  # 64MB: full-page and 4K captures are analyzed in tiles
     
     # Create directories if they don't exist
     UPLOAD_FOLDER.mkdir(exist_ok=True)
@@ -26,15 +26,6 @@ GOOGLE_CLOUD_CONFIG = {
     'project_id': os.environ.get('GOOGLE_CLOUD_PROJECT', 'gdd-suite')
 }
 
-# Analysis settings
-ANALYSIS_SETTINGS = {
-    'confidence_threshold': 0.7,
-    'max_results': 50,
-    'enable_text_detection': True,
-    'enable_object_detection': True,
-    'enable_face_detection': False
-}
-
 # Конфигурация Flask приложения
 import os
 from pathlib import Path
@@ -47,11 +38,15 @@ class Config:
     BASE_DIR = Path(__file__).parent
     UPLOAD_FOLDER = BASE_DIR / 'uploads'
     DATASET_FOLDER = BASE_DIR / 'training_dataset'
+    RENDITIONS_FOLDER = BASE_DIR / 'renditions'  # уменьшенные копии по хешу содержимого
+    MODELS_FOLDER = BASE_DIR / 'models'  # версии локальной модели элементов
     STATIC_FOLDER = BASE_DIR / 'static'
     TEMPLATE_FOLDER = BASE_DIR / 'templates'
     
     # Ограничения загрузки
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    # 64MB: полностраничные и 4K скриншоты анализируются тайлами; размер
+    # декодированного изображения ограничивает PIL (Image.MAX_IMAGE_PIXELS)
+    MAX_CONTENT_LENGTH = 64 * 1024 * 1024
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'}
     
     # Google Cloud Vision API
@@ -100,22 +95,164 @@ def get_config():
 
 # UI Analysis Settings
 ANALYSIS_SETTINGS = {
+    # Google Vision: функции одного запроса annotate (vision_batch_client)
+    'confidence_threshold': 0.7,
+    'max_results': 50,
+    'enable_text_detection': True,
+    'enable_object_detection': True,
+    'enable_face_detection': False,
+    'vision_batch_size': 16,               # изображений в запросе (предел API - 16)
+    'vision_batch_max_bytes': 8 * 1024 * 1024,  # байт изображений на запрос (предел запроса API - 10 МБ)
     'min_element_area': 100,
     'max_element_area': 50000,
     'button_aspect_ratio_range': (0.3, 5.0),
     'input_field_aspect_ratio_min': 2.0,
     'icon_area_threshold': 10000,
-    'default_text_confidence': 0.8
+    'input_field_max_luma_std': 0.08,
+    'default_text_confidence': 0.8,
+    # Классификация элементов по признакам (element_classifier)
+    'classify_elements': True,
+    'classifier_feature_side': 512,
+    # Удаление дубликатов (box_ops)
+    'nms_iou_threshold': 0.5,
+    'containment_threshold': 0.9,
+    # Тайловый анализ больших скриншотов
+    'tile_size': 1024,
+    'tile_auto_min_side': 2048,  # длинная сторона больше - тайловый режим включается сам
+    'tile_overlap': 128,
+    'tile_workers': 4,
+    'tile_merge_iou': 0.5
+}
+
+# Локальное распознавание текста (local_ocr)
+OCR_SETTINGS = {
+    'backend': 'auto',              # google / local / auto (Google при наличии клиента, иначе local)
+    'restrict_to_detections': False,  # local: искать текст только в рамках детектора
+    'tesseract_cmd': 'tesseract',
+    'languages': 'eng+rus',
+    'page_psm': 11,                 # разреженный текст: подписи разбросаны по экрану
+    'region_psm': 6,                # полоса областей - один блок текста
+    'min_confidence': 0.4,
+    'region_padding': 4,
+    'strip_gap': 16,
+    'min_text_height': 32,
+    'max_region_upscale': 4.0,
+    'max_strip_height': 4000,
+    'workers': 4
 }
 
 # Dataset settings
 DATASET_SETTINGS = {
     'output_dir': 'training_dataset',
     'learning_data_dir': 'learning_data',
-    'annotation_formats': ['yolo', 'coco', 'json'],
+    'annotation_formats': ['yolo', 'coco', 'voc', 'json'],
+    'columnar_dir': 'training_dataset_columnar',
+    'export_dir': 'training_export',
+    'split_ratios': (0.8, 0.1, 0.1),
+    'shards_dir': 'training_shards',
+    'shard_max_bytes': 256 * 1024 * 1024,
+    'shard_max_samples': 10000,
     'backup_original_images': True
 }
 
+# Локальная модель элементов (local_vision_agent)
+LOCAL_MODEL_SETTINGS = {
+    'model_name': 'element_classifier',
+    'holdout_ratio': 0.2,         # доля элементов для оценки точности версии
+    'min_samples': 20,            # меньше проверенных элементов - обучение не запускается
+    'keep_versions': 5,           # старые версии удаляются
+    'min_confidence': 0.8,        # ниже - гибридный агент передает изображение дальше
+    'min_accuracy': 0.0           # версия с меньшей точностью не становится текущей
+}
+
+# Анализ по областям интереса (roi_analysis): Claude/Phi получают только вырезки
+ROI_SETTINGS = {
+    'backend': 'auto',            # claude / phi / auto (Claude, если доступен)
+    'max_regions': 200,           # областей с одного скриншота
+    'min_region_side': 8,         # меньшие рамки детектора отбрасываются
+    'crop_padding': 4,            # поля вокруг рамки в пикселях
+    'crop_max_side': 256,         # большие вырезки уменьшаются до этой стороны
+    'packing': 'contact_sheet',   # contact_sheet - вырезки на пронумерованных листах / crops - отдельными изображениями
+    'crops_per_request': 20,      # вырезок в одном запросе к бэкенду (packing='crops')
+    'sheet_width': 1536,          # лист вырезок (contact_sheet)
+    'sheet_max_height': 1536,
+    'max_cells_per_sheet': 60,
+    'cell_gap': 8,
+    'cell_label_height': 20,      # полоса с номером над вырезкой
+    'sheet_background': '#808080',
+    'concurrent_requests': 4,     # одновременных запросов к Claude
+    'max_tokens': 200,            # ответа на запрос: max_tokens + tokens_per_label на вырезку,
+    'tokens_per_label': 24,       # чтобы JSON-ответ на полный лист не обрывался
+    'skip_confident_local': True  # уверенно размеченные локальной моделью области не отправляются
+}
+
+# Сериализация результатов анализа (result_io)
+SERIALIZATION_SETTINGS = {
+    # По умолчанию читаемый .json, как раньше; msgpack / cbor и сжатие включаются явно
+    'format': 'json',          # json / msgpack / cbor
+    'compression': None,       # None / gzip / zstd
+    'gzip_level': 6,
+    'zstd_level': 3
+}
+
+# Массовый анализ: запись результатов и манифест пакета
+BATCH_SETTINGS = {
+    'flush_every': 10,             # сброс JSONL на диск каждые N результатов
+    'flush_interval': 5.0,         # ... или раз в столько секунд
+    'max_attempts': 3,             # попыток на изображение (в сумме по всем запускам)
+    'retry_base_delay': 1.0,       # пауза перед повтором, сек
+    'retry_backoff': 2.0,          # множитель паузы для каждой следующей попытки
+    'retry_max_delay': 60.0,
+    'manifest_save_every': 10,
+    'watch_debounce': 2.0,         # файл считается дописанным, если не менялся столько секунд
+    'watch_poll_interval': 2.0     # период опроса папки, если inotify недоступен
+}
+
+# Production-сервер веб-приложения (run_web_app.py --production)
+SERVER_SETTINGS = {
+    'host': '0.0.0.0',
+    'port': 5000,
+    'workers': None,            # None - по числу ядер
+    'threads': 4,               # потоков на воркер (ожидание внешних API)
+    'timeout': 120,             # анализ больших скриншотов может быть долгим
+    'graceful_timeout': 30,
+    'max_requests': 1000,       # перезапуск воркера ограничивает рост памяти
+    'max_requests_jitter': 100,
+    # ASGI-режим (asgi_app.py)
+    'max_concurrent_analyses': 64,  # одновременных анализов на процесс
+    'async_backend_threads': 32     # потоки для синхронных клиентов (Google Vision, Phi)
+}
+
+# Отдача изображений: уменьшенные копии и HTTP-кэширование
+IMAGE_SERVING_SETTINGS = {
+    # Пирамида копий: имя -> максимальная сторона (px), формат и качество
+    'renditions': {
+        'preview': {'max_side': 1600},                                  # страница аннотации
+        'analysis': {'max_side': 1568, 'format': 'JPEG', 'quality': 90},  # Claude: длинная сторона до 1568
+        'thumb': {'max_side': 320},                                     # карточки dataset.html
+        'colors': {'max_side': 100, 'format': 'PNG'}                    # без потерь для подсчета цветов
+    },
+    'rendition_format': 'WEBP',
+    'rendition_quality': 85,
+    'pyramid_workers': 2,       # фоновые потоки создания копий
+    'immutable_max_age': 365 * 24 * 3600  # адреса по хешу содержимого не меняются
+}
+
+# Отрисовка размеченных изображений (annotation_renderer.py)
+RENDER_SETTINGS = {
+    'scale': 1.0,               # масштаб выходного изображения
+    'format': None,             # None - по расширению выходного файла
+    'font_size': 12,
+    'min_font_size': 8,         # подписи остаются читаемыми при уменьшении
+    'text_line_width': 2,
+    'ui_line_width': 3,
+    'draw_labels': True,
+    'jpeg_quality': 85,
+    'png_compress_level': 3,    # 9 сжимает лишь немного лучше, но в разы медленнее
+    'webp_quality': 80,
+    'workers': None             # процессов для пакетной отрисовки; None - по числу ядер
+}
+
 # UI Keywords for classification
 UI_KEYWORDS = {
     'action_buttons': ['start', 'play', 'begin', 'continue', 'resume', 'go', 'launch'],
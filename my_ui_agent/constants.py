@@ -40,7 +40,7 @@ MOBILE_GAMING_UI_TAXONOMY = {
 # Конфигурация анализа
 ANALYSIS_CONFIG = {
     "supported_formats": ["png", "jpg", "jpeg", "gif", "bmp", "webp"],
-    "max_file_size": 16 * 1024 * 1024,  # 16MB
+    "max_file_size": 64 * 1024 * 1024,  # 64MB (Config.MAX_CONTENT_LENGTH)
     "confidence_threshold": 0.5,
     "min_element_size": 10,  # минимальный размер элемента интерфейса в пикселях
 }
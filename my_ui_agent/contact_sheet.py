@@ -0,0 +1,129 @@
+"""
+Листы вырезок: много мелких элементов в одном запросе к Claude/Phi
+
+Вырезки элементов (с одного или нескольких скриншотов) укладываются
+полками (shelf packing, First-Fit Decreasing Height) на листы не больше
+sheet_width x sheet_max_height; над каждой вырезкой - полоса с ее
+номером. Номера идут по листу слева направо, сверху вниз. Лист
+отправляется одним изображением, бэкенд отвечает тегом на номер
+ячейки, а ячейка хранит индекс исходной вырезки - теги возвращаются к
+элементам без поиска по координатам.
+
+Лист 1536 x 1536 вмещает десятки кнопок и иконок, поэтому сотни
+элементов размечаются за несколько запросов вместо сотен.
+"""
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from PIL import Image, ImageDraw
+
+from annotation_renderer import get_font
+from config import ROI_SETTINGS
+from constants import ALL_UI_TAGS
+
+
+class SheetCell(NamedTuple):
+    """Ячейка листа: номер на листе, индекс вырезки и рамка вырезки на листе"""
+    number: int
+    item: int
+    box: Tuple[int, int, int, int]
+
+
+class ContactSheet(NamedTuple):
+    image: Image.Image
+    cells: List[SheetCell]
+
+
+def _fit_width(crop: Image.Image, max_width: int) -> Image.Image:
+    if crop.width <= max_width:
+        return crop
+    return crop.resize((max_width, max(1, round(crop.height * max_width / crop.width))), Image.LANCZOS)
+
+
+def pack_shelves(sizes: Sequence[Tuple[int, int]], width: int, max_height: int, gap: int,
+                 max_cells: Optional[int] = None) -> List[List[Tuple[int, int, int]]]:
+    """
+    Раскладка прямоугольников по листам полками
+
+    Прямоугольники берутся по убыванию высоты; каждый кладется на первую
+    полку текущего листа, где хватает места по ширине, иначе открывается
+    новая полка, а если она не помещается по высоте (или на листе уже
+    max_cells ячеек) - новый лист.
+
+    Args:
+        sizes: (ширина, высота) каждого прямоугольника, ширина не больше width - 2 * gap
+        width, max_height: Размер листа
+        gap: Отступ между прямоугольниками и от краев листа
+
+    Returns:
+        По листу список (индекс прямоугольника, x, y)
+    """
+    order = sorted(range(len(sizes)), key=lambda i: (-sizes[i][1], -sizes[i][0]))
+    sheets: List[List[Tuple[int, int, int]]] = []
+    shelves: List[List[int]] = []  # полки текущего листа: [y, высота, занятая ширина]
+    for i in order:
+        w, h = sizes[i]
+        if not sheets or (max_cells and len(sheets[-1]) >= max_cells):
+            sheets.append([])
+            shelves = []
+        shelf = next((s for s in shelves if s[2] + w + gap <= width and h <= s[1]), None)
+        if shelf is None:
+            y = shelves[-1][0] + shelves[-1][1] + gap if shelves else gap
+            if shelves and y + h + gap > max_height:
+                sheets.append([])
+                shelves, y = [], gap
+            shelf = [y, h, gap]
+            shelves.append(shelf)
+        sheets[-1].append((i, shelf[2], shelf[0]))
+        shelf[2] += w + gap
+    return sheets
+
+
+def build_sheets(crops: Sequence[Image.Image], settings: Optional[Dict] = None) -> List[ContactSheet]:
+    """
+    Листы с пронумерованными ячейками
+
+    Returns:
+        Листы; SheetCell.item - индекс вырезки в crops
+    """
+    settings = settings or ROI_SETTINGS
+    width = settings['sheet_width']
+    gap = settings['cell_gap']
+    label_height = settings['cell_label_height']
+    font = get_font(max(8, label_height - 6))
+
+    crops = [_fit_width(crop.convert('RGB'), width - 2 * gap) for crop in crops]
+    # Ячейка = полоса номера над вырезкой; номер не уже трех цифр
+    min_label_width = round(label_height * 1.6)
+    sizes = [(max(crop.width, min_label_width), crop.height + label_height) for crop in crops]
+    layout = pack_shelves(sizes, width, settings['sheet_max_height'], gap, settings['max_cells_per_sheet'])
+
+    sheets = []
+    for placements in layout:
+        placements = sorted(placements, key=lambda p: (p[2], p[1]))  # порядок чтения
+        height = max(y + sizes[i][1] for i, _, y in placements) + gap
+        sheet = Image.new('RGB', (width, height), settings['sheet_background'])
+        draw = ImageDraw.Draw(sheet)
+        cells = []
+        for number, (i, x, y) in enumerate(placements, start=1):
+            crop = crops[i]
+            cell_width = sizes[i][0]
+            draw.rectangle((x, y, x + cell_width - 1, y + label_height - 1), fill=(0, 0, 0))
+            draw.text((x + 3, y + 2), str(number), fill=(255, 255, 255), font=font)
+            sheet.paste(crop, (x, y + label_height))
+            draw.rectangle((x, y, x + cell_width - 1, y + sizes[i][1] - 1), outline=(0, 0, 0))
+            cells.append(SheetCell(number, i, (x, y + label_height, x + crop.width, y + label_height + crop.height)))
+        sheets.append(ContactSheet(sheet, cells))
+    return sheets
+
+
+def sheet_prompt(count: int, tags: Sequence[str] = ALL_UI_TAGS) -> str:
+    """Промпт разметки ячеек листа"""
+    return f"""
+Изображение - лист из {count} вырезок элементов интерфейса мобильной игры.
+Номер каждой вырезки (от 1 до {count}) написан белым на черной полосе над ней.
+Каждому номеру поставь ровно один тег из списка:
+{', '.join(tags)}
+
+Ответь только JSON без пояснений:
+[{{"index": 1, "tag": "button"}}, ...]
+"""
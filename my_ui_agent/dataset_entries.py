@@ -0,0 +1,166 @@
+"""
+Чтение записей обучающего датасета (training_dataset/entry_*)
+
+Общий слой для экспортеров: обход папок entry_*, загрузка data.json,
+приведение координат элементов к единому виду [x1, y1, x2, y2] и
+сопоставление элементов с пользовательскими аннотациями.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+from config import Config
+from constants import MOBILE_GAMING_UI_TAXONOMY
+
+ENTRY_PREFIX = 'entry_'
+DATA_FILENAME = 'data.json'
+
+# Тег -> категория таксономии
+TAG_TO_CATEGORY = {
+    tag: category
+    for category, tags in MOBILE_GAMING_UI_TAXONOMY.items()
+    for tag in tags
+}
+
+
+def iter_entry_dirs(dataset_dir=None) -> Iterator[Path]:
+    """Перебирает папки entry_* с файлом data.json в стабильном порядке"""
+    dataset_dir = Path(dataset_dir or Config.DATASET_FOLDER)
+    if not dataset_dir.exists():
+        return
+
+    for entry_dir in sorted(dataset_dir.iterdir()):
+        if (entry_dir.is_dir() and entry_dir.name.startswith(ENTRY_PREFIX)
+                and (entry_dir / DATA_FILENAME).exists()):
+            yield entry_dir
+
+
+def load_entry(entry_dir: Path) -> Optional[Dict]:
+    """Загружает data.json записи; поврежденные записи пропускаются"""
+    try:
+        with open(Path(entry_dir) / DATA_FILENAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Пропущена поврежденная запись {entry_dir}: {e}")
+        return None
+
+
+def entry_image_path(entry_dir: Path, data: Dict) -> Optional[Path]:
+    """Путь к изображению записи"""
+    filename = data.get('image_filename')
+    if not filename:
+        return None
+    image_path = Path(entry_dir) / filename
+    return image_path if image_path.exists() else None
+
+
+def entry_image_size(entry_dir: Path, data: Dict) -> Optional[Tuple[int, int]]:
+    """
+    Размер изображения записи без декодирования пикселей
+
+    Сначала берется из сохраненных метаданных анализа, затем из заголовка
+    файла (PIL читает только заголовок до обращения к пикселям).
+    """
+    metadata = (data.get('vision_api_results') or {}).get('metadata') or {}
+    width, height = metadata.get('width'), metadata.get('height')
+    if width and height:
+        return int(width), int(height)
+
+    image_path = entry_image_path(entry_dir, data)
+    if image_path is None:
+        return None
+    try:
+        with Image.open(image_path) as img:
+            return img.size
+    except OSError as e:
+        logging.warning(f"Не удалось прочитать заголовок {image_path}: {e}")
+        return None
+
+
+def bounds_to_bbox(bounds) -> Optional[Tuple[float, float, float, float]]:
+    """
+    Приводит координаты элемента к виду (x1, y1, x2, y2)
+
+    Поддерживаются форматы агента (список вершин (x, y)), Vision API
+    ({'vertices': [{'x': .., 'y': ..}]}) и готовый bbox из 4 чисел.
+    """
+    if not bounds:
+        return None
+    if isinstance(bounds, dict):
+        bounds = bounds.get('vertices') or []
+        if not bounds:
+            return None
+
+    if len(bounds) == 4 and all(isinstance(v, (int, float)) for v in bounds):
+        x1, y1, x2, y2 = bounds
+        return float(x1), float(y1), float(x2), float(y2)
+
+    xs, ys = [], []
+    for vertex in bounds:
+        if isinstance(vertex, dict):
+            xs.append(vertex.get('x') or 0)
+            ys.append(vertex.get('y') or 0)
+        else:
+            xs.append(vertex[0])
+            ys.append(vertex[1])
+    if not xs:
+        return None
+    return float(min(xs)), float(min(ys)), float(max(xs)), float(max(ys))
+
+
+def _element_bounds(element: Dict):
+    """Координаты элемента в любом из сохраняемых форматов"""
+    return element.get('bounds') or element.get('bounding_poly') or element.get('bbox')
+
+
+def entry_elements(data: Dict) -> List[Dict]:
+    """
+    Плоский список элементов записи с пользовательскими метками
+
+    Идентификаторы совпадают с идентификаторами аннотаций из annotate.html:
+    'text-<i>' для текстовых элементов и 'ui-<i>' для UI элементов.
+    """
+    results = data.get('vision_api_results') or {}
+    texts = results.get('texts') or results.get('text_elements') or []
+    ui_elements = results.get('ui_elements') or []
+
+    annotations = {
+        annotation.get('id'): annotation
+        for annotation in data.get('user_annotations') or []
+        if isinstance(annotation, dict)
+    }
+
+    elements = []
+    sources = [('text', texts), ('ui', ui_elements)]
+    for source, items in sources:
+        for index, item in enumerate(items):
+            bbox = bounds_to_bbox(_element_bounds(item))
+            if bbox is None:
+                continue
+
+            element_id = f"{source}-{index}"
+            annotation = annotations.get(element_id) or {}
+            labels = [label for label in annotation.get('labels') or [] if label in TAG_TO_CATEGORY]
+
+            predicted_type = item.get('type') or ('text_label' if source == 'text' else None)
+            tag = labels[0] if labels else (predicted_type if predicted_type in TAG_TO_CATEGORY else None)
+
+            elements.append({
+                'element_id': element_id,
+                'source': source,
+                'bbox': bbox,
+                'text': item.get('text') or item.get('description') or '',
+                'predicted_type': predicted_type,
+                'confidence': item.get('confidence'),
+                'labels': labels,
+                'tag': tag,
+                'category': TAG_TO_CATEGORY.get(tag),
+                'verified': bool(labels),
+                'annotation_confidence': annotation.get('confidence'),
+                'notes': annotation.get('notes') or ''
+            })
+
+    return elements
@@ -0,0 +1,275 @@
+"""
+Наблюдение за папкой со скриншотами
+
+На Linux используется inotify (через ctypes, без внешних зависимостей),
+на остальных системах и на сетевых папках, где inotify не видит чужие
+записи, - периодический опрос. Файл считается готовым, когда его размер
+и время изменения не менялись debounce секунд: так недописанные файлы
+не попадают в анализ.
+
+Что уже обработано, хранит манифест пакета (batch_manifest), поэтому
+после перезапуска наблюдателя повторно анализируются только новые и
+измененные файлы.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import fnmatch
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from config import BATCH_SETTINGS
+from constants import ANALYSIS_CONFIG
+
+# Флаги inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_inotify():
+    """libc с функциями inotify или None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class DirectoryWatcher:
+    """Источник готовых к анализу файлов в папке"""
+
+    def __init__(self, directory, patterns: Union[str, Sequence[str], None] = None,
+                 debounce: Optional[float] = None, poll_interval: Optional[float] = None,
+                 use_inotify: Optional[bool] = None):
+        """
+        Args:
+            directory: Папка для наблюдения (без вложенных папок)
+            patterns: Маска или список масок имен файлов; по умолчанию все
+                      форматы из ANALYSIS_CONFIG['supported_formats']
+            debounce: Сколько секунд файл должен не меняться, чтобы считаться дописанным
+            poll_interval: Период опроса в режиме без inotify
+            use_inotify: None - автоматически, False - только опрос
+        """
+        self.directory = Path(directory)
+        if not self.directory.is_dir():
+            raise FileNotFoundError(f"Директория не найдена: {self.directory}")
+
+        if patterns is None:
+            self.patterns = [f"*.{ext}" for ext in ANALYSIS_CONFIG['supported_formats']]
+            self._ignore_case = True
+        else:
+            self.patterns = [patterns] if isinstance(patterns, str) else list(patterns)
+            self._ignore_case = False
+        self.debounce = debounce if debounce is not None else BATCH_SETTINGS['watch_debounce']
+        self.poll_interval = poll_interval or BATCH_SETTINGS['watch_poll_interval']
+
+        # Кандидаты: путь -> (размер, mtime_ns, время последнего изменения)
+        self._pending: Dict[Path, Tuple[int, int, float]] = {}
+        # Подписи уже отданных файлов, чтобы не отдавать их повторно без изменений
+        self._emitted: Dict[Path, Tuple[int, int]] = {}
+        # Подписи всех файлов для режима опроса
+        self._snapshot: Dict[Path, Tuple[int, int]] = {}
+
+        self._fd = None
+        libc = _load_inotify() if use_inotify is not False else None
+        if libc is not None:
+            self._fd = self._init_inotify(libc)
+        if self._fd is None and use_inotify:
+            raise OSError("inotify недоступен")
+
+        logging.info(f"👀 Наблюдение за {self.directory} ({self.backend}), маски: {', '.join(self.patterns)}")
+
+    @property
+    def backend(self) -> str:
+        return 'inotify' if self._fd is not None else 'polling'
+
+    def _init_inotify(self, libc) -> Optional[int]:
+        """Создает inotify-дескриптор с наблюдением за папкой"""
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            logging.warning(f"⚠️ inotify_init1: {os.strerror(ctypes.get_errno())}, используется опрос")
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(self.directory), WATCH_MASK) < 0:
+            logging.warning(f"⚠️ inotify_add_watch: {os.strerror(ctypes.get_errno())}, используется опрос")
+            os.close(fd)
+            return None
+        return fd
+
+    def _matches(self, name: str) -> bool:
+        if self._ignore_case:
+            name = name.lower()
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns)
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        """Подписи (размер, mtime_ns) всех подходящих файлов папки"""
+        signatures = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not self._matches(entry.name):
+                    continue
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        signatures[Path(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+                except FileNotFoundError:
+                    continue
+        return signatures
+
+    def existing_files(self) -> List[Path]:
+        """
+        Файлы, уже лежащие в папке при старте (разовый обход)
+
+        Они считаются готовыми; решение о повторной обработке принимает манифест.
+        """
+        self._snapshot = self._scan()
+        self._emitted.update(self._snapshot)
+        return sorted(self._snapshot)
+
+    def _touch(self, path: Path):
+        """Файл изменился: обновляет кандидата и сбрасывает таймер debounce"""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self._pending.pop(path, None)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        previous = self._pending.get(path)
+        if previous is None or previous[:2] != signature:
+            self._pending[path] = (*signature, time.monotonic())
+
+    def _read_events(self, timeout: float):
+        """Чтение событий inotify с ожиданием не дольше timeout"""
+        readable, _, _ = select.select([self._fd], [], [], max(timeout, 0))
+        if not readable:
+            return
+
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            _, mask, _, name_length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + name_length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += name_length
+
+            if mask & IN_Q_OVERFLOW:
+                # Очередь ядра переполнена - события потеряны, сверяемся с папкой
+                logging.warning("⚠️ Переполнение очереди inotify, пересканирование папки")
+                for path in self._scan():
+                    self._touch(path)
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                logging.error(f"❌ Папка {self.directory} удалена или перемещена, переход на опрос")
+                os.close(self._fd)
+                self._fd = None
+                return
+            elif name and self._matches(name):
+                self._touch(self.directory / name)
+
+    def _poll_directory(self):
+        """Режим опроса: сравнение с предыдущим снимком папки"""
+        snapshot = self._scan()
+        for path, signature in snapshot.items():
+            if self._snapshot.get(path) != signature:
+                self._touch(path)
+        self._snapshot = snapshot
+
+    def _collect_ready(self) -> List[Path]:
+        """Кандидаты, не менявшиеся debounce секунд"""
+        now = time.monotonic()
+        ready = []
+        for path, (size, mtime_ns, changed_at) in list(self._pending.items()):
+            if now - changed_at < self.debounce:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature != (size, mtime_ns):
+                self._pending[path] = (*signature, now)
+                continue
+            del self._pending[path]
+            if self._emitted.get(path) != signature:
+                self._emitted[path] = signature
+                ready.append(path)
+        return sorted(ready)
+
+    def poll(self, timeout: float = 1.0) -> List[Path]:
+        """
+        Ожидание готовых файлов
+
+        Returns:
+            Новые или измененные файлы, дописанные до конца (может быть пусто)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            wait = deadline - now
+            if self._pending:
+                next_due = min(changed_at for _, _, changed_at in self._pending.values()) + self.debounce
+                wait = min(wait, next_due - now)
+
+            if self._fd is not None:
+                self._read_events(wait)
+            else:
+                time.sleep(max(min(wait, self.poll_interval), 0))
+                self._poll_directory()
+
+            ready = self._collect_ready()
+            if ready or time.monotonic() >= deadline:
+                return ready
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self) -> 'DirectoryWatcher':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+if __name__ == "__main__":
+    from enhanced_agent import EnhancedUIAnalysisAgent
+
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2:
+        print("Использование: python directory_watcher.py <папка> [маска] [метод]")
+        sys.exit(1)
+
+    agent = EnhancedUIAnalysisAgent()
+    try:
+        asyncio.run(agent.watch_directory(
+            sys.argv[1],
+            pattern=sys.argv[2] if len(sys.argv) > 2 else None,
+            analysis_method=sys.argv[3] if len(sys.argv) > 3 else "auto"
+        ))
+    except KeyboardInterrupt:
+        print("\n🛑 Наблюдение остановлено")
+    finally:
+        agent.cleanup()
@@ -0,0 +1,326 @@
+"""
+Классификация элементов интерфейса по признакам
+
+Для всех рамок изображения сразу строится матрица признаков (N, F):
+размер и форма относительно экрана, положение, средний цвет и разброс
+яркости внутри рамки, совпадения текста элемента с UI_KEYWORDS.
+Средние и дисперсии берутся из интегральных изображений (таблиц сумм),
+построенных один раз на уменьшенной копии, поэтому цена рамки - четыре
+обращения к массиву независимо от ее размера.
+
+Матрица классифицируется одним векторизованным вызовом: правилами
+(пороги ANALYSIS_SETTINGS) или обученной моделью - многоклассовой
+логистической регрессией на numpy по проверенным меткам
+training_dataset (fit_from_dataset).
+"""
+import logging
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from box_ops import containment_matrix
+from config import ANALYSIS_SETTINGS, UI_KEYWORDS
+
+KEYWORD_GROUPS = tuple(UI_KEYWORDS)
+
+FEATURE_NAMES = (
+    'width', 'height', 'log_aspect', 'area', 'log_area_px', 'center_x', 'center_y',
+    'top_edge', 'bottom_edge', 'mean_r', 'mean_g', 'mean_b', 'luma_std', 'has_text'
+) + tuple(f"kw_{group}" for group in KEYWORD_GROUPS)
+_F = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+# Группа ключевых слов -> тег таксономии (для правил)
+KEYWORD_TAGS = {
+    'health_indicators': 'health_bar',
+    'mana_indicators': 'mana_bar',
+    'experience_indicators': 'experience_bar',
+    'close_buttons': 'close_button',
+    'action_buttons': 'action_button',
+    'menu_buttons': 'menu_button',
+    'navigation_buttons': 'forward_button',
+    'inventory_buttons': 'inventory_slot',
+    'shop_buttons': 'button'
+}
+
+# Слово -> индексы групп (слово может входить в несколько групп: 'back')
+_KEYWORD_INDEX: Dict[str, List[int]] = {}
+for _group_index, _group in enumerate(KEYWORD_GROUPS):
+    for _word in UI_KEYWORDS[_group]:
+        _KEYWORD_INDEX.setdefault(_word, []).append(_group_index)
+
+_WORD_PATTERN = re.compile(r'[a-z]+')
+
+# Полоса у верхнего/нижнего края экрана, доля высоты
+EDGE_BAND = 0.12
+
+
+def _integral_images(image: Image.Image, max_side: int) -> Tuple[np.ndarray, float]:
+    """
+    Таблицы сумм R, G, B, яркости и квадрата яркости (H+1, W+1, 5)
+
+    Returns:
+        Таблицы и масштаб уменьшенной копии относительно оригинала
+    """
+    scale = min(1.0, max_side / max(image.size))
+    small = image.convert('RGB')
+    if scale < 1.0:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        small = small.resize(size, Image.BILINEAR, reducing_gap=2.0)
+
+    rgb = np.asarray(small, dtype=np.float64) / 255.0
+    luma = rgb @ np.array([0.299, 0.587, 0.114])
+    channels = np.concatenate([rgb, luma[..., None], (luma ** 2)[..., None]], axis=2)
+
+    sums = np.zeros((channels.shape[0] + 1, channels.shape[1] + 1, channels.shape[2]))
+    sums[1:, 1:] = channels.cumsum(axis=0).cumsum(axis=1)
+    return sums, scale
+
+
+def _box_means(sums: np.ndarray, boxes: np.ndarray, scale: float) -> np.ndarray:
+    """Средние каналов внутри рамок (N, 5) по таблицам сумм"""
+    height, width = sums.shape[0] - 1, sums.shape[1] - 1
+    scaled = np.rint(boxes * scale).astype(np.intp)
+    x1 = np.clip(scaled[:, 0], 0, width - 1)
+    y1 = np.clip(scaled[:, 1], 0, height - 1)
+    x2 = np.clip(np.maximum(scaled[:, 2], x1 + 1), 1, width)
+    y2 = np.clip(np.maximum(scaled[:, 3], y1 + 1), 1, height)
+
+    totals = sums[y2, x2] - sums[y1, x2] - sums[y2, x1] + sums[y1, x1]
+    return totals / ((x2 - x1) * (y2 - y1))[:, None]
+
+
+def keyword_hits(texts: Sequence[Optional[str]]) -> np.ndarray:
+    """Совпадения слов текста с группами UI_KEYWORDS (N, групп)"""
+    hits = np.zeros((len(texts), len(KEYWORD_GROUPS)), dtype=np.float32)
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        for word in _WORD_PATTERN.findall(text.lower()):
+            groups = _KEYWORD_INDEX.get(word)
+            if groups:
+                hits[i, groups] = 1.0
+    return hits
+
+
+def texts_for_boxes(boxes: np.ndarray, text_boxes: np.ndarray, text_strings: Sequence[str],
+                    threshold: float = 0.5) -> List[Optional[str]]:
+    """Текст внутри каждой рамки: строки, лежащие в ней хотя бы на threshold площади"""
+    if not len(boxes) or not len(text_boxes):
+        return [None] * len(boxes)
+    inside = containment_matrix(np.asarray(text_boxes, dtype=np.float32),
+                                np.asarray(boxes, dtype=np.float32)) >= threshold
+    return [' '.join(text_strings[j] for j in np.flatnonzero(column)) or None for column in inside.T]
+
+
+def build_features(image: Image.Image, boxes: np.ndarray,
+                   texts: Optional[Sequence[Optional[str]]] = None) -> np.ndarray:
+    """
+    Матрица признаков всех рамок изображения
+
+    Args:
+        image: Изображение (PIL)
+        boxes: Рамки (N, 4) [x1, y1, x2, y2] в пикселях изображения
+        texts: Текст каждой рамки или None (см. texts_for_boxes)
+
+    Returns:
+        float32 (N, len(FEATURE_NAMES))
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    features = np.zeros((len(boxes), len(FEATURE_NAMES)), dtype=np.float32)
+    if not len(boxes):
+        return features
+
+    screen_w, screen_h = image.size
+    widths = np.clip(boxes[:, 2] - boxes[:, 0], 1, None)
+    heights = np.clip(boxes[:, 3] - boxes[:, 1], 1, None)
+    center_y = (boxes[:, 1] + boxes[:, 3]) / 2 / screen_h
+
+    features[:, _F['width']] = widths / screen_w
+    features[:, _F['height']] = heights / screen_h
+    features[:, _F['log_aspect']] = np.log(widths / heights)
+    features[:, _F['area']] = widths * heights / (screen_w * screen_h)
+    features[:, _F['log_area_px']] = np.log(widths * heights)
+    features[:, _F['center_x']] = (boxes[:, 0] + boxes[:, 2]) / 2 / screen_w
+    features[:, _F['center_y']] = center_y
+    features[:, _F['top_edge']] = center_y < EDGE_BAND
+    features[:, _F['bottom_edge']] = center_y > 1 - EDGE_BAND
+
+    sums, scale = _integral_images(image, ANALYSIS_SETTINGS['classifier_feature_side'])
+    means = _box_means(sums, boxes, scale)
+    features[:, _F['mean_r']:_F['mean_b'] + 1] = means[:, :3]
+    features[:, _F['luma_std']] = np.sqrt(np.clip(means[:, 4] - means[:, 3] ** 2, 0, None))
+
+    if texts is not None:
+        features[:, _F['has_text']] = [bool(text) for text in texts]
+        features[:, _F[f"kw_{KEYWORD_GROUPS[0]}"]:] = keyword_hits(texts)
+    return features
+
+
+def classify_rules(features: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """
+    Теги по правилам: ключевые слова, затем форма и размер
+
+    Returns:
+        Теги таксономии и уверенность (N,)
+    """
+    settings = ANALYSIS_SETTINGS
+    aspect = np.exp(features[:, _F['log_aspect']])
+    area_px = np.exp(features[:, _F['log_area_px']])
+    at_edge = (features[:, _F['top_edge']] + features[:, _F['bottom_edge']]) > 0
+    low_aspect, high_aspect = settings['button_aspect_ratio_range']
+
+    # Порядок - приоритет: первое выполненное условие задает тег
+    rules = [(features[:, _F[f"kw_{group}"]] > 0, tag, 0.7) for group, tag in KEYWORD_TAGS.items()]
+    rules += [
+        ((aspect > 3) & at_edge, 'navigation_bar', 0.5),
+        ((aspect >= settings['input_field_aspect_ratio_min'])
+         & (features[:, _F['luma_std']] < settings['input_field_max_luma_std']), 'input_field', 0.4),
+        ((area_px <= settings['icon_area_threshold']) & (aspect > 0.75) & (aspect < 1.33), 'icon_button', 0.5),
+        (area_px > settings['max_element_area'], 'panel', 0.4),
+        ((aspect >= low_aspect) & (aspect <= high_aspect), 'button', 0.4),
+    ]
+    conditions = [condition for condition, _, _ in rules]
+    tags = np.array([tag for _, tag, _ in rules] + ['container'])
+
+    choice = np.select(conditions, np.arange(len(rules)), default=len(rules))
+    confidence = np.array([score for _, _, score in rules] + [0.3], dtype=np.float32)[choice]
+    return tags[choice].tolist(), confidence
+
+
+class ElementClassifier:
+    """Многоклассовая логистическая регрессия над FEATURE_NAMES"""
+
+    def __init__(self, classes: Sequence[str], mean: np.ndarray, scale: np.ndarray,
+                 weights: np.ndarray, bias: np.ndarray):
+        self.classes = list(classes)
+        self.mean = mean
+        self.scale = scale
+        self.weights = weights
+        self.bias = bias
+
+    @classmethod
+    def fit(cls, features: np.ndarray, labels: Sequence[str], epochs: int = 500,
+            learning_rate: float = 0.5, l2: float = 1e-3) -> 'ElementClassifier':
+        """Обучение полным градиентным спуском по кросс-энтропии"""
+        classes = sorted(set(labels))
+        if len(classes) < 2:
+            raise ValueError("Для обучения нужно хотя бы два разных тега")
+        class_index = {name: i for i, name in enumerate(classes)}
+        targets = np.zeros((len(labels), len(classes)))
+        targets[np.arange(len(labels)), [class_index[label] for label in labels]] = 1.0
+
+        features = np.asarray(features, dtype=np.float64)
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0)
+        scale[scale == 0] = 1.0
+        x = (features - mean) / scale
+
+        weights = np.zeros((x.shape[1], len(classes)))
+        bias = np.zeros(len(classes))
+        for _ in range(epochs):
+            probabilities = _softmax(x @ weights + bias)
+            error = (probabilities - targets) / len(x)
+            weights -= learning_rate * (x.T @ error + l2 * weights)
+            bias -= learning_rate * error.sum(axis=0)
+
+        return cls(classes, mean, scale, weights, bias)
+
+    def predict_proba(self, features: np.ndarray) -> np.ndarray:
+        return _softmax((np.asarray(features, dtype=np.float64) - self.mean) / self.scale @ self.weights + self.bias)
+
+    def predict(self, features: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """Теги и уверенность (N,)"""
+        if not len(features):
+            return [], np.zeros(0, dtype=np.float32)
+        probabilities = self.predict_proba(features)
+        best = probabilities.argmax(axis=1)
+        return [self.classes[i] for i in best], probabilities.max(axis=1).astype(np.float32)
+
+    def save(self, path) -> None:
+        np.savez(path, classes=np.array(self.classes), features=np.array(FEATURE_NAMES),
+                 mean=self.mean, scale=self.scale, weights=self.weights, bias=self.bias)
+
+    @classmethod
+    def load(cls, path) -> 'ElementClassifier':
+        """
+        Raises:
+            ValueError: модель обучена на другом наборе признаков
+        """
+        with np.load(path) as data:
+            if tuple(data['features'].tolist()) != FEATURE_NAMES:
+                raise ValueError(f"Модель {path} обучена на другом наборе признаков")
+            return cls(data['classes'].tolist(), data['mean'], data['scale'], data['weights'], data['bias'])
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def classify_boxes(image: Image.Image, boxes: np.ndarray,
+                   texts: Optional[Sequence[Optional[str]]] = None,
+                   model: Optional[ElementClassifier] = None) -> Tuple[List[str], np.ndarray]:
+    """
+    Теги таксономии для всех рамок изображения одним вызовом
+
+    Args:
+        image: Изображение (PIL)
+        boxes: Рамки (N, 4) [x1, y1, x2, y2]
+        texts: Текст каждой рамки или None
+        model: Обученная модель; без нее - правила
+
+    Returns:
+        Теги и уверенность (N,)
+    """
+    features = build_features(image, boxes, texts)
+    if model is not None:
+        return model.predict(features)
+    return classify_rules(features)
+
+
+def dataset_samples(dataset_dir=None) -> Tuple[np.ndarray, List[str]]:
+    """
+    Признаки и проверенные теги элементов training_dataset
+
+    Берутся элементы с метками пользователя (annotate.html); изображение
+    каждой записи открывается один раз.
+    """
+    from dataset_entries import entry_elements, entry_image_path, iter_entry_dirs, load_entry
+
+    blocks: List[np.ndarray] = []
+    labels: List[str] = []
+    for entry_dir in iter_entry_dirs(dataset_dir):
+        data = load_entry(entry_dir)
+        if data is None:
+            continue
+        elements = [element for element in entry_elements(data) if element['verified']]
+        image_path = entry_image_path(entry_dir, data)
+        if not elements or image_path is None:
+            continue
+        try:
+            with Image.open(image_path) as image:
+                blocks.append(build_features(image, np.array([e['bbox'] for e in elements]),
+                                             [e['text'] for e in elements]))
+        except OSError as e:
+            logging.warning(f"⚠️ {entry_dir.name}: {e}")
+            continue
+        labels.extend(element['tag'] for element in elements)
+
+    features = np.concatenate(blocks) if blocks else np.zeros((0, len(FEATURE_NAMES)), dtype=np.float32)
+    return features, labels
+
+
+def fit_from_dataset(dataset_dir=None, **fit_options) -> ElementClassifier:
+    """
+    Модель по проверенным меткам датасета
+
+    Raises:
+        ValueError: в датасете нет проверенных элементов хотя бы двух тегов
+    """
+    features, labels = dataset_samples(dataset_dir)
+    if not labels:
+        raise ValueError("В датасете нет элементов с метками пользователя")
+    return ElementClassifier.fit(features, labels, **fit_options)
@@ -0,0 +1,300 @@
+"""
+Компактное колоночное хранилище элементов интерфейса
+
+Вместо списка словарей (по словарю и четыре кортежа на каждый элемент)
+элементы хранятся в массивах numpy:
+    boxes      int32 (N, 4)  - x1, y1, x2, y2
+    type_ids   uint16        - индекс в TYPE_NAMES (ALL_UI_TAGS), прочие типы -
+                             в словаре таблицы extra_types после тегов таксономии
+    confidence float32
+    source_ids uint8         - индекс в SOURCES
+    text_ids   int32         - индекс в общем пуле строк, -1 если текста нет
+
+Срезы и фильтры возвращают представления тех же массивов без копирования
+строк. Преобразование в привычный формат словарей выполняется лениво,
+при обращении к элементу или при вызове to_dicts().
+"""
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from box_ops import merge_contained, nms, to_boxes
+from constants import ALL_UI_TAGS
+
+# Теги таксономии имеют общие стабильные ID; прочие типы детекторов и LLM
+# (icon, text_field и т.п.) получают ID в словаре своей таблицы (extra_types),
+# поэтому общий словарь не растет в долгоживущем процессе
+TYPE_NAMES: Tuple[str, ...] = tuple(ALL_UI_TAGS)
+_TYPE_IDS: Dict[str, int] = {name: i for i, name in enumerate(TYPE_NAMES)}
+NO_TYPE = np.iinfo(np.uint16).max
+
+SOURCES = ('detector', 'vision_text', 'vision_object', 'ocr', 'llm', 'user')
+_SOURCE_IDS = {name: i for i, name in enumerate(SOURCES)}
+
+
+def _type_id(name: Optional[str], extra_types: List[str]) -> int:
+    """ID типа: тег таксономии или тип из словаря таблицы (незнакомый дописывается)"""
+    if not name:
+        return NO_TYPE
+    tid = _TYPE_IDS.get(name)
+    if tid is not None:
+        return tid
+    try:
+        return len(TYPE_NAMES) + extra_types.index(name)
+    except ValueError:
+        if len(TYPE_NAMES) + len(extra_types) >= NO_TYPE:
+            raise ValueError("Переполнен словарь типов элементов")
+        extra_types.append(name)
+        return len(TYPE_NAMES) + len(extra_types) - 1
+
+
+class ElementTable:
+    """Колоночная таблица элементов с ленивым доступом в виде словарей"""
+
+    __slots__ = ('boxes', 'type_ids', 'confidence', 'source_ids', 'text_ids', 'strings', 'extra_types')
+
+    def __init__(self, boxes: np.ndarray, type_ids: np.ndarray, confidence: np.ndarray,
+                 source_ids: np.ndarray, text_ids: np.ndarray, strings: List[str],
+                 extra_types: Optional[List[str]] = None):
+        self.boxes = boxes
+        self.type_ids = type_ids
+        self.confidence = confidence
+        self.source_ids = source_ids
+        self.text_ids = text_ids
+        self.strings = strings
+        self.extra_types = extra_types if extra_types is not None else []
+
+    @classmethod
+    def empty(cls) -> 'ElementTable':
+        """Пустая таблица"""
+        return cls(
+            np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=np.uint16),
+            np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.uint8),
+            np.zeros(0, dtype=np.int32), []
+        )
+
+    @classmethod
+    def from_elements(cls, elements: Sequence[Dict], source: str = 'detector') -> 'ElementTable':
+        """
+        Таблица из списка словарей формата агента
+
+        Args:
+            elements: [{'bounds': [(x, y), ...], 'type': .., 'confidence': .., 'text': ..}]
+            source: Источник элементов, один из SOURCES
+        """
+        n = len(elements)
+        strings: List[str] = []
+        extra_types: List[str] = []
+        text_ids = np.full(n, -1, dtype=np.int32)
+        for i, element in enumerate(elements):
+            text = element.get('text')
+            if text:
+                text_ids[i] = len(strings)
+                strings.append(text)
+
+        return cls(
+            np.rint(to_boxes(elements)).astype(np.int32),
+            np.fromiter((_type_id(e.get('type'), extra_types) for e in elements), dtype=np.uint16, count=n),
+            np.fromiter((e.get('confidence') or 0.0 for e in elements), dtype=np.float32, count=n),
+            np.full(n, _SOURCE_IDS[source], dtype=np.uint8),
+            text_ids,
+            strings,
+            extra_types
+        )
+
+    @classmethod
+    def concat(cls, tables: Sequence['ElementTable']) -> 'ElementTable':
+        """Объединение таблиц (пулы строк и словари прочих типов сливаются)"""
+        tables = [t for t in tables if len(t)]
+        if not tables:
+            return cls.empty()
+
+        strings: List[str] = []
+        extra_types: List[str] = []
+        text_ids, type_ids = [], []
+        for table in tables:
+            shifted = table.text_ids.copy()
+            shifted[shifted >= 0] += len(strings)
+            text_ids.append(shifted)
+            strings.extend(table.strings)
+
+            remapped = table.type_ids.copy()
+            local = (table.type_ids >= len(TYPE_NAMES)) & (table.type_ids != NO_TYPE)
+            for local_id in np.unique(table.type_ids[local]).tolist():
+                name = table.extra_types[local_id - len(TYPE_NAMES)]
+                remapped[table.type_ids == local_id] = _type_id(name, extra_types)
+            type_ids.append(remapped)
+
+        return cls(
+            np.concatenate([t.boxes for t in tables]),
+            np.concatenate(type_ids),
+            np.concatenate([t.confidence for t in tables]),
+            np.concatenate([t.source_ids for t in tables]),
+            np.concatenate(text_ids),
+            strings,
+            extra_types
+        )
+
+    # --- Колонки ---
+
+    @property
+    def x1(self) -> np.ndarray:
+        return self.boxes[:, 0]
+
+    @property
+    def y1(self) -> np.ndarray:
+        return self.boxes[:, 1]
+
+    @property
+    def x2(self) -> np.ndarray:
+        return self.boxes[:, 2]
+
+    @property
+    def y2(self) -> np.ndarray:
+        return self.boxes[:, 3]
+
+    @property
+    def areas(self) -> np.ndarray:
+        return (self.x2 - self.x1).astype(np.int64) * (self.y2 - self.y1)
+
+    @property
+    def nbytes(self) -> int:
+        """Объем массивов таблицы (без пула строк)"""
+        return sum(getattr(self, name).nbytes for name in
+                   ('boxes', 'type_ids', 'confidence', 'source_ids', 'text_ids'))
+
+    def type_id(self, name: Optional[str]) -> int:
+        """ID типа в этой таблице; незнакомый тип добавляется в словарь таблицы"""
+        return _type_id(name, self.extra_types)
+
+    def _type_label(self, tid: int) -> Optional[str]:
+        if tid == NO_TYPE:
+            return None
+        return TYPE_NAMES[tid] if tid < len(TYPE_NAMES) else self.extra_types[tid - len(TYPE_NAMES)]
+
+    def type_name(self, i: int) -> Optional[str]:
+        return self._type_label(int(self.type_ids[i]))
+
+    def text(self, i: int) -> Optional[str]:
+        tid = int(self.text_ids[i])
+        return None if tid < 0 else self.strings[tid]
+
+    def type_mask(self, names: Sequence[str]) -> np.ndarray:
+        """Маска элементов с типом из списка"""
+        ids = [self.type_id(name) for name in names if name in _TYPE_IDS or name in self.extra_types]
+        return np.isin(self.type_ids, np.asarray(ids, dtype=np.uint16))
+
+    def source_mask(self, source: str) -> np.ndarray:
+        """Маска элементов из указанного источника"""
+        return self.source_ids == _SOURCE_IDS[source]
+
+    # --- Срезы и фильтрация ---
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.to_dict(int(key))
+        # Срезы дают представления, маски и списки индексов - выборку строк;
+        # пул строк и словарь типов общие, поэтому ID не пересчитываются
+        return ElementTable(
+            self.boxes[key], self.type_ids[key], self.confidence[key],
+            self.source_ids[key], self.text_ids[key], self.strings, self.extra_types
+        )
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(len(self)):
+            yield self.to_dict(i)
+
+    def filter(self, mask: np.ndarray) -> 'ElementTable':
+        """Выборка по булевой маске"""
+        return self[np.asarray(mask, dtype=bool)]
+
+    def dedupe(self, iou_threshold: float = 0.5, containment_threshold: Optional[float] = None,
+               keep: str = 'outer', by_type: bool = True) -> 'ElementTable':
+        """Удаление дубликатов (см. box_ops.dedupe_elements); порядок сохраняется"""
+        if len(self) < 2:
+            return self
+        return self[self.dedupe_indices(iou_threshold, containment_threshold, keep, by_type)]
+
+    def dedupe_indices(self, iou_threshold: float = 0.5, containment_threshold: Optional[float] = None,
+                       keep: str = 'outer', by_type: bool = True) -> np.ndarray:
+        """Индексы строк, оставшихся после удаления дубликатов, по возрастанию"""
+        if len(self) < 2:
+            return np.arange(len(self))
+
+        boxes = self.boxes.astype(np.float32)
+        classes = self.type_ids if by_type else None
+        indices = np.arange(len(self))
+        if containment_threshold is not None:
+            indices = merge_contained(boxes, self.confidence, containment_threshold, keep=keep,
+                                      classes=classes)
+        kept = nms(boxes[indices], self.confidence[indices], iou_threshold,
+                   classes=classes[indices] if classes is not None else None)
+        return np.sort(indices[kept])
+
+    # --- Преобразование в словари ---
+
+    def to_dict(self, i: int) -> Dict:
+        """Элемент в формате словарей агента"""
+        x1, y1, x2, y2 = (int(v) for v in self.boxes[i])
+        element = {
+            'bounds': [(x1, y1), (x2, y1), (x2, y2), (x1, y2)],
+            'confidence': round(float(self.confidence[i]), 4)
+        }
+        text = self.text(i)
+        if text is not None:
+            element['text'] = text
+        type_name = self.type_name(i)
+        if type_name is not None:
+            element['type'] = type_name
+            element['area'] = (x2 - x1) * (y2 - y1)
+        return element
+
+    def to_dicts(self) -> List[Dict]:
+        """Все элементы в формате словарей агента"""
+        return [self.to_dict(i) for i in range(len(self))]
+
+    def to_columns(self) -> Dict:
+        """
+        Колоночное представление для сериализации
+
+        Типы и источники сохраняются именами, поэтому результат не зависит
+        от ID нестандартных типов в словаре таблицы.
+        """
+        used_types, type_index = np.unique(self.type_ids, return_inverse=True)
+        return {
+            'boxes': self.boxes.tolist(),
+            'types': [self._type_label(t) for t in used_types.tolist()],
+            'type_index': type_index.tolist(),
+            'confidence': self.confidence.tolist(),
+            'sources': [SOURCES[s] for s in self.source_ids.tolist()],
+            'text': [self.text(i) for i in range(len(self))]
+        }
+
+    @classmethod
+    def from_columns(cls, columns: Dict) -> 'ElementTable':
+        """Обратное преобразование к to_columns()"""
+        n = len(columns['boxes'])
+        extra_types: List[str] = []
+        type_lookup = np.asarray([_type_id(name, extra_types) for name in columns['types']], dtype=np.uint16)
+        strings: List[str] = []
+        text_ids = np.full(n, -1, dtype=np.int32)
+        for i, text in enumerate(columns['text']):
+            if text is not None:
+                text_ids[i] = len(strings)
+                strings.append(text)
+
+        return cls(
+            np.asarray(columns['boxes'], dtype=np.int32).reshape(n, 4),
+            type_lookup[np.asarray(columns['type_index'], dtype=np.intp)] if n else np.zeros(0, dtype=np.uint16),
+            np.asarray(columns['confidence'], dtype=np.float32),
+            np.asarray([_SOURCE_IDS[s] for s in columns['sources']], dtype=np.uint8),
+            text_ids,
+            strings,
+            extra_types
+        )
+
+    def __repr__(self) -> str:
+        return f"ElementTable({len(self)} elements, {self.nbytes} bytes)"
@@ -4,11 +4,18 @@ import asyncio
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Sequence, Union
 
 # Существующие импорты
-from agent import UIAnalysisAgent
+from agent import HAS_VISION_API, UIAnalysisAgent
 from constants import MOBILE_GAMING_UI_TAXONOMY, ALL_UI_TAGS
+from batch_manifest import BatchManifest, batch_id, run_with_retries
+from batch_writer import BatchResultWriter, new_results_path
+from directory_watcher import DirectoryWatcher
+from file_discovery import iter_image_files
+from result_io import dump_results
+from lazy_imports import import_optional
 
 # Новые гибридные агенты
 try:
@@ -31,7 +38,10 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
             enable_hybrid: Включить гибридный анализ
         """
         # Инициализация базового агента
-        super().__init__(credentials)
+        super().__init__()
+        if credentials is not None and HAS_VISION_API:
+            vision = import_optional('google.cloud.vision', 'google-cloud-vision')
+            self.vision_client = vision.ImageAnnotatorClient(credentials=credentials)
         
         # Инициализация гибридного анализа
         self.hybrid_agent = None
@@ -58,7 +68,7 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
     def get_analysis_capabilities(self) -> Dict[str, bool]:
         """Получить доступные возможности анализа"""
         capabilities = {
-            "google_vision": bool(self.client),
+            "google_vision": bool(self.vision_client),
             "hybrid_vision": self.hybrid_enabled,
             "phi_vision": False,
             "claude_vision": False
@@ -71,13 +81,16 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
         
         return capabilities
     
-    async def analyze_screenshot_enhanced(self, image_path: str, analysis_method: str = "auto") -> Dict:
+    async def analyze_screenshot_enhanced(self, image_path: str, analysis_method: str = "auto",
+                                          save_summary: bool = True, tiled: Optional[bool] = None) -> Dict:
         """
         Расширенный анализ скриншота с использованием множественных AI сервисов
         
         Args:
             image_path: Путь к изображению
             analysis_method: Метод анализа ('auto', 'google_only', 'hybrid', 'phi', 'claude')
+            save_summary: Сохранять отдельную сводку (в пакетном режиме ее заменяет сводка пакета)
+            tiled: Анализ Google Vision тайлами (None - по размеру изображения, см. analyze_image)
         
         Returns:
             Словарь с результатами анализа
@@ -100,12 +113,16 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
             analysis_method = self._choose_optimal_method()
         
         # Google Vision анализ (базовый)
-        if analysis_method in ["auto", "google_only", "hybrid"] and self.client:
+        if analysis_method in ["auto", "google_only", "hybrid"] and self.vision_client:
             logging.info("🔄 Google Vision анализ...")
             try:
-                google_results = self.analyze_image(str(image_path))
+                google_results = self.analyze_image(str(image_path), tiled=tiled)
                 results["google_vision"] = google_results
-                logging.info(f"✅ Google Vision: {google_results['statistics']}")
+                if "error" in google_results:
+                    results["google_vision_error"] = google_results["error"]
+                    logging.error(f"❌ Google Vision ошибка: {google_results['error']}")
+                else:
+                    logging.info(f"✅ Google Vision: {self._google_counts(google_results)}")
             except Exception as e:
                 logging.error(f"❌ Google Vision ошибка: {str(e)}")
                 results["google_vision_error"] = str(e)
@@ -133,12 +150,23 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
                 logging.error(f"❌ Гибридный анализ ошибка: {str(e)}")
                 results["hybrid_vision_error"] = str(e)
         
+        # Ошибка любого запрошенного бэкенда - ошибка анализа: пакетный режим
+        # повторит изображение и не отметит его выполненным
+        errors = {}
+        for name in ("google_vision", "hybrid_vision"):
+            if f"{name}_error" in results:
+                errors[name] = results[f"{name}_error"]
+        errors.update(results.get("hybrid_vision", {}).get("backend_errors", {}))
+        if errors:
+            results["error"] = "; ".join(f"{name}: {message}" for name, message in errors.items())
+        
         # Объединение и анализ результатов
         results["combined_analysis"] = self._combine_all_results(results)
         results["confidence_score"] = self._calculate_overall_confidence(results)
         
-        # Сохранение в обучающий датасет
-        self._save_enhanced_learning_data(results)
+        # Сохранение в обучающий датасет (неудачный анализ не сохраняется)
+        if "error" not in results:
+            self._save_enhanced_learning_data(results, save_summary)
         
         logging.info(f"🎉 Анализ завершен. Confidence: {results['confidence_score']:.2f}")
         return results
@@ -158,6 +186,15 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
         else:
             raise Exception("Нет доступных методов анализа")
     
+    @staticmethod
+    def _google_counts(google_results: Dict) -> Dict[str, int]:
+        """Число текстов, UI элементов и объектов в результате analyze_image"""
+        return {
+            "texts_count": len(google_results.get("text_elements", [])),
+            "ui_elements_count": len(google_results.get("ui_elements", [])),
+            "objects_count": len(google_results.get("detected_objects", []))
+        }
+    
     def _combine_all_results(self, results: Dict) -> Dict:
         """Объединение результатов всех анализов"""
         combined = {
@@ -169,10 +206,11 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
         
         # Анализ Google Vision результатов
         if "google_vision" in results:
-            gv = results["google_vision"]
-            combined["summary"]["google_objects"] = gv.get("statistics", {}).get("objects_count", 0)
-            combined["summary"]["google_texts"] = gv.get("statistics", {}).get("texts_count", 0)
-            combined["text_analysis"]["google_extracted"] = len(gv.get("texts", []))
+            counts = self._google_counts(results["google_vision"])
+            combined["summary"]["google_objects"] = counts["objects_count"]
+            combined["summary"]["google_ui_elements"] = counts["ui_elements_count"]
+            combined["summary"]["google_texts"] = counts["texts_count"]
+            combined["text_analysis"]["google_extracted"] = counts["texts_count"]
         
         # Анализ гибридных результатов
         if "hybrid_vision" in results:
@@ -196,8 +234,8 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
         
         # Google Vision factor
         if "google_vision" in results:
-            gv_stats = results["google_vision"].get("statistics", {})
-            if gv_stats.get("objects_count", 0) > 0 or gv_stats.get("texts_count", 0) > 0:
+            gv_counts = self._google_counts(results["google_vision"])
+            if gv_counts["objects_count"] > 0 or gv_counts["ui_elements_count"] > 0 or gv_counts["texts_count"] > 0:
                 confidence_factors.append(0.7)
         
         # Hybrid Vision factor
@@ -214,7 +252,7 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
         else:
             return 0.3
     
-    def _save_enhanced_learning_data(self, results: Dict):
+    def _save_enhanced_learning_data(self, results: Dict, save_summary: bool = True):
         """Сохранение расширенных данных обучения"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
@@ -223,9 +261,11 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
         enhanced_dir.mkdir(parents=True, exist_ok=True)
         
         # Сохранение полного анализа
-        full_analysis_path = enhanced_dir / f"enhanced_analysis_{timestamp}.json"
-        with open(full_analysis_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+        full_analysis_path = dump_results(results, enhanced_dir / f"enhanced_analysis_{timestamp}")
+        
+        if not save_summary:
+            logging.info(f"💾 Данные сохранены: {full_analysis_path.name}")
+            return
         
         # Сохранение сводки для быстрого анализа
         summary_path = enhanced_dir / f"summary_{timestamp}.json"
@@ -245,98 +285,177 @@ class EnhancedUIAnalysisAgent(UIAnalysisAgent):
     
     async def batch_analyze_screenshots(self, 
                                        image_directory: str, 
-                                       pattern: str = "*.png",
-                                       max_files: int = None,
-                                       analysis_method: str = "auto") -> List[Dict]:
+                                       pattern: Optional[str] = None,
+                                       max_files: Optional[int] = None,
+                                       analysis_method: str = "auto",
+                                       output_path: Optional[str] = None,
+                                       resume: bool = False,
+                                       return_results: bool = True,
+                                       use_manifest: bool = True,
+                                       retry_failed: bool = False,
+                                       recursive: bool = True,
+                                       exclude: Sequence[str] = (),
+                                       tiled: Optional[bool] = None) -> List[Dict]:
         """
         Массовый анализ скриншотов
         
+        Результаты пишутся построчно в JSONL по мере готовности (см. batch_writer).
+        Манифест пакета (см. batch_manifest) помнит хэши и статусы изображений,
+        поэтому повторный запуск той же команды обрабатывает только новые,
+        измененные и упавшие изображения. Файлы ищутся лениво (см. file_discovery):
+        анализ начинается до окончания обхода папок.
+        
         Args:
             image_directory: Директория с изображениями
-            pattern: Паттерн файлов (например, "*.png", "*.jpg")
+            pattern: Маска имени файла (например, "*.png"); по умолчанию все
+                     форматы из ANALYSIS_CONFIG['supported_formats']
             max_files: Максимальное количество файлов для обработки
             analysis_method: Метод анализа
+            output_path: JSONL-файл результатов (по умолчанию новый файл в learning_data/batch_analysis)
+            resume: Продолжить output_path (или последний пакет), пропуская готовые изображения
+            return_results: Вернуть результаты списком; False - только запись в файл
+            use_manifest: Вести манифест пакета между запусками
+            retry_failed: Повторить изображения, исчерпавшие лимит попыток
+            recursive: Искать во вложенных папках
+            exclude: Маски исключаемых файлов и папок (см. file_discovery.iter_image_files)
+            tiled: Анализ Google Vision тайлами (None - по размеру изображения)
         
         Returns:
-            Список результатов анализа
+            Список результатов анализа этого запуска (пустой при return_results=False)
         """
         image_dir = Path(image_directory)
         if not image_dir.exists():
             raise FileNotFoundError(f"Директория не найдена: {image_dir}")
         
-        # Поиск файлов изображений
-        image_files = list(image_dir.glob(pattern))
+        # Ленивый поиск файлов изображений
+        image_files = iter_image_files(image_dir, pattern=pattern, exclude=exclude, recursive=recursive)
         if max_files:
-            image_files = image_files[:max_files]
+            image_files = islice(image_files, max_files)
         
-        if not image_files:
-            logging.warning(f"Файлы изображений не найдены в {image_dir} с паттерном {pattern}")
-            return []
+        manifest = None
+        if use_manifest:
+            manifest = self._batch_manifest(image_dir, pattern, analysis_method)
+            image_files = manifest.iter_plan(image_files, retry_failed)
         
-        logging.info(f"🚀 Начинаю массовый анализ {len(image_files)} файлов...")
+        logging.info(f"🚀 Начинаю массовый анализ файлов из {image_dir}...")
         
         results = []
-        for i, image_file in enumerate(image_files):
-            logging.info(f"📸 Обрабатываю {i+1}/{len(image_files)}: {image_file.name}")
-            
-            try:
-                result = await self.analyze_screenshot_enhanced(
-                    str(image_file), 
-                    analysis_method
-                )
-                results.append(result)
-                
-                # Небольшая пауза между запросами для API rate limiting
-                if i % 5 == 0 and i > 0:
-                    await asyncio.sleep(1)
-                    
-            except Exception as e:
-                logging.error(f"❌ Ошибка обработки {image_file.name}: {str(e)}")
-                results.append({
-                    "timestamp": datetime.now().isoformat(),
-                    "image_path": str(image_file),
-                    "error": str(e)
-                })
+        with BatchResultWriter(self._batch_results_path(output_path, resume), resume=resume) as writer:
+            processed = await self._process_images(image_files, analysis_method, writer, manifest,
+                                                   results if return_results else None, tiled)
+        
+        if manifest:
+            manifest.save()
+        
+        if not processed:
+            logging.warning(f"Новых изображений для анализа в {image_dir} не найдено")
         
-        # Сохранение результатов массового анализа
-        batch_results_path = self._save_batch_results(results)
-        logging.info(f"🎉 Массовый анализ завершен. Результаты: {batch_results_path}")
+        summary = writer.summary
+        logging.info(f"📊 Статистика: {summary['successful']}/{summary['total_files']} успешно")
+        logging.info(f"🎉 Массовый анализ завершен. Результаты: {writer.results_path}")
         
         return results
     
-    def _save_batch_results(self, results: List[Dict]) -> Path:
-        """Сохранение результатов массового анализа"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        batch_dir = Path("learning_data") / "batch_analysis"
-        batch_dir.mkdir(parents=True, exist_ok=True)
+    async def _process_images(self, image_files: Iterable[Path], analysis_method: str,
+                              writer: BatchResultWriter, manifest: Optional[BatchManifest] = None,
+                              results: Optional[List[Dict]] = None, tiled: Optional[bool] = None) -> int:
+        """
+        Анализ изображений с записью результатов и обновлением манифеста
         
-        # Статистика
-        successful = [r for r in results if "error" not in r]
-        failed = [r for r in results if "error" in r]
+        Returns:
+            Число обработанных изображений
+        """
+        processed = 0
+        for i, image_file in enumerate(image_files):
+            if writer.is_done(image_file):
+                continue
+            
+            processed += 1
+            logging.info(f"📸 Обрабатываю #{i+1}: {image_file.name}")
+            result = await self._analyze_with_retries(image_file, analysis_method, manifest, tiled)
+            
+            offset = writer.write(result)
+            if manifest:
+                if "error" in result:
+                    manifest.mark_failed(image_file, result["error"], writer.results_path, offset)
+                else:
+                    manifest.mark_done(image_file, writer.results_path, offset)
+            if results is not None:
+                results.append(result)
+            
+            # Небольшая пауза между запросами для API rate limiting
+            if processed % 5 == 0:
+                await asyncio.sleep(1)
         
-        batch_summary = {
-            "timestamp": datetime.now().isoformat(),
-            "total_files": len(results),
-            "successful": len(successful),
-            "failed": len(failed),
-            "success_rate": len(successful) / len(results) if results else 0,
-            "average_confidence": sum(r.get("confidence_score", 0) for r in successful) / len(successful) if successful else 0,
-            "failed_files": [r["image_path"] for r in failed]
-        }
+        return processed
+    
+    async def watch_directory(self,
+                              image_directory: str,
+                              pattern: Optional[str] = None,
+                              analysis_method: str = "auto",
+                              output_path: Optional[str] = None,
+                              stop_event: Optional[asyncio.Event] = None,
+                              use_inotify: Optional[bool] = None):
+        """
+        Анализ новых скриншотов по мере появления в папке
         
-        # Сохранение полных результатов
-        full_results_path = batch_dir / f"batch_full_{timestamp}.json"
-        with open(full_results_path, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+        Файлы, лежащие в папке при старте, обрабатываются один раз, далее
+        анализируются только созданные или измененные (см. directory_watcher).
+        Манифест общий с batch_analyze_screenshots для той же папки, маски и
+        метода, поэтому уже обработанные файлы повторно не анализируются.
         
-        # Сохранение сводки
-        summary_path = batch_dir / f"batch_summary_{timestamp}.json"
-        with open(summary_path, 'w', encoding='utf-8') as f:
-            json.dump(batch_summary, f, ensure_ascii=False, indent=2)
+        Args:
+            image_directory: Папка для наблюдения
+            pattern: Маска файлов (по умолчанию все поддерживаемые форматы)
+            analysis_method: Метод анализа
+            output_path: JSONL-файл результатов (по умолчанию новый файл в learning_data/batch_analysis)
+            stop_event: Событие остановки; без него наблюдение идет до отмены задачи
+            use_inotify: None - автоматически, False - только опрос папки
+        """
+        image_dir = Path(image_directory)
+        manifest = self._batch_manifest(image_dir, pattern, analysis_method)
+        
+        with DirectoryWatcher(image_dir, pattern, use_inotify=use_inotify) as watcher, \
+                BatchResultWriter(self._batch_results_path(output_path, False)) as writer:
+            ready = watcher.existing_files()
+            while not (stop_event and stop_event.is_set()):
+                image_files = manifest.plan(ready) if ready else []
+                if image_files:
+                    await self._process_images(image_files, analysis_method, writer, manifest)
+                    writer.flush()
+                    manifest.save()
+                ready = await asyncio.to_thread(watcher.poll, 1.0)
+        
+        manifest.save()
+        logging.info(f"🛑 Наблюдение за {image_dir} остановлено. Результаты: {writer.results_path}")
+    
+    async def _analyze_with_retries(self, image_file: Path, analysis_method: str,
+                                    manifest: Optional[BatchManifest] = None,
+                                    tiled: Optional[bool] = None) -> Dict:
+        """Анализ изображения с повторами по политике BATCH_SETTINGS (см. run_with_retries)"""
+        return await run_with_retries(
+            lambda: self.analyze_screenshot_enhanced(str(image_file), analysis_method, save_summary=False,
+                                                     tiled=tiled),
+            image_file, manifest
+        )
+    
+    def _batch_manifest(self, image_dir: Path, pattern: str, analysis_method: str) -> BatchManifest:
+        """Манифест пакета, общий для всех запусков с той же папкой, маской и методом"""
+        manifest_name = f"manifest_{batch_id(image_dir.resolve(), pattern, analysis_method)}.json"
+        return BatchManifest(Path("learning_data") / "batch_analysis" / manifest_name)
+    
+    def _batch_results_path(self, output_path: Optional[str], resume: bool) -> Path:
+        """Файл результатов пакета: заданный, последний (для resume) или новый"""
+        if output_path:
+            return Path(output_path)
         
-        logging.info(f"📊 Статистика: {batch_summary['successful']}/{batch_summary['total_files']} успешно")
+        batch_dir = Path("learning_data") / "batch_analysis"
+        if resume:
+            previous = sorted(batch_dir.glob("batch_full_*.jsonl"))
+            if previous:
+                return previous[-1]
         
-        return full_results_path
+        return new_results_path(batch_dir, "batch_full")
     
     def cleanup(self):
         """Очистка ресурсов"""
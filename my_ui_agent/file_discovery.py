@@ -0,0 +1,129 @@
+"""
+Поиск изображений для массового анализа
+
+Вложенные папки обходятся параллельно через os.scandir (по задаче на
+папку в пуле потоков), найденные файлы отдаются генератором сразу, не
+дожидаясь конца обхода, поэтому анализ больших архивов начинается
+немедленно. Фильтрация по расширениям из ANALYSIS_CONFIG['supported_formats']
+или по маске имени, исключения задаются масками fnmatch.
+"""
+import fnmatch
+import logging
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from constants import ANALYSIS_CONFIG
+
+# Служебные папки, которые никогда не содержат скриншотов для анализа
+DEFAULT_EXCLUDES = ('.git', '.ipynb_checkpoints', '__pycache__')
+
+
+def _compile(patterns: Sequence[str]):
+    """Одно регулярное выражение для списка масок fnmatch (или None)"""
+    if not patterns:
+        return None
+    return re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns))
+
+
+class _DirectoryScan:
+    """Параметры обхода, общие для всех задач пула"""
+
+    def __init__(self, root: str, extensions: Optional[Iterable[str]], pattern: Optional[str],
+                 exclude: Sequence[str], follow_symlinks: bool):
+        self.root = root
+        self.extensions = None if pattern else {
+            '.' + ext.lower().lstrip('.') for ext in (extensions or ANALYSIS_CONFIG['supported_formats'])
+        }
+        self.pattern = _compile([pattern]) if pattern else None
+        self.follow_symlinks = follow_symlinks
+
+        # Маски без "/" проверяются по имени, с "/" - по пути от корня
+        exclude = list(DEFAULT_EXCLUDES) + list(exclude)
+        self.exclude_names = _compile([p for p in exclude if '/' not in p])
+        self.exclude_paths = _compile([p for p in exclude if '/' in p])
+
+    def _excluded(self, entry: os.DirEntry) -> bool:
+        """Исключение по имени или по пути относительно корня"""
+        if self.exclude_names and self.exclude_names.match(entry.name):
+            return True
+        if self.exclude_paths:
+            relative = os.path.relpath(entry.path, self.root).replace(os.sep, '/')
+            return bool(self.exclude_paths.match(relative))
+        return False
+
+    def _wanted(self, name: str) -> bool:
+        if self.pattern:
+            return bool(self.pattern.match(os.path.normcase(name)))
+        return os.path.splitext(name)[1].lower() in self.extensions
+
+    def scan(self, directory: str) -> Tuple[List[str], List[str]]:
+        """Файлы и подпапки одной папки"""
+        files, subdirs = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=self.follow_symlinks):
+                            if not self._excluded(entry):
+                                subdirs.append(entry.path)
+                        elif self._wanted(entry.name) and entry.is_file() and not self._excluded(entry):
+                            files.append(entry.path)
+                    except OSError:
+                        continue
+        except OSError as e:
+            logging.warning(f"⚠️ Не удалось прочитать {directory}: {e}")
+        files.sort()
+        return files, subdirs
+
+
+def iter_image_files(root, extensions: Optional[Iterable[str]] = None, pattern: Optional[str] = None,
+                     exclude: Sequence[str] = (), recursive: bool = True, workers: int = 8,
+                     follow_symlinks: bool = False) -> Iterator[Path]:
+    """
+    Ленивый поиск изображений
+
+    Args:
+        root: Корневая папка
+        extensions: Расширения (по умолчанию ANALYSIS_CONFIG['supported_formats']), без учета регистра
+        pattern: Маска имени файла (например, "*.png"); если задана, заменяет extensions
+        exclude: Маски исключаемых файлов и папок - по имени ("*_thumb.png", "tmp")
+                 или по пути от корня ("builds/old/*")
+        recursive: Обходить вложенные папки
+        workers: Число потоков обхода
+        follow_symlinks: Заходить в папки по символическим ссылкам
+
+    Yields:
+        Пути к файлам в порядке обнаружения; внутри папки - по имени
+    """
+    root = str(root)
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"Директория не найдена: {root}")
+
+    scan = _DirectoryScan(root, extensions, pattern, exclude, follow_symlinks)
+
+    if not recursive or workers <= 1:
+        pending_dirs = [root]
+        while pending_dirs:
+            files, subdirs = scan.scan(pending_dirs.pop())
+            for path in files:
+                yield Path(path)
+            if recursive:
+                pending_dirs.extend(reversed(sorted(subdirs)))
+        return
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='discovery')
+    try:
+        running = {executor.submit(scan.scan, root)}
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                running.update(executor.submit(scan.scan, subdir) for subdir in subdirs)
+                for path in files:
+                    yield Path(path)
+    finally:
+        # Потребитель может остановиться раньше (max_files) - незапущенные задачи отменяются
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -1,31 +1,58 @@
 import asyncio
-import json
 import logging
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Union
 
-# Импорты с проверкой доступности
-try:
+from lazy_imports import module_available
+
+# Проверка доступности без импорта torch / anthropic: сами агенты
+# загружают зависимости при первом использовании
+PHI_AVAILABLE = module_available('torch') and module_available('transformers')
+if PHI_AVAILABLE:
     from phi_vision_agent import PhiVisionAgent
-    PHI_AVAILABLE = True
-except ImportError:
-    PHI_AVAILABLE = False
+else:
     logging.warning("Phi Vision недоступен. Установите torch и transformers.")
 
-try:
+CLAUDE_AVAILABLE = module_available('anthropic')
+if CLAUDE_AVAILABLE:
     from claude_vision_agent import ClaudeVisionAgent
-    CLAUDE_AVAILABLE = True
-except ImportError:
-    CLAUDE_AVAILABLE = False
+else:
     logging.warning("Claude Vision недоступен. Установите anthropic.")
 
-from constants import UI_ELEMENTS, GAMING_UI_TAGS
+from config import LOCAL_MODEL_SETTINGS
+from constants import MOBILE_GAMING_UI_TAXONOMY
+from local_vision_agent import LocalVisionAgent
+from roi_analysis import RegionLabeler
+from batch_manifest import BatchManifest, run_with_retries
+from batch_writer import BatchResultWriter, new_results_path
+from result_io import dump_results
+
+# Так ClaudeVisionAgent и PhiVisionAgent возвращают ошибку вместо исключения
+BACKEND_ERROR_PREFIXES = ("Claude analysis error:", "UI comparison error:", "Ошибка анализа изображени")
+
+
+def backend_error(result) -> Optional[str]:
+    """Текст ошибки бэкенда из его результата или None"""
+    if isinstance(result, str) and result.startswith(BACKEND_ERROR_PREFIXES):
+        return result
+    if isinstance(result, dict) and result.get("error"):
+        return str(result["error"])
+    return None
 
 class HybridUIVisionAgent:
-    def __init__(self, anthropic_api_key: str = None, enable_phi: bool = True, enable_claude: bool = True):
+    def __init__(self, anthropic_api_key: str = None, enable_phi: bool = True, enable_claude: bool = True,
+                 enable_local: bool = True):
         self.phi_agent = None
         self.claude_agent = None
+        self.local_agent = None
+        
+        # Локальная модель элементов (обучается командой local_vision_agent.py train);
+        # агент создается и без модели: обученная позже версия подхватится при вызове
+        if enable_local:
+            self.local_agent = LocalVisionAgent()
+            if self.local_agent.is_available():
+                logging.info(f"✅ Локальная модель активирована ({self.local_agent.version})")
         
         # Инициализация Phi Vision
         if enable_phi and PHI_AVAILABLE:
@@ -43,11 +70,19 @@ class HybridUIVisionAgent:
             except Exception as e:
                 logging.error(f"❌ Ошибка инициализации Claude Vision: {str(e)}")
         
-        self.ui_taxonomy = UI_ELEMENTS
-        self.gaming_tags = GAMING_UI_TAGS
+        # Двухэтапный анализ: Claude/Phi размечают только вырезки областей
+        self.region_labeler = RegionLabeler(self.claude_agent, self.phi_agent, self.local_agent)
+        
+        self.gaming_tags = MOBILE_GAMING_UI_TAXONOMY['gaming_specific']
+        self.ui_taxonomy = [
+            tag for category, tags in MOBILE_GAMING_UI_TAXONOMY.items()
+            if category != 'gaming_specific' for tag in tags
+        ]
         
         # Логирование доступных сервисов
         available_services = []
+        if self.local_available():
+            available_services.append("Local model")
         if self.phi_agent:
             available_services.append("Phi Vision")
         if self.claude_agent:
@@ -61,12 +96,21 @@ class HybridUIVisionAgent:
     def get_available_services(self) -> List[str]:
         """Получить список доступных сервисов"""
         services = []
+        if self.local_available():
+            services.append("local")
         if self.phi_agent:
             services.append("phi")
         if self.claude_agent:
             services.append("claude")
         return services
     
+    def local_available(self) -> bool:
+        """Обучена ли локальная модель (проверяется при каждом вызове)"""
+        if self.local_agent is None:
+            return False
+        self.local_agent.reload_if_updated()
+        return self.local_agent.is_available()
+    
     async def analyze_ui_with_claude(self, image_path: str, analysis_type: str = "comprehensive") -> str:
         """Анализ UI через Claude"""
         if not self.claude_agent:
@@ -86,6 +130,14 @@ class HybridUIVisionAgent:
         
         return self.phi_agent.analyze_ui_elements(image_path)
     
+    async def analyze_ui_regions(self, image_path: str) -> Dict:
+        """Теги областей локального детектора по вырезкам (см. roi_analysis)"""
+        return await self.region_labeler.analyze(image_path)
+    
+    async def analyze_ui_regions_many(self, image_paths: List[str]) -> List[Dict]:
+        """Разметка областей нескольких скриншотов на общих листах вырезок"""
+        return await self.region_labeler.analyze_many(image_paths)
+    
     async def smart_ui_analysis(self, image_path: str, strategy: str = "auto") -> Dict:
         """Интеллектуальный UI анализ"""
         results = {
@@ -95,14 +147,29 @@ class HybridUIVisionAgent:
             "available_services": self.get_available_services()
         }
         
+        # Сначала локальная модель: при высокой уверенности внешние бэкенды не нужны
+        if strategy in ("auto", "fallback", "local") and self.local_available():
+            local_result = await asyncio.to_thread(self.local_agent.analyze_ui_elements, image_path)
+            results["local_analysis"] = local_result
+            if strategy == "local" or local_result["confidence"] >= LOCAL_MODEL_SETTINGS['min_confidence']:
+                results["method_used"] = "local_only"
+                results["confidence_score"] = self._calculate_confidence(results)
+                return results
+            logging.info(f"🔄 Уверенность локальной модели {local_result['confidence']:.2f}, "
+                         "передаю изображение внешним бэкендам")
+        
         # Автоматический выбор стратегии
         if strategy == "auto":
             strategy = self._choose_strategy()
         
         # Выполнение анализа согласно стратегии
-        if strategy == "phi" and self.phi_agent:
+        if strategy == "local" and "local_analysis" in results:
+            # Внешних бэкендов нет - остается результат локальной модели при любой уверенности
+            results["method_used"] = "local_only"
+        
+        elif strategy == "phi" and self.phi_agent:
             logging.info("🔄 Анализ через Phi Vision...")
-            results["phi_analysis"] = self.analyze_ui_with_phi(image_path)
+            results["phi_analysis"] = await asyncio.to_thread(self.analyze_ui_with_phi, image_path)
             results["method_used"] = "phi_only"
         
         elif strategy == "claude" and self.claude_agent:
@@ -110,15 +177,24 @@ class HybridUIVisionAgent:
             results["claude_analysis"] = await self.analyze_ui_with_claude(image_path, "comprehensive")
             results["method_used"] = "claude_only"
         
+        elif strategy == "roi" and self.region_labeler.backend:
+            logging.info(f"🔄 Разметка областей через {self.region_labeler.backend}...")
+            results["roi_analysis"] = await self.analyze_ui_regions(image_path)
+            results["method_used"] = "roi"
+        
         elif strategy == "hybrid":
-            # Гибридный анализ
+            # Гибридный анализ: Phi (локально на GPU/CPU) работает в потоке
+            # одновременно с запросом к Claude
+            tasks = {}
             if self.phi_agent:
                 logging.info("🔄 Phi Vision анализ...")
-                results["phi_analysis"] = self.analyze_ui_with_phi(image_path)
+                tasks["phi_analysis"] = asyncio.to_thread(self.analyze_ui_with_phi, image_path)
             
             if self.claude_agent:
                 logging.info("🔄 Claude Vision анализ...")
-                results["claude_analysis"] = await self.analyze_ui_with_claude(image_path, "comprehensive")
+                tasks["claude_analysis"] = self.analyze_ui_with_claude(image_path, "comprehensive")
+            
+            results.update(zip(tasks, await asyncio.gather(*tasks.values())))
             
             results["method_used"] = "hybrid"
             results["combined_insights"] = self._combine_analyses(
@@ -130,7 +206,7 @@ class HybridUIVisionAgent:
             # Попытка с резервным вариантом
             if self.phi_agent:
                 logging.info("🔄 Попытка анализа через Phi Vision...")
-                phi_result = self.analyze_ui_with_phi(image_path)
+                phi_result = await asyncio.to_thread(self.analyze_ui_with_phi, image_path)
                 results["phi_analysis"] = phi_result
                 
                 # Если результат неудовлетворительный, пробуем Claude
@@ -145,6 +221,19 @@ class HybridUIVisionAgent:
                 results["claude_analysis"] = await self.analyze_ui_with_claude(image_path, "comprehensive")
                 results["method_used"] = "claude_only"
         
+        # Ошибки бэкендов (429, сеть) - в error, чтобы пакетный режим повторил изображение;
+        # Phi, замененный Claude в fallback, ошибкой не считается
+        errors = {}
+        for key in ("local_analysis", "phi_analysis", "claude_analysis", "roi_analysis"):
+            if key == "phi_analysis" and results.get("method_used") == "fallback_to_claude":
+                continue
+            error = backend_error(results.get(key))
+            if error:
+                errors[key] = error
+        if errors:
+            results["backend_errors"] = errors
+            results["error"] = "; ".join(errors.values())
+        
         # Расчет confidence score
         results["confidence_score"] = self._calculate_confidence(results)
         
@@ -158,6 +247,8 @@ class HybridUIVisionAgent:
             return "claude"
         elif self.phi_agent:
             return "phi"
+        elif self.local_available():
+            return "local"
         else:
             return "none"
     
@@ -216,38 +307,76 @@ class HybridUIVisionAgent:
             return 0.90
         elif method == "phi_only":
             return 0.75
+        elif method == "roi":
+            return results["roi_analysis"]["confidence"]
+        elif method == "local_only":
+            return results["local_analysis"]["confidence"]
         else:
             return 0.30
     
-    async def batch_ui_analysis(self, image_paths: List[str], use_smart_filtering: bool = True) -> List[Dict]:
-        """Массовый анализ UI скриншотов"""
-        results = []
+    async def batch_ui_analysis(self, image_paths: List[str], use_smart_filtering: bool = True,
+                                output_path: Optional[str] = None, resume: bool = False,
+                                return_results: bool = True,
+                                manifest_path: Optional[str] = None) -> List[Dict]:
+        """
+        Массовый анализ UI скриншотов
         
-        for i, image_path in enumerate(image_paths):
-            logging.info(f"📸 Обрабатываю {i+1}/{len(image_paths)}: {Path(image_path).name}")
-            
-            try:
-                if use_smart_filtering:
-                    # Умная фильтрация: сначала быстрый анализ
-                    result = await self.smart_ui_analysis(image_path, "fallback")
-                else:
-                    # Полный гибридный анализ для всех
-                    result = await self.smart_ui_analysis(image_path, "hybrid")
+        Args:
+            image_paths: Пути к изображениям
+            use_smart_filtering: Быстрый анализ вместо полного гибридного
+            output_path: JSONL-файл, куда результаты пишутся по мере готовности
+            resume: Пропустить изображения, уже успешно записанные в output_path
+            return_results: Вернуть результаты списком; False - только запись в файл
+            manifest_path: Манифест пакета (см. batch_manifest); при повторном запуске
+                           обрабатываются только новые, измененные и упавшие изображения
+        """
+        manifest = None
+        if manifest_path:
+            manifest = BatchManifest(manifest_path)
+            image_paths = manifest.plan(image_paths)
+        
+        if output_path is None:
+            output_path = new_results_path("analysis_results", "batch_ui_analysis")
+        
+        results = []
+        with BatchResultWriter(output_path, resume=resume) as writer:
+            for i, image_path in enumerate(image_paths):
+                if writer.is_done(image_path):
+                    continue
                 
-                results.append(result)
+                logging.info(f"📸 Обрабатываю {i+1}/{len(image_paths)}: {Path(image_path).name}")
                 
-            except Exception as e:
-                logging.error(f"Ошибка обработки {image_path}: {str(e)}")
-                results.append({
-                    "image_path": str(image_path),
-                    "error": str(e),
-                    "timestamp": datetime.now().isoformat()
-                })
+                # Умная фильтрация: сначала быстрый анализ; иначе полный гибридный для всех
+                strategy = "fallback" if use_smart_filtering else "hybrid"
+                result = await run_with_retries(
+                    lambda: self.smart_ui_analysis(image_path, strategy), image_path, manifest
+                )
+                
+                offset = writer.write(result)
+                if manifest:
+                    if "error" in result:
+                        manifest.mark_failed(image_path, result["error"], writer.results_path, offset)
+                    else:
+                        manifest.mark_done(image_path, writer.results_path, offset)
+                if return_results:
+                    results.append(result)
         
+        if manifest:
+            manifest.save()
+        logging.info(f"💾 Результаты пакета: {writer.results_path}")
         return results
     
-    def save_analysis_results(self, results: Union[Dict, List[Dict]], output_dir: str = "analysis_results"):
-        """Сохранение результатов анализа"""
+    def save_analysis_results(self, results: Union[Dict, List[Dict]], output_dir: str = "analysis_results",
+                              fmt: Optional[str] = None, compression: Optional[str] = 'default'):
+        """
+        Сохранение результатов анализа
+        
+        Args:
+            results: Одиночный результат или список результатов
+            output_dir: Папка для сохранения
+            fmt: json / msgpack / cbor (по умолчанию из SERIALIZATION_SETTINGS)
+            compression: None / gzip / zstd (по умолчанию из SERIALIZATION_SETTINGS)
+        """
         output_path = Path(output_dir)
         output_path.mkdir(parents=True, exist_ok=True)
         
@@ -255,15 +384,12 @@ class HybridUIVisionAgent:
         
         if isinstance(results, dict):
             # Одиночный результат
-            filename = f"ui_analysis_{timestamp}.json"
+            filename = f"ui_analysis_{timestamp}"
         else:
             # Массовые результаты
-            filename = f"batch_ui_analysis_{timestamp}.json"
-        
-        filepath = output_path / filename
+            filename = f"batch_ui_analysis_{timestamp}"
         
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(results, f, ensure_ascii=False, indent=2)
+        filepath = dump_results(results, output_path / filename, fmt, compression)
         
         logging.info(f"💾 Результаты сохранены: {filepath}")
         return filepath
@@ -0,0 +1,356 @@
+"""
+Пирамида копий изображений и HTTP-кэширование их отдачи
+
+Каждое изображение один раз раскладывается в хранилище по хешу
+содержимого (RENDITIONS_FOLDER/<ab>/<sha256>/): оригинал (жесткая
+ссылка, иначе копия) и копии из IMAGE_SERVING_SETTINGS['renditions'] -
+превью страницы аннотации, копия для Claude, миниатюра и маленькая
+копия для анализа цветов. Копии строятся цепочкой от большей к меньшей,
+одним проходом на изображение; веб-приложение запускает это в фоне
+сразу после загрузки (prefetch_renditions), параллельно с анализом.
+Потребители берут нужный размер через get_rendition и сами больше ничего
+не уменьшают.
+
+Содержимое по адресу /media/<sha256>/<вид> никогда не меняется, поэтому
+отдается с Cache-Control: immutable - браузер больше его не запрашивает.
+Файлы /uploads отдаются с сильным ETag по тому же хешу: повторный
+просмотр обходится ответом 304 без тела.
+
+Использование:
+    python image_renditions.py    # копии для уже собранного датасета
+"""
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+from batch_manifest import file_sha256
+from config import Config, IMAGE_SERVING_SETTINGS
+
+ORIGINAL = 'original'
+META_FILENAME = 'meta.json'
+
+_HEX_DIGITS = frozenset('0123456789abcdef')
+
+# Хеши по подписи файла (путь, размер, mtime_ns): повторные запросы не перечитывают файл
+_digest_cache: Dict[Tuple[str, int, int], str] = {}
+_DIGEST_CACHE_LIMIT = 4096
+
+# Метаданные готовых копий: содержимое по хешу неизменно, кэш не устаревает
+_meta_cache: Dict[str, Dict] = {}
+_cache_lock = threading.Lock()
+
+# Фоновое создание копий: пул потоков процесса и задачи в работе по хешу
+_executor: Optional[ThreadPoolExecutor] = None
+_pending: Dict[str, Future] = {}
+
+
+def content_digest(path) -> str:
+    """SHA-256 содержимого файла с кэшем по размеру и времени изменения"""
+    path = str(path)
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    digest = _digest_cache.get(key)
+    if digest is None:
+        digest = file_sha256(path)
+        with _cache_lock:
+            if len(_digest_cache) >= _DIGEST_CACHE_LIMIT:
+                _digest_cache.clear()
+            _digest_cache[key] = digest
+    return digest
+
+
+def cached_digest(path) -> Optional[str]:
+    """Хеш файла, если он уже посчитан в этом процессе, иначе None (файл не читается)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _digest_cache.get((str(path), stat.st_size, stat.st_mtime_ns))
+
+
+def is_valid_digest(digest: str) -> bool:
+    return len(digest) == 64 and set(digest) <= _HEX_DIGITS
+
+
+def rendition_dir(digest: str, root=None) -> Path:
+    """Папка копий изображения (двухсимвольный префикс против огромных каталогов)"""
+    return Path(root or Config.RENDITIONS_FOLDER) / digest[:2] / digest
+
+
+def load_meta(digest: str, root=None) -> Optional[Dict]:
+    """Метаданные копий или None, если копии еще не созданы"""
+    meta = _meta_cache.get(digest)
+    if meta is not None or not is_valid_digest(digest):
+        return meta
+    try:
+        with open(rendition_dir(digest, root) / META_FILENAME, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    with _cache_lock:
+        _meta_cache[digest] = meta
+    return meta
+
+
+def _is_complete(meta: Optional[Dict]) -> bool:
+    """Есть ли в метаданных все виды из текущих настроек"""
+    return meta is not None and set(IMAGE_SERVING_SETTINGS['renditions']) <= set(meta['files'])
+
+
+def rendition_path(digest: str, kind: str, root=None) -> Optional[Path]:
+    """Файл копии kind ('original', 'thumb', 'preview', ...) или None"""
+    meta = load_meta(digest, root)
+    if meta is None or kind not in meta['files']:
+        return None
+    return rendition_dir(digest, root) / meta['files'][kind]
+
+
+def _link_or_copy(source: Path, target: Path):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _web_mode(image: Image.Image) -> Image.Image:
+    """Приведение режима к поддерживаемому WEBP/JPEG (RGB или RGBA)"""
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def _save_rendition(image: Image.Image, path: Path, options: Dict):
+    image_format = options.get('format', IMAGE_SERVING_SETTINGS['rendition_format'])
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.save(path, image_format, quality=options.get('quality', IMAGE_SERVING_SETTINGS['rendition_quality']))
+
+
+def _build_renditions(source: Path, digest: str, staging: Path) -> Dict:
+    """Оригинал и все копии в папке staging; возвращает метаданные"""
+    original_name = ORIGINAL + source.suffix.lower()
+    _link_or_copy(source, staging / original_name)
+    files = {ORIGINAL: original_name}
+
+    with Image.open(source) as image:
+        width, height = image.size
+        # От большей копии к меньшей: каждая следующая уменьшается из предыдущей
+        current = None
+        renditions = IMAGE_SERVING_SETTINGS['renditions']
+        for kind, options in sorted(renditions.items(), key=lambda item: -item[1]['max_side']):
+            max_side = options['max_side']
+            if max(width, height) <= max_side:
+                files[kind] = original_name
+                continue
+            if current is None:
+                image.draft('RGB', (max_side, max_side))  # JPEG декодируется сразу в уменьшенном виде
+                current = _web_mode(image)
+            current = current.copy()
+            current.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+            extension = '.' + options.get('format', IMAGE_SERVING_SETTINGS['rendition_format']).lower()
+            _save_rendition(current, staging / f"{kind}{extension}", options)
+            files[kind] = f"{kind}{extension}"
+
+    meta = {'digest': digest, 'width': width, 'height': height, 'files': files}
+    with open(staging / META_FILENAME, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def ensure_renditions(source, root=None) -> Dict:
+    """
+    Создает оригинал и все копии изображения в хранилище по хешу
+
+    Повторный вызов для того же содержимого ничего не делает. Копии
+    пишутся во временную папку и появляются одним переименованием, так
+    что параллельные вызовы не видят их недописанными. Если настройки
+    пополнились новыми видами, папка пересобирается целиком.
+
+    Returns:
+        Метаданные: digest, width, height и files (вид -> имя файла).
+        Копии не увеличивают изображение: если оно меньше размера копии,
+        вид ссылается на оригинал.
+    """
+    source = Path(source)
+    digest = content_digest(source)
+    meta = load_meta(digest, root)
+    if _is_complete(meta):
+        return meta
+
+    directory = rendition_dir(digest, root)
+    suffix = f"{os.getpid()}.{threading.get_ident()}"
+    staging = directory.with_name(f".{digest}.{suffix}.tmp")
+    outdated = directory.with_name(f".{digest}.{suffix}.old")
+    staging.mkdir(parents=True, exist_ok=True)
+    try:
+        _build_renditions(source, digest, staging)
+        if meta is not None:
+            # Папка без новых видов: убираем в сторону и заменяем
+            with _cache_lock:
+                _meta_cache.pop(digest, None)
+            try:
+                os.rename(directory, outdated)
+            except OSError:
+                pass  # Уже заменил параллельный вызов
+        try:
+            os.rename(staging, directory)
+        except OSError:
+            # Те же копии уже создал параллельный вызов
+            if not _is_complete(load_meta(digest, root)):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(outdated, ignore_errors=True)
+
+    return load_meta(digest, root)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _cache_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=IMAGE_SERVING_SETTINGS['pyramid_workers'],
+                                           thread_name_prefix='pyramid')
+        return _executor
+
+
+def prefetch_renditions(source, root=None) -> Future:
+    """
+    Создание копий в фоновом потоке
+
+    Повторный вызов для того же содержимого, пока задача не завершилась,
+    возвращает ту же задачу.
+
+    Returns:
+        Future с метаданными копий (см. ensure_renditions)
+    """
+    digest = content_digest(source)
+    with _cache_lock:
+        future = _pending.get(digest)
+        if future is not None:
+            return future
+    meta = load_meta(digest, root)
+    if _is_complete(meta):
+        future = Future()
+        future.set_result(meta)
+        return future
+
+    executor = _get_executor()
+    with _cache_lock:
+        future = _pending.get(digest)
+        if future is None:
+            future = executor.submit(ensure_renditions, source, root)
+            _pending[digest] = future
+            future.add_done_callback(lambda _: _pending.pop(digest, None))
+    return future
+
+
+def get_rendition(source, kind: str, root=None) -> Path:
+    """
+    Файл копии kind для изображения source
+
+    Готовая копия берется из хранилища, создаваемая в фоне - дожидается,
+    иначе копии создаются в текущем потоке.
+
+    Raises:
+        KeyError: неизвестный вид копии
+    """
+    if kind != ORIGINAL and kind not in IMAGE_SERVING_SETTINGS['renditions']:
+        raise KeyError(f"Неизвестный вид копии: {kind}")
+    digest = content_digest(source)
+    meta = load_meta(digest, root)
+    if not _is_complete(meta):
+        future = _pending.get(digest)
+        meta = future.result() if future is not None else ensure_renditions(source, root)
+    return rendition_dir(digest, root) / meta['files'][kind]
+
+
+def existing_rendition(source, kind: str, root=None) -> Optional[Path]:
+    """
+    Копия kind, если она уже есть или создается в фоне, иначе None
+
+    Ничего не создает и не хеширует файл: копия находится только для
+    изображений, которые в этом процессе уже прошли через
+    prefetch_renditions / get_rendition (загрузки веб-приложения).
+    """
+    digest = cached_digest(source)
+    if digest is None:
+        return None
+    future = _pending.get(digest)
+    try:
+        meta = future.result() if future is not None else load_meta(digest, root)
+    except OSError:
+        return None
+    if meta is None or kind not in meta['files']:
+        return None
+    return rendition_dir(digest, root) / meta['files'][kind]
+
+
+def image_info(meta: Dict) -> Dict:
+    """Сведения об изображении для данных сессии и шаблонов"""
+    return {'digest': meta['digest'], 'width': meta['width'], 'height': meta['height']}
+
+
+def set_immutable(response):
+    """Заголовки для адресов по хешу содержимого"""
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_SERVING_SETTINGS['immutable_max_age']
+    response.cache_control.immutable = True
+    return response
+
+
+def set_revalidate(response):
+    """Заголовки для изменяемых адресов: кэшировать, но проверять ETag"""
+    response.cache_control.no_cache = True
+    response.cache_control.max_age = None
+    return response
+
+
+def backfill_dataset(dataset_dir=None) -> int:
+    """
+    Копии для записей датасета, сохраненных до появления хранилища
+
+    Хеш изображения дописывается в data.json записи (image_sha256).
+
+    Returns:
+        Число обновленных записей
+    """
+    from dataset_entries import DATA_FILENAME, entry_image_path, iter_entry_dirs, load_entry
+
+    updated = 0
+    for entry_dir in iter_entry_dirs(dataset_dir):
+        data = load_entry(entry_dir)
+        if data is None or data.get('image_sha256'):
+            continue
+        image_path = entry_image_path(entry_dir, data)
+        if image_path is None:
+            continue
+        try:
+            data['image_sha256'] = ensure_renditions(image_path)['digest']
+        except OSError as e:
+            logging.warning(f"⚠️ {entry_dir.name}: {e}")
+            continue
+
+        tmp_path = entry_dir / f"{DATA_FILENAME}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, entry_dir / DATA_FILENAME)
+        updated += 1
+
+    return updated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    count = backfill_dataset(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"✅ Копии созданы для {count} записей")
@@ -0,0 +1,34 @@
+"""
+Отложенный импорт тяжелых необязательных зависимостей
+
+google-cloud-vision, anthropic, torch и transformers импортируются
+секундами, поэтому модули агентов проверяют их наличие через
+module_available (поиск спецификации без выполнения модуля), а сам
+импорт делают при первом использовании бэкенда через import_optional.
+"""
+import importlib
+import importlib.util
+from functools import lru_cache
+from typing import Optional
+
+
+@lru_cache(maxsize=None)
+def module_available(name: str) -> bool:
+    """Установлен ли модуль (без его импорта)"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def import_optional(name: str, install_hint: Optional[str] = None):
+    """
+    Импорт необязательной зависимости
+
+    Raises:
+        ImportError: с подсказкой, какой пакет установить
+    """
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        raise ImportError(f"{name} не установлен. Установите: pip install {install_hint or name}") from e
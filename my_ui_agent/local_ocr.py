@@ -0,0 +1,178 @@
+"""
+Локальное распознавание текста (Tesseract) без обращений к Google Vision
+
+Результат в той же схеме, что text_elements агента:
+    [{'text': ..., 'bounds': [(x, y), ...], 'confidence': 0..1}, ...]
+
+Основная цена вызова Tesseract - запуск процесса и разбор страницы,
+поэтому:
+  - распознавание только в областях (рамки детектора) выполняется одним
+    вызовом: вырезанные области укладываются столбиком на общую полосу,
+    слова раскладываются обратно по областям и переводятся в координаты
+    исходного изображения;
+  - пакет изображений распознается параллельно в пуле потоков (каждый
+    вызов - отдельный процесс tesseract, GIL не мешает).
+
+Требуется pytesseract и установленный tesseract (apt install tesseract-ocr).
+"""
+import logging
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config import OCR_SETTINGS
+from lazy_imports import import_optional, module_available
+
+HAS_TESSERACT = module_available('pytesseract') and shutil.which(OCR_SETTINGS['tesseract_cmd']) is not None
+
+# Область на полосе: (смещение y на полосе, высота, масштаб, x1 и y1 области в исходном изображении)
+_Placement = Tuple[int, int, float, int, int]
+
+
+def ocr_available() -> bool:
+    return HAS_TESSERACT
+
+
+class LocalOCR:
+    """Распознавание текста Tesseract в схеме text_elements"""
+
+    def __init__(self, languages: Optional[str] = None, settings: Optional[Dict] = None):
+        self.settings = {**OCR_SETTINGS, **(settings or {})}
+        self.languages = languages or self.settings['languages']
+        self._pytesseract = import_optional('pytesseract')
+        self._pytesseract.pytesseract.tesseract_cmd = self.settings['tesseract_cmd']
+
+    def _words(self, image: Image.Image, psm: int) -> List[Dict]:
+        """Слова одного вызова tesseract: текст, рамка (x1, y1, x2, y2), уверенность"""
+        data = self._pytesseract.image_to_data(
+            image, lang=self.languages, config=f"--psm {psm}",
+            output_type=self._pytesseract.Output.DICT
+        )
+        words = []
+        min_confidence = self.settings['min_confidence'] * 100
+        for text, conf, left, top, width, height in zip(data['text'], data['conf'], data['left'],
+                                                        data['top'], data['width'], data['height']):
+            conf = float(conf)
+            text = text.strip()
+            if not text or conf < min_confidence:
+                continue
+            words.append({'text': text, 'box': (left, top, left + width, top + height),
+                          'confidence': round(conf / 100, 4)})
+        return words
+
+    @staticmethod
+    def _element(text: str, box: Sequence[float], confidence: float) -> Dict:
+        x1, y1, x2, y2 = (int(round(v)) for v in box)
+        return {'text': text, 'bounds': [(x1, y1), (x2, y1), (x2, y2), (x1, y2)], 'confidence': confidence}
+
+    def recognize(self, image: Image.Image, regions: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Текст изображения или только его областей
+
+        Args:
+            image: Изображение (PIL)
+            regions: Рамки (N, 4) [x1, y1, x2, y2], в которых искать текст
+                     (например, предложенные детектором); None - все изображение
+        """
+        image = image.convert('L')
+        if regions is None:
+            return [self._element(word['text'], word['box'], word['confidence'])
+                    for word in self._words(image, self.settings['page_psm'])]
+
+        elements = []
+        for strip, placements in self._pack_regions(image, np.asarray(regions).reshape(-1, 4)):
+            elements.extend(self._unpack_words(self._words(strip, self.settings['region_psm']), placements))
+        return elements
+
+    def _pack_regions(self, image: Image.Image, regions: np.ndarray) -> Iterable[Tuple[Image.Image, List[_Placement]]]:
+        """
+        Области столбиком на белых полосах ограниченной высоты
+
+        Мелкие области увеличиваются до min_text_height: tesseract плохо
+        читает текст ниже ~20 пикселей.
+        """
+        padding = self.settings['region_padding']
+        gap = self.settings['strip_gap']
+        min_height = self.settings['min_text_height']
+        max_strip_height = self.settings['max_strip_height']
+
+        crops: List[Tuple[Image.Image, float, int, int]] = []
+        for x1, y1, x2, y2 in regions.tolist():
+            x1, y1 = max(0, int(x1) - padding), max(0, int(y1) - padding)
+            x2, y2 = min(image.width, int(x2) + padding), min(image.height, int(y2) + padding)
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                continue
+            crop = image.crop((x1, y1, x2, y2))
+            scale = min(self.settings['max_region_upscale'], max(1.0, min_height / crop.height))
+            if scale > 1.0:
+                crop = crop.resize((round(crop.width * scale), round(crop.height * scale)), Image.BICUBIC)
+            crops.append((crop, scale, x1, y1))
+
+        batch: List[Tuple[Image.Image, float, int, int]] = []
+        height = gap
+        for crop in crops + [None]:
+            if crop is None or (batch and height + crop[0].height + gap > max_strip_height):
+                if batch:
+                    yield self._strip(batch, gap)
+                batch, height = [], gap
+            if crop is not None:
+                batch.append(crop)
+                height += crop[0].height + gap
+
+    @staticmethod
+    def _strip(batch: List[Tuple[Image.Image, float, int, int]], gap: int) -> Tuple[Image.Image, List[_Placement]]:
+        width = max(crop.width for crop, _, _, _ in batch) + 2 * gap
+        height = sum(crop.height for crop, _, _, _ in batch) + gap * (len(batch) + 1)
+        strip = Image.new('L', (width, height), 255)
+        placements = []
+        y = gap
+        for crop, scale, x1, y1 in batch:
+            strip.paste(crop, (gap, y))
+            placements.append((y, crop.height, scale, x1, y1))
+            y += crop.height + gap
+        return strip, placements
+
+    def _unpack_words(self, words: List[Dict], placements: List[_Placement]) -> List[Dict]:
+        """Слова полосы -> элементы в координатах исходного изображения"""
+        gap = self.settings['strip_gap']
+        offsets = np.array([offset for offset, _, _, _, _ in placements])
+        elements = []
+        for word in words:
+            wx1, wy1, wx2, wy2 = word['box']
+            center = (wy1 + wy2) / 2
+            index = int(np.searchsorted(offsets, center, side='right')) - 1
+            if index < 0:
+                continue
+            offset, crop_height, scale, x1, y1 = placements[index]
+            if center > offset + crop_height:
+                continue  # в промежутке между областями
+            box = (x1 + (wx1 - gap) / scale, y1 + (wy1 - offset) / scale,
+                   x1 + (wx2 - gap) / scale, y1 + (wy2 - offset) / scale)
+            elements.append(self._element(word['text'], box, word['confidence']))
+        return elements
+
+    def recognize_many(self, images: Sequence[Image.Image],
+                       regions: Optional[Sequence[Optional[np.ndarray]]] = None,
+                       workers: Optional[int] = None) -> List[List[Dict]]:
+        """
+        Пакетное распознавание: по процессу tesseract на изображение, параллельно
+
+        Returns:
+            text_elements каждого изображения в порядке images
+        """
+        regions = regions if regions is not None else [None] * len(images)
+        workers = workers or self.settings['workers']
+
+        def run(args):
+            image, image_regions = args
+            try:
+                return self.recognize(image, image_regions)
+            except Exception as e:
+                logging.warning(f"⚠️ Локальное распознавание текста не удалось: {e}")
+                return []
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr') as executor:
+            return list(executor.map(run, zip(images, regions)))
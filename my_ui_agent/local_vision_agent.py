@@ -0,0 +1,263 @@
+"""
+Локальная модель элементов: обучение по датасету и бэкенд анализа
+
+Аннотации, сохраненные через /save_annotations, попадают в
+training_dataset. Команда train обучает по ним компактную модель
+element_classifier (признаки рамок + логистическая регрессия, только
+CPU) и сохраняет ее новой версией:
+
+    models/element_classifier/v0003/model.npz
+    models/element_classifier/v0003/meta.json   # точность, число примеров, теги
+    models/element_classifier/CURRENT           # имя текущей версии
+
+LocalVisionAgent отдает эту модель как бэкенд анализа: рамки предлагает
+локальный детектор UIAnalysisAgent, модель ставит теги за миллисекунды.
+HybridUIVisionAgent обращается к нему первым и передает изображение
+Phi/Claude только при низкой уверенности. Новая версия подхватывается
+работающими процессами без перезапуска.
+
+Использование:
+    python local_vision_agent.py train [--dataset DIR]
+    python local_vision_agent.py versions
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from box_ops import to_boxes
+from config import Config, LOCAL_MODEL_SETTINGS
+from element_classifier import ElementClassifier, classify_boxes, dataset_samples
+
+MODEL_FILENAME = 'model.npz'
+META_FILENAME = 'meta.json'
+CURRENT_FILENAME = 'CURRENT'
+
+
+def models_root(models_dir=None) -> Path:
+    """Папка версий модели"""
+    return Path(models_dir or Config.MODELS_FOLDER) / LOCAL_MODEL_SETTINGS['model_name']
+
+
+def list_versions(models_dir=None) -> List[Dict]:
+    """Метаданные всех версий, от старой к новой"""
+    root = models_root(models_dir)
+    if not root.exists():
+        return []
+    versions = []
+    for version_dir in sorted(root.glob('v[0-9]*')):
+        try:
+            with open(version_dir / META_FILENAME, 'r', encoding='utf-8') as f:
+                versions.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return versions
+
+
+def current_version(models_dir=None) -> Optional[str]:
+    """Имя текущей версии или None, если модель еще не обучалась"""
+    try:
+        return (models_root(models_dir) / CURRENT_FILENAME).read_text(encoding='utf-8').strip() or None
+    except OSError:
+        return None
+
+
+def _set_current(root: Path, version: str):
+    tmp_path = root / f"{CURRENT_FILENAME}.tmp"
+    tmp_path.write_text(version, encoding='utf-8')
+    os.replace(tmp_path, root / CURRENT_FILENAME)
+
+
+def _holdout_accuracy(features: np.ndarray, labels: List[str], ratio: float) -> Optional[float]:
+    """Точность на отложенной части (перемешивание с фиксированным seed)"""
+    holdout = int(len(labels) * ratio)
+    if holdout == 0:
+        return None
+    order = np.random.default_rng(0).permutation(len(labels))
+    test, train = order[:holdout], order[holdout:]
+    train_labels = [labels[i] for i in train]
+    if len(set(train_labels)) < 2:
+        return None
+    model = ElementClassifier.fit(features[train], train_labels)
+    predicted, _ = model.predict(features[test])
+    return float(np.mean([p == labels[i] for p, i in zip(predicted, test)]))
+
+
+def train_model(dataset_dir=None, models_dir=None) -> Dict:
+    """
+    Обучение новой версии модели по проверенным меткам датасета
+
+    Точность оценивается на отложенной части, итоговая модель обучается
+    на всех примерах. Версия становится текущей, если ее точность не ниже
+    LOCAL_MODEL_SETTINGS['min_accuracy'].
+
+    Returns:
+        Метаданные версии
+
+    Raises:
+        ValueError: недостаточно проверенных элементов
+    """
+    settings = LOCAL_MODEL_SETTINGS
+    features, labels = dataset_samples(dataset_dir)
+    if len(labels) < settings['min_samples']:
+        raise ValueError(f"Недостаточно проверенных элементов: {len(labels)} < {settings['min_samples']}")
+
+    accuracy = _holdout_accuracy(features, labels, settings['holdout_ratio'])
+    model = ElementClassifier.fit(features, labels)
+
+    root = models_root(models_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    existing = [int(path.name[1:]) for path in root.glob('v[0-9]*') if path.name[1:].isdigit()]
+    version = f"v{max(existing, default=0) + 1:04d}"
+
+    staging = root / f".{version}.tmp"
+    staging.mkdir()
+    meta = {
+        'version': version,
+        'created': datetime.now().isoformat(),
+        'samples': len(labels),
+        'class_counts': dict(Counter(labels).most_common()),
+        'holdout_accuracy': accuracy,
+        'dataset_dir': str(dataset_dir or Config.DATASET_FOLDER)
+    }
+    model.save(staging / MODEL_FILENAME)
+    with open(staging / META_FILENAME, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.rename(staging, root / version)
+
+    meta['current'] = accuracy is None or accuracy >= settings['min_accuracy']
+    if meta['current']:
+        _set_current(root, version)
+    else:
+        logging.warning(f"⚠️ {version}: точность {accuracy:.3f} ниже порога, текущая версия не изменена")
+
+    # Старые версии, кроме текущей
+    current = current_version(models_dir)
+    for old in [v['version'] for v in list_versions(models_dir)][:-settings['keep_versions']]:
+        if old != current:
+            shutil.rmtree(root / old, ignore_errors=True)
+
+    logging.info(f"✅ Модель {version}: {len(labels)} примеров, точность {accuracy}")
+    return meta
+
+
+class LocalVisionAgent:
+    """Бэкенд анализа на локальной модели элементов"""
+
+    def __init__(self, models_dir=None):
+        self.models_dir = models_dir
+        self.model: Optional[ElementClassifier] = None
+        self.version: Optional[str] = None
+        self._current_mtime: Optional[int] = None
+        self._lock = threading.Lock()
+        self._detector = None
+        self.reload_if_updated()
+
+    def is_available(self) -> bool:
+        return self.model is not None
+
+    def reload_if_updated(self) -> bool:
+        """Загрузка новой текущей версии, если она появилась (одна проверка stat)"""
+        try:
+            mtime = (models_root(self.models_dir) / CURRENT_FILENAME).stat().st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._current_mtime:
+            return False
+
+        with self._lock:
+            version = current_version(self.models_dir)
+            try:
+                self.model = ElementClassifier.load(models_root(self.models_dir) / version / MODEL_FILENAME)
+            except (OSError, ValueError, TypeError) as e:
+                self._current_mtime = mtime  # не повторять попытку до следующей версии
+                logging.error(f"❌ Не удалось загрузить локальную модель {version}: {e}")
+                return False
+            self.version = version
+            self._current_mtime = mtime
+        logging.info(f"✅ Локальная модель элементов {version} загружена")
+        return True
+
+    @property
+    def detector(self):
+        """Локальный детектор рамок (без обращений к внешним API)"""
+        if self._detector is None:
+            from agent import UIAnalysisAgent
+            self._detector = UIAnalysisAgent()
+        return self._detector
+
+    def analyze_ui_elements(self, image_path: str) -> Dict:
+        """
+        Рамки локального детектора с тегами модели
+
+        Returns:
+            elements (bounds, type, confidence), summary, confidence
+            (средняя по элементам) и model_version
+        """
+        self.reload_if_updated()
+        if self.model is None:
+            return {'error': 'Локальная модель не обучена', 'confidence': 0.0}
+
+        with Image.open(image_path) as image:
+            image.load()
+            proposals = self.detector._find_ui_elements(image)
+            tags, confidence = classify_boxes(image, to_boxes(proposals), model=self.model)
+
+        elements = [
+            {'bounds': proposal['bounds'], 'type': tag, 'confidence': round(float(score), 4)}
+            for proposal, tag, score in zip(proposals, tags, confidence)
+        ]
+        counts = Counter(tags)
+        return {
+            'elements': elements,
+            'summary': ', '.join(f"{tag}: {count}" for tag, count in counts.most_common()),
+            'confidence': float(confidence.mean()) if len(elements) else 0.0,
+            'model_version': self.version
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Локальная модель элементов интерфейса")
+    commands = parser.add_subparsers(dest='command', required=True)
+    train = commands.add_parser('train', help="обучить новую версию по training_dataset")
+    train.add_argument('--dataset', default=None, help="папка датасета")
+    train.add_argument('--models', default=None, help="папка версий моделей")
+    versions = commands.add_parser('versions', help="список версий")
+    versions.add_argument('--models', default=None, help="папка версий моделей")
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        try:
+            meta = train_model(args.dataset, args.models)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        accuracy = meta['holdout_accuracy']
+        accuracy_text = f"{accuracy:.3f}" if accuracy is not None else "не оценена"
+        print(f"✅ {meta['version']}: {meta['samples']} примеров, точность {accuracy_text}"
+              f"{'' if meta['current'] else ' (не активирована)'}")
+        return 0
+
+    current = current_version(args.models)
+    for meta in list_versions(args.models):
+        marker = '*' if meta['version'] == current else ' '
+        accuracy = meta['holdout_accuracy']
+        accuracy_text = f"{accuracy:.3f}" if accuracy is not None else "-"
+        print(f"{marker} {meta['version']}  {meta['created'][:19]}  {meta['samples']} примеров  "
+              f"точность {accuracy_text}")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
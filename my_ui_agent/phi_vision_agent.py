@@ -1,24 +1,45 @@
-import torch
-from transformers import AutoModelForCausalLM, AutoProcessor
 from PIL import Image
-import requests
 import logging
 
+from lazy_imports import import_optional
+
+# torch, transformers и requests импортируются при первом использовании модели:
+# импорт torch занимает секунды и не нужен, пока Phi не вызван
+
 class PhiVisionAgent:
     def __init__(self, model_name="microsoft/Phi-3.5-vision-instruct"):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._device = None
         self.model = None
         self.processor = None
         self.model_name = model_name
         self.initialized = False
         
-        logging.info(f"PhiVisionAgent инициализирован для устройства: {self.device}")
+        logging.info(f"PhiVisionAgent инициализирован (модель {model_name} загрузится при первом запросе)")
+    
+    @property
+    def device(self):
+        """Устройство для модели (определяется при первом обращении)"""
+        if self._device is None:
+            torch = import_optional('torch')
+            self._device = "cuda" if torch.cuda.is_available() else "cpu"
+        return self._device
+    
+    def _open_image(self, path):
+        """Открытие изображения из файла или по URL"""
+        if path.startswith('http'):
+            requests = import_optional('requests')
+            return Image.open(requests.get(path, stream=True).raw)
+        return Image.open(path)
     
     def _lazy_load_model(self):
         """Ленивая загрузка модели для экономии памяти"""
         if not self.initialized:
             try:
-                logging.info(f"Загрузка модели {self.model_name}...")
+                logging.info(f"Загрузка модели {self.model_name} на {self.device}...")
+                torch = import_optional('torch')
+                transformers = import_optional('transformers')
+                AutoModelForCausalLM = transformers.AutoModelForCausalLM
+                AutoProcessor = transformers.AutoProcessor
                 
                 # Загрузка модели и процессора
                 self.model = AutoModelForCausalLM.from_pretrained(
@@ -43,61 +64,70 @@ class PhiVisionAgent:
                 logging.error(f"Ошибка загрузки модели Phi Vision: {str(e)}")
                 raise
     
+    def _generate(self, images, prompt, max_new_tokens=500):
+        """Ответ модели на изображения PIL и промпт"""
+        self._lazy_load_model()
+        
+        # Подготовка входных данных
+        image_tokens = " ".join([f"<|image_{i+1}|>" for i in range(len(images))])
+        messages = [
+            {"role": "user", "content": f"{image_tokens}\n{prompt}"}
+        ]
+        
+        # Обработка
+        inputs = self.processor.tokenizer.apply_chat_template(
+            messages, 
+            tokenize=False, 
+            add_generation_prompt=True
+        )
+        
+        inputs = self.processor(
+            inputs, 
+            list(images), 
+            return_tensors="pt"
+        ).to(self.device)
+        
+        # Генерация ответа
+        torch = import_optional('torch')
+        with torch.no_grad():
+            outputs = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                do_sample=True,
+                temperature=0.7,
+                pad_token_id=self.processor.tokenizer.eos_token_id
+            )
+        
+        # Декодирование результата
+        response = self.processor.decode(
+            outputs[0], 
+            skip_special_tokens=True
+        )
+        
+        # Извлечение ответа ассистента
+        if "assistant" in response:
+            return response.split("assistant")[-1].strip()
+        else:
+            return response.strip()
+    
     def analyze_image(self, image_path, prompt="Describe this image"):
         """Анализ изображения с помощью Phi Vision"""
         try:
             self._lazy_load_model()
-            
-            # Загрузка изображения
-            if image_path.startswith('http'):
-                image = Image.open(requests.get(image_path, stream=True).raw)
-            else:
-                image = Image.open(image_path)
-            
-            # Подготовка входных данных
-            messages = [
-                {"role": "user", "content": f"<|image_1|>\n{prompt}"}
-            ]
-            
-            # Обработка
-            inputs = self.processor.tokenizer.apply_chat_template(
-                messages, 
-                tokenize=False, 
-                add_generation_prompt=True
-            )
-            
-            inputs = self.processor(
-                inputs, 
-                [image], 
-                return_tensors="pt"
-            ).to(self.device)
-            
-            # Генерация ответа
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=500,
-                    do_sample=True,
-                    temperature=0.7,
-                    pad_token_id=self.processor.tokenizer.eos_token_id
-                )
-            
-            # Декодирование результата
-            response = self.processor.decode(
-                outputs[0], 
-                skip_special_tokens=True
-            )
-            
-            # Извлечение ответа ассистента
-            if "assistant" in response:
-                return response.split("assistant")[-1].strip()
-            else:
-                return response.strip()
-                
+            return self._generate([self._open_image(image_path)], prompt)
         except Exception as e:
             logging.error(f"Ошибка анализа изображения: {str(e)}")
             return f"Ошибка анализа изображения: {str(e)}"
     
+    def analyze_images(self, images, prompt, max_new_tokens=500):
+        """
+        Анализ изображений PIL (вырезки элементов, листы) одним запросом
+
+        Ошибки модели пробрасываются, а не возвращаются текстом ответа
+        (см. roi_analysis.RegionLabeler.label_crops)
+        """
+        return self._generate(images, prompt, max_new_tokens)
+    
     def analyze_ui_elements(self, image_path):
         """Специализированный анализ UI элементов"""
         prompt = """
@@ -129,52 +159,7 @@ class PhiVisionAgent:
         """Анализ нескольких изображений"""
         try:
             self._lazy_load_model()
-            
-            images = []
-            for path in image_paths:
-                if path.startswith('http'):
-                    img = Image.open(requests.get(path, stream=True).raw)
-                else:
-                    img = Image.open(path)
-                images.append(img)
-            
-            # Создание сообщения с несколькими изображениями
-            image_tokens = " ".join([f"<|image_{i+1}|>" for i in range(len(images))])
-            messages = [
-                {"role": "user", "content": f"{image_tokens}\n{prompt}"}
-            ]
-            
-            inputs = self.processor.tokenizer.apply_chat_template(
-                messages, 
-                tokenize=False, 
-                add_generation_prompt=True
-            )
-            
-            inputs = self.processor(
-                inputs, 
-                images, 
-                return_tensors="pt"
-            ).to(self.device)
-            
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=500,
-                    do_sample=True,
-                    temperature=0.7,
-                    pad_token_id=self.processor.tokenizer.eos_token_id
-                )
-            
-            response = self.processor.decode(
-                outputs[0], 
-                skip_special_tokens=True
-            )
-            
-            if "assistant" in response:
-                return response.split("assistant")[-1].strip()
-            else:
-                return response.strip()
-                
+            return self._generate([self._open_image(path) for path in image_paths], prompt)
         except Exception as e:
             logging.error(f"Ошибка анализа множественных изображений: {str(e)}")
             return f"Ошибка анализа изображений: {str(e)}"
@@ -184,6 +169,9 @@ class PhiVisionAgent:
         if self.model is not None:
             del self.model
             del self.processor
+            self.model = None
+            self.processor = None
+            torch = import_optional('torch')
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
             self.initialized = False
@@ -0,0 +1,99 @@
+"""
+Production-режим веб-приложения
+
+Gunicorn с предзагрузкой приложения (preload_app): мастер-процесс
+импортирует web_app и загружает общее read-only состояние
+(web_app.preload_shared_state), после чего воркеры создаются fork'ом
+и разделяют эту память через copy-on-write. Каждый воркер один раз
+создает собственный UI агент с клиентами внешних API (post_fork) и
+обслуживает запросы несколькими потоками.
+
+Gunicorn не работает на Windows; там и при его отсутствии запускается
+многопоточный сервер werkzeug без режима отладки.
+"""
+import logging
+import os
+from typing import Optional
+
+from config import SERVER_SETTINGS
+from lazy_imports import module_available
+
+
+def default_workers() -> int:
+    """Число воркеров по умолчанию: по одному на ядро"""
+    return SERVER_SETTINGS['workers'] or os.cpu_count() or 1
+
+
+def _post_fork(server, worker):
+    """Инициализация клиентов API один раз в каждом воркере"""
+    from web_app import get_ui_agent
+    get_ui_agent()
+    server.log.info(f"Воркер {worker.pid}: UI агент инициализирован")
+
+
+def gunicorn_options(host: str, port: int, workers: int, threads: int) -> dict:
+    """Настройки gunicorn для веб-приложения"""
+    return {
+        'bind': f"{host}:{port}",
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'timeout': SERVER_SETTINGS['timeout'],
+        'graceful_timeout': SERVER_SETTINGS['graceful_timeout'],
+        'max_requests': SERVER_SETTINGS['max_requests'],
+        'max_requests_jitter': SERVER_SETTINGS['max_requests_jitter'],
+        'post_fork': _post_fork,
+    }
+
+
+def _run_gunicorn(options: dict):
+    """Запуск gunicorn из кода (без отдельного конфигурационного файла)"""
+    from gunicorn.app.base import BaseApplication
+
+    class WebApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Выполняется в мастере до fork благодаря preload_app
+            from web_app import app, preload_shared_state
+            preload_shared_state()
+            return app
+
+    WebApplication().run()
+
+
+def run_production(host: Optional[str] = None, port: Optional[int] = None,
+                   workers: Optional[int] = None, threads: Optional[int] = None):
+    """
+    Запуск веб-приложения в production-режиме
+
+    Args:
+        host: Адрес (по умолчанию из SERVER_SETTINGS)
+        port: Порт
+        workers: Число процессов-воркеров (по умолчанию по числу ядер)
+        threads: Потоков на воркер
+    """
+    host = host or SERVER_SETTINGS['host']
+    port = port or SERVER_SETTINGS['port']
+    workers = workers or default_workers()
+    threads = threads or SERVER_SETTINGS['threads']
+
+    if os.name != 'nt' and module_available('gunicorn'):
+        logging.info(f"🚀 gunicorn: {workers} воркеров x {threads} потоков на {host}:{port}")
+        _run_gunicorn(gunicorn_options(host, port, workers, threads))
+        return
+
+    logging.warning("⚠️ gunicorn недоступен (Windows или не установлен), "
+                    "запускается многопоточный сервер без fork воркеров")
+    from web_app import app, preload_shared_state, get_ui_agent
+    preload_shared_state()
+    get_ui_agent()
+    app.run(host=host, port=port, debug=False, threaded=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_production()
@@ -0,0 +1,241 @@
+"""
+Сериализация результатов анализа и сессий
+
+Поддерживаемые форматы:
+    json    - читаемый человеком (с отступами)
+    msgpack - компактный бинарный (pip install msgpack)
+    cbor    - компактный бинарный (pip install cbor2)
+
+Сжатие: gzip (стандартная библиотека) или zstd (pip install zstandard).
+Формат определяется по расширению файла (.json / .msgpack / .cbor),
+сжатие - по сигнатуре данных, поэтому load_results читает любые файлы,
+записанные dump_results, в том числе старые JSON.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from config import SERIALIZATION_SETTINGS
+from element_table import ElementTable
+
+try:
+    import msgpack
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+try:
+    import cbor2
+    HAS_CBOR = True
+except ImportError:
+    HAS_CBOR = False
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+FORMAT_EXTENSIONS = {'json': '.json', 'msgpack': '.msgpack', 'cbor': '.cbor'}
+COMPRESSION_EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Маркер колоночной таблицы элементов внутри сериализованных данных
+TABLE_MARKER = '__element_table__'
+
+
+def to_serializable(value: Any) -> Any:
+    """Преобразование типов, которые не понимают кодировщики"""
+    if isinstance(value, ElementTable):
+        return {TABLE_MARKER: value.to_columns()}
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется")
+
+
+def _dates_to_strings(value: Any) -> Any:
+    """
+    Даты -> строки ISO до кодирования CBOR
+
+    cbor2 кодирует datetime сам, не вызывая default, и падает на наивных
+    datetime, а date записывает тегом - в JSON и msgpack это строки.
+    """
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: _dates_to_strings(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_dates_to_strings(item) for item in value]
+    return value
+
+
+def _restore_tables(value: Any) -> Any:
+    """Восстанавливает ElementTable из маркеров"""
+    if isinstance(value, dict):
+        if TABLE_MARKER in value and len(value) == 1:
+            return ElementTable.from_columns(value[TABLE_MARKER])
+        return {key: _restore_tables(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_restore_tables(item) for item in value]
+    return value
+
+
+def resolve_format(fmt: Optional[str] = None, compression: Optional[str] = 'default'):
+    """
+    Выбор формата и сжатия с учетом установленных библиотек
+
+    Недоступный бинарный формат заменяется на JSON, недоступный zstd - на gzip.
+    """
+    fmt = fmt or SERIALIZATION_SETTINGS['format']
+    if compression == 'default':
+        compression = SERIALIZATION_SETTINGS['compression']
+
+    if fmt not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Неизвестный формат сериализации: {fmt}")
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Неизвестный тип сжатия: {compression}")
+
+    if (fmt == 'msgpack' and not HAS_MSGPACK) or (fmt == 'cbor' and not HAS_CBOR):
+        logging.warning(f"{fmt} не установлен, результаты будут сохранены в JSON")
+        fmt = 'json'
+    if compression == 'zstd' and not HAS_ZSTD:
+        logging.warning("zstandard не установлен, используется gzip")
+        compression = 'gzip'
+
+    return fmt, compression
+
+
+def result_extension(fmt: Optional[str] = None, compression: Optional[str] = 'default') -> str:
+    """Расширение файла для формата, например '.msgpack.zst'"""
+    fmt, compression = resolve_format(fmt, compression)
+    return FORMAT_EXTENSIONS[fmt] + COMPRESSION_EXTENSIONS[compression]
+
+
+def encode_results(data: Any, fmt: str = 'json', indent: Optional[int] = 2) -> bytes:
+    """Кодирование без сжатия"""
+    if fmt == 'json':
+        return json.dumps(data, ensure_ascii=False, indent=indent, default=to_serializable).encode('utf-8')
+    if fmt == 'msgpack':
+        return msgpack.packb(data, default=to_serializable, use_bin_type=True)
+    if fmt == 'cbor':
+        return cbor2.dumps(_dates_to_strings(data), default=lambda encoder, value: encoder.encode(to_serializable(value)))
+    raise ValueError(f"Неизвестный формат сериализации: {fmt}")
+
+
+def decode_results(payload: bytes, fmt: str = 'json') -> Any:
+    """Декодирование без сжатия"""
+    if fmt == 'json':
+        return json.loads(payload.decode('utf-8'))
+    if fmt == 'msgpack':
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    if fmt == 'cbor':
+        return cbor2.loads(payload)
+    raise ValueError(f"Неизвестный формат сериализации: {fmt}")
+
+
+def compress(payload: bytes, compression: Optional[str]) -> bytes:
+    """Сжатие данных"""
+    if compression == 'gzip':
+        return gzip.compress(payload, compresslevel=SERIALIZATION_SETTINGS['gzip_level'])
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=SERIALIZATION_SETTINGS['zstd_level']).compress(payload)
+    return payload
+
+
+def decompress(payload: bytes) -> bytes:
+    """Распаковка по сигнатуре; несжатые данные возвращаются как есть"""
+    if payload.startswith(GZIP_MAGIC):
+        return gzip.decompress(payload)
+    if payload.startswith(ZSTD_MAGIC):
+        if not HAS_ZSTD:
+            raise ImportError("zstandard не установлен. Установите: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompressobj().decompress(payload)
+    return payload
+
+
+def dump_results(data: Any, path, fmt: Optional[str] = None,
+                 compression: Optional[str] = 'default') -> Path:
+    """
+    Сохранение результатов
+
+    Args:
+        data: Результаты (dict / list, могут содержать ElementTable)
+        path: Путь без расширения или с ним; расширение формата будет добавлено
+        fmt: json / msgpack / cbor (по умолчанию из SERIALIZATION_SETTINGS)
+        compression: None / gzip / zstd (по умолчанию из SERIALIZATION_SETTINGS)
+
+    Returns:
+        Фактический путь к файлу
+    """
+    fmt, compression = resolve_format(fmt, compression)
+    path = Path(path)
+    extension = FORMAT_EXTENSIONS[fmt] + COMPRESSION_EXTENSIONS[compression]
+    if not path.name.endswith(extension):
+        path = path.with_name(_strip_extensions(path.name) + extension)
+
+    # Отступы нужны только несжатому JSON, который читает человек
+    indent = 2 if fmt == 'json' and compression is None else None
+    payload = compress(encode_results(data, fmt, indent=indent), compression)
+
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _strip_extensions(name: str) -> str:
+    """Убирает известные расширения формата и сжатия"""
+    for extension in ('.gz', '.zst'):
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    for extension in FORMAT_EXTENSIONS.values():
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    return name
+
+
+def _detect_format(path: Path, payload: bytes) -> str:
+    """Формат по расширению, для неизвестных расширений - по содержимому"""
+    name = path.name
+    for extension in ('.gz', '.zst'):
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    for fmt, extension in FORMAT_EXTENSIONS.items():
+        if name.endswith(extension):
+            return fmt
+    if payload.lstrip()[:1] in (b'{', b'['):
+        return 'json'
+    return 'msgpack' if HAS_MSGPACK else 'cbor'
+
+
+def load_results(path, restore_tables: bool = False) -> Any:
+    """
+    Чтение результатов в любом поддерживаемом формате
+
+    Args:
+        path: Путь к файлу
+        restore_tables: Восстановить ElementTable вместо колоночных словарей
+    """
+    path = Path(path)
+    with open(path, 'rb') as f:
+        payload = decompress(f.read())
+
+    data = decode_results(payload, _detect_format(path, payload))
+    return _restore_tables(data) if restore_tables else data
@@ -0,0 +1,293 @@
+"""
+Анализ по областям интереса: внешним бэкендам - только вырезки элементов
+
+Claude и Phi получают не весь скриншот, а вырезки рамок, предложенных
+локальным детектором (UIAnalysisAgent._find_ui_elements), и ставят
+каждой один тег MOBILE_GAMING_UI_TAXONOMY. Вырезки уменьшаются до
+crop_max_side и укладываются на пронумерованные листы (contact_sheet,
+лист - один запрос) или отправляются пачками по crops_per_request;
+ответ - короткий JSON вместо длинного описания экрана, поэтому
+изображений-токенов и текста в ответе заметно меньше. Вырезки
+нескольких скриншотов (analyze_many) делят общие листы.
+
+Если обучена локальная модель (local_vision_agent), области, которые
+она размечает уверенно (LOCAL_MODEL_SETTINGS['min_confidence']), не
+отправляются вовсе.
+
+Использование:
+    labeler = RegionLabeler(claude_agent=ClaudeVisionAgent(api_key))
+    result = await labeler.analyze(image_path)
+    results = await labeler.analyze_many(image_paths)
+"""
+import asyncio
+import json
+import logging
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from box_ops import box_to_bounds, to_boxes
+from config import LOCAL_MODEL_SETTINGS, ROI_SETTINGS
+from constants import ALL_UI_TAGS
+from contact_sheet import build_sheets, sheet_prompt
+from element_classifier import classify_boxes
+from taxonomy_index import match_tag
+
+# Уверенность тега по бэкенду (как в HybridUIVisionAgent._calculate_confidence)
+BACKEND_CONFIDENCE = {'claude': 0.90, 'phi': 0.75}
+
+# Целые объекты {"index", "tag"} - из ответа, оборванного по max_tokens
+_JSON_LABEL = re.compile(r'\{\s*"index"\s*:\s*(\d+)\s*,\s*"tag"\s*:\s*"([^"]*)"\s*\}')
+_LINE_LABEL = re.compile(r'^\W*(\d+)\s*[:.)\-=]\s*([A-Za-z][\w -]*)', re.MULTILINE)
+
+
+def propose_regions(image: Image.Image, detector, settings: Optional[Dict] = None) -> np.ndarray:
+    """Рамки (N, 4) локального детектора без слишком мелких, не больше max_regions"""
+    settings = settings or ROI_SETTINGS
+    boxes = to_boxes(detector._find_ui_elements(image))
+    sides = np.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+    return boxes[sides >= settings['min_region_side']][:settings['max_regions']]
+
+
+def crop_regions(image: Image.Image, boxes: np.ndarray, settings: Optional[Dict] = None) -> List[Image.Image]:
+    """Вырезки рамок с полями; стороны больше crop_max_side уменьшаются"""
+    settings = settings or ROI_SETTINGS
+    padding = settings['crop_padding']
+    max_side = settings['crop_max_side']
+    image = image.convert('RGB')
+    crops = []
+    for x1, y1, x2, y2 in np.asarray(boxes).reshape(-1, 4).tolist():
+        crop = image.crop((max(0, int(x1) - padding), max(0, int(y1) - padding),
+                           min(image.width, int(x2) + padding), min(image.height, int(y2) + padding)))
+        if max(crop.size) > max_side:
+            crop.thumbnail((max_side, max_side), Image.LANCZOS)
+        crops.append(crop)
+    return crops
+
+
+def labelling_prompt(count: int, tags: Sequence[str] = ALL_UI_TAGS) -> str:
+    """Промпт разметки count пронумерованных элементов"""
+    return f"""
+Изображения - это {count} вырезок элементов интерфейса мобильной игры, пронумерованных по порядку от 1 до {count}.
+Каждому элементу поставь ровно один тег из списка:
+{', '.join(tags)}
+
+Ответь только JSON без пояснений:
+[{{"index": 1, "tag": "button"}}, ...]
+"""
+
+
+def normalize_tag(label) -> Optional[str]:
+    """Тег таксономии из ответа модели ('Play Button' -> 'play_button') или None"""
+    if not isinstance(label, str):
+        return None
+    found = match_tag(label.strip())
+    return found.tag if found is not None else None
+
+
+def parse_labels(text: str, count: int) -> List[Optional[str]]:
+    """
+    Теги элементов 1..count из ответа бэкенда
+
+    Понимает JSON-список {"index", "tag"} (в том числе внутри ```json),
+    оборванный список - по его целым объектам, и строки вида
+    "3: close_button". Отсутствующие и неизвестные теги - None.
+    """
+    labels: List[Optional[str]] = [None] * count
+    pairs = []
+    start, end = text.find('['), text.rfind(']')
+    try:
+        items = json.loads(text[start:end + 1]) if 0 <= start < end else []
+        pairs = [(item.get('index'), item.get('tag')) for item in items if isinstance(item, dict)]
+    except ValueError:
+        pass
+    if not pairs:
+        pairs = [(int(index), tag) for index, tag in _JSON_LABEL.findall(text)]
+    if not pairs:
+        pairs = [(int(index), tag) for index, tag in _LINE_LABEL.findall(text)]
+
+    for index, tag in pairs:
+        if isinstance(index, int) and 1 <= index <= count and labels[index - 1] is None:
+            labels[index - 1] = normalize_tag(tag)
+    return labels
+
+
+class RegionLabeler:
+    """Двухэтапный анализ: локальные рамки -> теги Claude/Phi по вырезкам"""
+
+    def __init__(self, claude_agent=None, phi_agent=None, local_agent=None,
+                 settings: Optional[Dict] = None):
+        self.claude_agent = claude_agent
+        self.phi_agent = phi_agent
+        self.local_agent = local_agent
+        self.settings = {**ROI_SETTINGS, **(settings or {})}
+        self._detector = None
+
+    @property
+    def backend(self) -> Optional[str]:
+        """Бэкенд разметки по настройке backend и доступным агентам"""
+        preferred = self.settings['backend']
+        if preferred in ('claude', 'auto') and self.claude_agent:
+            return 'claude'
+        if preferred in ('phi', 'auto') and self.phi_agent:
+            return 'phi'
+        return None
+
+    @property
+    def detector(self):
+        """Детектор рамок: детектор локальной модели или свой UIAnalysisAgent"""
+        if self.local_agent is not None:
+            return self.local_agent.detector
+        if self._detector is None:
+            from agent import UIAnalysisAgent
+            self._detector = UIAnalysisAgent()
+        return self._detector
+
+    async def _ask(self, images: List[Image.Image], prompt: str, count: int) -> str:
+        # Лимит ответа растет с числом вырезок: ~20 токенов на {"index", "tag"}
+        max_tokens = self.settings['max_tokens'] + self.settings['tokens_per_label'] * count
+        if self.backend == 'claude':
+            return await self.claude_agent.analyze_images(images, prompt, max_tokens)
+        return await asyncio.to_thread(self.phi_agent.analyze_images, images, prompt, max_tokens)
+
+    async def label_crops(self, crops: List[Image.Image]) -> Tuple[List[Optional[str]], Dict]:
+        """
+        Теги вырезок и объем отправленного (requests, pixels_sent)
+
+        packing='contact_sheet' - вырезки укладываются на листы
+        (contact_sheet), лист - один запрос; 'crops' - по crops_per_request
+        отдельных изображений в запросе. Запросы к Claude идут параллельно
+        (не больше concurrent_requests), к Phi - по очереди: модель одна на GPU.
+        Сбой одного запроса (429, ошибка модели) не отменяет остальные: его
+        вырезки остаются без тегов, а ошибка попадает в errors (индекс
+        вырезки -> текст ошибки).
+        """
+        labels: List[Optional[str]] = [None] * len(crops)
+        if not crops or self.backend is None:
+            return labels, {'requests': 0, 'pixels_sent': 0, 'errors': {}}
+
+        # Запрос: изображения, промпт и индексы вырезок в порядке номеров ответа
+        if self.settings['packing'] == 'contact_sheet':
+            sheets = await asyncio.to_thread(build_sheets, crops, self.settings)
+            requests = [([sheet.image], sheet_prompt(len(sheet.cells)),
+                         [cell.item for cell in sheet.cells]) for sheet in sheets]
+        else:
+            size = self.settings['crops_per_request']
+            requests = [(crops[i:i + size], labelling_prompt(len(crops[i:i + size])),
+                         list(range(i, min(i + size, len(crops))))) for i in range(0, len(crops), size)]
+
+        parallel = self.settings['concurrent_requests'] if self.backend == 'claude' else 1
+        semaphore = asyncio.Semaphore(parallel)
+
+        async def label_request(images: List[Image.Image], prompt: str, items: List[int]):
+            async with semaphore:
+                answer = await self._ask(images, prompt, len(items))
+            for item, label in zip(items, parse_labels(answer, len(items))):
+                labels[item] = label
+
+        outcomes = await asyncio.gather(*(label_request(*request) for request in requests), return_exceptions=True)
+        errors: Dict[int, str] = {}
+        for (_, _, items), outcome in zip(requests, outcomes):
+            if isinstance(outcome, Exception):
+                logging.error(f"❌ Разметка {len(items)} вырезок через {self.backend}: {outcome}")
+                errors.update((item, f"{self.backend}: {outcome}") for item in items)
+        pixels = sum(image.width * image.height for images, _, _ in requests for image in images)
+        return labels, {'requests': len(requests), 'pixels_sent': pixels, 'errors': errors}
+
+    def _prepare(self, image_path: str) -> Dict:
+        """Рамки, теги локальной модели и вырезки областей для бэкенда"""
+        with Image.open(image_path) as image:
+            image.load()
+            boxes = propose_regions(image, self.detector, self.settings)
+            tags: List[Optional[str]] = [None] * len(boxes)
+            confidence = np.zeros(len(boxes), dtype=np.float32)
+            source: List[Optional[str]] = [None] * len(boxes)
+
+            model = None
+            if self.local_agent is not None and self.settings['skip_confident_local']:
+                self.local_agent.reload_if_updated()
+                model = self.local_agent.model
+            if model is not None and len(boxes):
+                local_tags, local_confidence = classify_boxes(image, boxes, model=model)
+                for i in np.flatnonzero(local_confidence >= LOCAL_MODEL_SETTINGS['min_confidence']):
+                    tags[i], confidence[i], source[i] = local_tags[i], local_confidence[i], 'local'
+
+            pending = [i for i, tag in enumerate(tags) if tag is None]
+            return {
+                'boxes': boxes, 'tags': tags, 'confidence': confidence, 'source': source,
+                'pending': pending, 'crops': crop_regions(image, boxes[pending], self.settings),
+                'image_pixels': image.width * image.height
+            }
+
+    async def analyze(self, image_path: str) -> Dict:
+        """
+        Разметка областей скриншота
+
+        Returns:
+            elements (bounds, type, confidence, source), summary, confidence
+            (средняя по элементам), backend, requests, crops_sent и
+            pixels_sent / image_pixels - объем отправленных изображений
+        """
+        return (await self.analyze_many([image_path]))[0]
+
+    async def analyze_many(self, image_paths: Sequence[str]) -> List[Dict]:
+        """
+        Разметка нескольких скриншотов: вырезки всех скриншотов на общих листах
+
+        Returns:
+            Результат analyze на скриншот (error - если его не удалось
+            прочитать или запрос с его вырезками завершился ошибкой; теги
+            остальных запросов сохраняются); requests и pixels_sent - общие
+            для всего вызова
+        """
+        self.detector  # создается один раз до запуска потоков
+        prepared = await asyncio.gather(*(asyncio.to_thread(self._prepare, path) for path in image_paths),
+                                        return_exceptions=True)
+
+        crops: List[Image.Image] = []
+        for item in prepared:
+            if not isinstance(item, Exception):
+                crops.extend(item['crops'])
+
+        backend = self.backend
+        if crops and backend is None:
+            logging.warning("⚠️ Нет бэкенда для разметки областей (Claude / Phi)")
+        labels, stats = await self.label_crops(crops)
+
+        results = []
+        offset = 0
+        for image_path, item in zip(image_paths, prepared):
+            if isinstance(item, Exception):
+                logging.error(f"❌ Разметка областей {image_path}: {item}")
+                results.append({'error': str(item), 'confidence': 0.0})
+                continue
+            tags, confidence, source = item['tags'], item['confidence'], item['source']
+            for i, tag in zip(item['pending'], labels[offset:offset + len(item['crops'])]):
+                if tag is not None:
+                    tags[i], confidence[i], source[i] = tag, BACKEND_CONFIDENCE[backend], backend
+            failed = sorted({stats['errors'][i] for i in range(offset, offset + len(item['crops']))
+                             if i in stats['errors']})
+            offset += len(item['crops'])
+
+            elements = [
+                {'bounds': box_to_bounds(box), 'type': tag, 'confidence': round(float(score), 4), 'source': origin}
+                for box, tag, score, origin in zip(item['boxes'], tags, confidence, source)
+            ]
+            counts = Counter(tag for tag in tags if tag is not None)
+            result = {
+                'elements': elements,
+                'summary': ', '.join(f"{tag}: {count}" for tag, count in counts.most_common()),
+                'confidence': round(float(confidence.mean()), 4) if len(elements) else 0.0,
+                'backend': backend,
+                'requests': stats['requests'],
+                'crops_sent': len(item['crops']) if backend else 0,
+                'pixels_sent': stats['pixels_sent'],
+                'image_pixels': item['image_pixels']
+            }
+            if failed:
+                result['error'] = '; '.join(failed)
+            results.append(result)
+        return results
@@ -3,25 +3,26 @@
 Скрипт для запуска Flask веб-приложения для создания датасета UI элементов
 """
 
+import argparse
 import sys
 import os
 import subprocess
 import logging
 from pathlib import Path
 
+from config import SERVER_SETTINGS
+from lazy_imports import module_available
+
 def check_requirements():
     """Проверяет наличие необходимых пакетов"""
-    try:
-        import flask
-        import google.cloud.vision
-        import PIL
-        import numpy
-        import werkzeug
-        print("✅ Все необходимые пакеты установлены")
-        return True
-    except ImportError as e:
-        print(f"❌ Отсутствует пакет: {e}")
+    # Проверка без импорта: google-cloud-vision грузится секундами
+    missing = [name for name in ('flask', 'google.cloud.vision', 'PIL', 'numpy', 'werkzeug')
+               if not module_available(name)]
+    if missing:
+        print(f"❌ Отсутствуют пакеты: {', '.join(missing)}")
         return False
+    print("✅ Все необходимые пакеты установлены")
+    return True
 
 def install_requirements():
     """Устанавливает необходимые пакеты"""
@@ -89,8 +90,23 @@ def check_environment():
     
     return issues
 
+def parse_args():
+    """Аргументы командной строки"""
+    parser = argparse.ArgumentParser(description="Запуск UI Dataset Web App")
+    parser.add_argument('--production', action='store_true',
+                        help="многопроцессный сервер (gunicorn) для нескольких аннотаторов")
+    parser.add_argument('--asgi', action='store_true',
+                        help="асинхронный вариант приложения (Quart + uvicorn)")
+    parser.add_argument('--host', default=None, help="адрес (по умолчанию из SERVER_SETTINGS)")
+    parser.add_argument('--port', type=int, default=None, help="порт (по умолчанию из SERVER_SETTINGS)")
+    parser.add_argument('--workers', type=int, default=None, help="число воркеров (по умолчанию по числу ядер)")
+    parser.add_argument('--threads', type=int, default=None, help="потоков на воркер")
+    return parser.parse_args()
+
 def main():
     """Основная функция запуска"""
+    args = parse_args()
+    
     print("🚀 Запуск UI Dataset Web App")
     print("=" * 50)
     
@@ -104,9 +120,11 @@ def main():
         print("\nПожалуйста, исправьте эти проблемы перед запуском приложения.")
         return False
     
+    port = args.port or SERVER_SETTINGS['port']
     print("\n✅ Проверка окружения пройдена!")
-    print("\n🌐 Запуск Flask приложения...")
-    print("   URL: http://localhost:5000")
+    mode = 'ASGI' if args.asgi else 'production' if args.production else 'разработка'
+    print(f"\n🌐 Запуск веб-приложения ({mode})...")
+    print(f"   URL: http://localhost:{port}")
     print("   Для остановки нажмите Ctrl+C")
     print("=" * 50)
     
@@ -114,8 +132,15 @@ def main():
     logging.basicConfig(level=logging.INFO)
     
     try:
-        from .web_app import app
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        if args.asgi:
+            from asgi_app import run_asgi
+            run_asgi(args.host, port, args.workers)
+        elif args.production:
+            from production_server import run_production
+            run_production(args.host, port, args.workers, args.threads)
+        else:
+            from web_app import app
+            app.run(debug=True, host=args.host or SERVER_SETTINGS['host'], port=port)
     except ImportError as e:
         print(f"❌ Не удалось импортировать веб-приложение: {e}")
         return False
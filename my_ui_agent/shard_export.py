@@ -0,0 +1,279 @@
+"""
+Шардированный экспорт датасета в tar (формат WebDataset)
+
+Изображения и записи аннотаций из training_dataset/entry_* упаковываются
+в tar-шарды фиксированного размера: на каждый пример приходится пара
+файлов <key>.<ext> и <key>.json. Порядок примеров перемешивается при
+сборке, рядом пишется index.json со списком шардов и смещений.
+Чтение идет последовательно большими блоками, декодирование изображений
+можно вынести в пул воркеров.
+"""
+import io
+import json
+import logging
+import random
+import sys
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from PIL import Image
+
+from box_ops import dedupe_elements
+from config import Config, DATASET_SETTINGS
+from dataset_entries import (
+    iter_entry_dirs, load_entry, entry_image_path, entry_image_size, entry_elements
+)
+from training_export import get_class_id
+
+INDEX_FILENAME = 'index.json'
+
+
+def build_sample_record(entry_id: str, data: Dict, image_size, include_predicted: bool = False,
+                        nms_iou: float = 0.7) -> Dict:
+    """Компактная запись аннотаций для одного примера"""
+    width, height = image_size or (None, None)
+
+    # Новые словари: bounds и confidence для dedupe не меняют элементы entry_elements
+    elements = [
+        {**element, 'bounds': [element['bbox'][:2], element['bbox'][2:]],
+         'confidence': 1.0 if element['verified'] else (element['confidence'] or 0.0)}
+        for element in entry_elements(data) if element['verified'] or include_predicted
+    ]
+
+    objects = []
+    for element in dedupe_elements(elements, nms_iou, class_key='tag'):
+        tag = element['tag']
+        objects.append({
+            'bbox': [round(v, 2) for v in element['bbox']],
+            'tag': tag,
+            'category': element['category'],
+            'class_id': get_class_id(tag) if tag else None,
+            'source': element['source'],
+            'text': element['text'],
+            'verified': element['verified']
+        })
+
+    return {
+        'entry_id': entry_id,
+        'width': width,
+        'height': height,
+        'taxonomy_version': data.get('taxonomy_version'),
+        'objects': objects
+    }
+
+
+def _add_member(tar: tarfile.TarFile, name: str, payload: bytes, mtime: float):
+    """Добавляет файл в tar из памяти"""
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mtime = mtime
+    tar.addfile(info, io.BytesIO(payload))
+
+
+class ShardWriter:
+    """Запись шардов с ротацией по размеру и числу примеров"""
+
+    def __init__(self, output_dir: Path, prefix: str = 'shard',
+                 max_shard_bytes: int = 256 * 1024 * 1024, max_samples: int = 10000):
+        self.output_dir = Path(output_dir)
+        self.prefix = prefix
+        self.max_shard_bytes = max_shard_bytes
+        self.max_samples = max_samples
+        self.shards: List[Dict] = []
+        self._tar = None
+        self._current = None
+
+    def _open_next(self):
+        """Открывает следующий шард"""
+        self.close()
+        name = f"{self.prefix}-{len(self.shards):06d}.tar"
+        self._tar = tarfile.open(self.output_dir / name, 'w', format=tarfile.GNU_FORMAT)
+        self._current = {'name': name, 'samples': [], 'bytes': 0}
+        self.shards.append(self._current)
+
+    def write(self, key: str, members: Dict[str, bytes]):
+        """
+        Записывает пример
+
+        Args:
+            key: Ключ примера (общий префикс файлов в tar)
+            members: {расширение: содержимое}
+        """
+        sample_bytes = sum(len(payload) for payload in members.values())
+        if (self._tar is None
+                or len(self._current['samples']) >= self.max_samples
+                or (self._current['samples'] and self._current['bytes'] + sample_bytes > self.max_shard_bytes)):
+            self._open_next()
+
+        offset = self._tar.offset
+        mtime = time.time()
+        for extension, payload in members.items():
+            _add_member(self._tar, f"{key}.{extension}", payload, mtime)
+
+        self._current['samples'].append({'key': key, 'offset': offset})
+        self._current['bytes'] = self._tar.offset
+
+    def close(self):
+        """Закрывает текущий шард"""
+        if self._tar is not None:
+            self._tar.close()
+            self._current['bytes'] = (self.output_dir / self._current['name']).stat().st_size
+            self._tar = None
+
+
+class ShardedDatasetExporter:
+    """Экспорт training_dataset в перемешанные tar-шарды"""
+
+    def __init__(self, dataset_dir=None, output_dir=None,
+                 max_shard_bytes: Optional[int] = None, max_samples: Optional[int] = None,
+                 seed: int = 0, include_predicted: bool = False):
+        self.dataset_dir = Path(dataset_dir or Config.DATASET_FOLDER)
+        self.output_dir = Path(output_dir or DATASET_SETTINGS['shards_dir'])
+        self.max_shard_bytes = max_shard_bytes or DATASET_SETTINGS['shard_max_bytes']
+        self.max_samples = max_samples or DATASET_SETTINGS['shard_max_samples']
+        self.seed = seed
+        self.include_predicted = include_predicted
+
+    def export(self) -> Dict:
+        """
+        Сборка шардов
+
+        Returns:
+            Содержимое index.json
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        for old_shard in self.output_dir.glob('*.tar'):
+            old_shard.unlink()
+
+        entry_dirs = list(iter_entry_dirs(self.dataset_dir))
+        random.Random(self.seed).shuffle(entry_dirs)
+
+        writer = ShardWriter(self.output_dir, max_shard_bytes=self.max_shard_bytes,
+                             max_samples=self.max_samples)
+        skipped = 0
+        for entry_dir in entry_dirs:
+            data = load_entry(entry_dir)
+            image_path = entry_image_path(entry_dir, data) if data else None
+            if image_path is None:
+                skipped += 1
+                continue
+
+            record = build_sample_record(
+                entry_dir.name, data, entry_image_size(entry_dir, data), self.include_predicted
+            )
+            extension = image_path.suffix.lower().lstrip('.') or 'png'
+            writer.write(entry_dir.name, {
+                extension: image_path.read_bytes(),
+                'json': json.dumps(record, ensure_ascii=False).encode('utf-8')
+            })
+        writer.close()
+
+        index = {
+            'created': datetime.now().isoformat(),
+            'format': 'webdataset',
+            'seed': self.seed,
+            'num_samples': sum(len(shard['samples']) for shard in writer.shards),
+            'skipped': skipped,
+            'shards': writer.shards
+        }
+        with open(self.output_dir / INDEX_FILENAME, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+
+        logging.info(f"📦 Записано {index['num_samples']} примеров в {len(writer.shards)} шардов")
+        return index
+
+
+def _iter_raw_samples(shard_path: Path) -> Iterator[Dict]:
+    """Последовательное чтение шарда: группирует файлы по ключу"""
+    sample = None
+    with tarfile.open(shard_path, 'r|') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            key, _, extension = member.name.partition('.')
+            if sample is not None and sample['__key__'] != key:
+                yield sample
+                sample = None
+            if sample is None:
+                sample = {'__key__': key, '__shard__': shard_path.name}
+            sample[extension] = tar.extractfile(member).read()
+    if sample is not None:
+        yield sample
+
+
+def decode_sample(sample: Dict) -> Dict:
+    """Декодирует JSON и изображение примера"""
+    decoded = dict(sample)
+    for extension, payload in sample.items():
+        if extension.startswith('__'):
+            continue
+        if extension == 'json':
+            decoded['json'] = json.loads(payload)
+        else:
+            image = Image.open(io.BytesIO(payload))
+            image.load()
+            decoded[extension] = image
+    return decoded
+
+
+def iter_shard_samples(shards_dir=None, shuffle_shards: bool = False, seed: Optional[int] = None,
+                       decode: bool = True, decode_workers: int = 0,
+                       prefetch: int = 64) -> Iterator[Dict]:
+    """
+    Потоковое чтение шардов
+
+    Args:
+        shards_dir: Папка с шардами и index.json
+        shuffle_shards: Перемешать порядок шардов (для каждой эпохи свой seed)
+        seed: Seed перемешивания шардов
+        decode: Декодировать изображения и JSON
+        decode_workers: Число потоков декодирования (0 - в текущем потоке)
+        prefetch: Сколько примеров декодируется впереди потребителя
+
+    Yields:
+        {'__key__': ..., 'json': ..., '<ext>': ...}
+    """
+    shards_dir = Path(shards_dir or DATASET_SETTINGS['shards_dir'])
+    with open(shards_dir / INDEX_FILENAME, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+
+    shard_names = [shard['name'] for shard in index['shards']]
+    if shuffle_shards:
+        random.Random(seed).shuffle(shard_names)
+
+    raw_samples = (
+        sample
+        for name in shard_names
+        for sample in _iter_raw_samples(shards_dir / name)
+    )
+
+    if not decode:
+        yield from raw_samples
+        return
+
+    if decode_workers <= 0:
+        for sample in raw_samples:
+            yield decode_sample(sample)
+        return
+
+    # Ограниченное окно задач держит память постоянной и сохраняет порядок
+    with ThreadPoolExecutor(max_workers=decode_workers) as executor:
+        pending = deque()
+        for sample in raw_samples:
+            pending.append(executor.submit(decode_sample, sample))
+            if len(pending) >= prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    seed = int(sys.argv[1]) if len(sys.argv) > 1 else 0
+    index = ShardedDatasetExporter(seed=seed).export()
+    print(f"Шардов: {len(index['shards'])}, примеров: {index['num_samples']}")
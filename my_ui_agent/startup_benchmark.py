@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Замер времени запуска модулей агента
+
+Каждая точка входа импортируется в отдельном процессе с
+`python -X importtime`; из отчета берется суммарное время импорта
+модуля и самые тяжелые зависимости. Результат сравнивается с бюджетом,
+при превышении скрипт завершается с кодом 1 (удобно для CI).
+
+Использование:
+    python startup_benchmark.py                 # все точки входа
+    python startup_benchmark.py agent web_app   # выбранные
+    python startup_benchmark.py --runs 5 --top 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# Бюджет времени импорта, секунды
+STARTUP_BUDGETS = {
+    'agent': 0.5,
+    'enhanced_agent': 0.8,
+    'hybrid_vision_agent': 0.3,
+    'phi_vision_agent': 0.3,
+    'claude_vision_agent': 0.2,
+    'ai_vision_config': 0.3,
+    'web_app': 1.0,
+}
+
+# Модули, импорт которых при запуске означает регрессию ленивой загрузки
+FORBIDDEN_AT_STARTUP = ('torch', 'transformers', 'anthropic', 'google.cloud.vision')
+
+MODULE_DIR = Path(__file__).resolve().parent
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    """Строки '-X importtime' -> {модуль: (self_us, cumulative_us)}"""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def measure(module: str) -> Dict[str, Tuple[int, int]]:
+    """Импорт модуля в чистом процессе"""
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=MODULE_DIR, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'}
+    )
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'unknown error'
+        raise RuntimeError(f"import {module}: {error}")
+    return parse_importtime(process.stderr)
+
+
+def benchmark(module: str, runs: int = 3) -> Dict:
+    """Медиана времени импорта и тяжелые зависимости по последнему запуску"""
+    totals: List[float] = []
+    timings = {}
+    for _ in range(runs):
+        timings = measure(module)
+        totals.append(timings[module][1] / 1e6)
+
+    return {
+        'module': module,
+        'seconds': statistics.median(totals),
+        'budget': STARTUP_BUDGETS.get(module),
+        'timings': timings,
+        'forbidden': [name for name in FORBIDDEN_AT_STARTUP if name in timings]
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бюджет времени запуска модулей агента")
+    parser.add_argument('modules', nargs='*', default=list(STARTUP_BUDGETS))
+    parser.add_argument('--runs', type=int, default=3, help="запусков на модуль (берется медиана)")
+    parser.add_argument('--top', type=int, default=5, help="сколько самых тяжелых импортов показать")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        try:
+            result = benchmark(module, args.runs)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            failed = True
+            continue
+
+        budget = result['budget']
+        over_budget = budget is not None and result['seconds'] > budget
+        status = '❌' if over_budget or result['forbidden'] else '✅'
+        budget_text = f" (бюджет {budget:.2f} с)" if budget is not None else ""
+        print(f"{status} {module}: {result['seconds']:.3f} с{budget_text}")
+
+        if result['forbidden']:
+            print(f"   ⚠️ импортируются при запуске: {', '.join(result['forbidden'])}")
+
+        heaviest = sorted(
+            ((cumulative, name) for name, (_, cumulative) in result['timings'].items()
+             if name != module and '.' not in name),
+            reverse=True
+        )[:args.top]
+        for cumulative, name in heaviest:
+            print(f"   {cumulative / 1e3:8.1f} мс  {name}")
+
+        failed = failed or over_budget or bool(result['forbidden'])
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
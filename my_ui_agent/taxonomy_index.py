@@ -0,0 +1,132 @@
+"""
+Предкомпилированный индекс таксономии UI элементов
+
+Все теги MOBILE_GAMING_UI_TAXONOMY ('play_button' ищется как
+'play button') собираются один раз при импорте в многошаблонный
+автомат: Aho-Corasick (pip install pyahocorasick), иначе одно
+регулярное выражение-префиксное дерево. Описание просматривается за
+один проход, находятся все упоминания тегов, и выбирается самое
+специфичное - самое длинное ('play button' важнее 'button'), при
+равной длине - первое.
+
+Использование:
+    from taxonomy_index import classify_many
+    matches = classify_many(ocr_strings)   # TagMatch или None на строку
+"""
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from constants import MOBILE_GAMING_UI_TAXONOMY
+
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+DEFAULT_CATEGORY = 'interactive'
+
+# Подчеркивания в описаниях ('play_button') равнозначны пробелам
+_NORMALIZE = str.maketrans('_', ' ')
+
+_CACHE_LIMIT = 65536
+
+
+class TagMatch(NamedTuple):
+    """Упоминание тега в описании"""
+    category: str
+    tag: str
+    start: int
+    end: int
+
+
+def _regex_trie(phrases: Iterable[str]) -> str:
+    """Регулярное выражение-дерево: общие префиксы проверяются один раз"""
+    trie: Dict = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node: Dict) -> str:
+        # Более длинные продолжения раньше конца слова - жадно самое длинное
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{pattern})?" if '' in node else pattern
+
+    return build(trie)
+
+
+class TaxonomyIndex:
+    """Поиск тегов таксономии в описаниях элементов"""
+
+    def __init__(self, taxonomy: Optional[Dict[str, List[str]]] = None):
+        taxonomy = taxonomy or MOBILE_GAMING_UI_TAXONOMY
+        # Фраза -> (категория, тег); при повторе тега в категориях побеждает первая
+        self._phrases: Dict[str, Tuple[str, str]] = {}
+        for category, tags in taxonomy.items():
+            for tag in tags:
+                self._phrases.setdefault(tag.translate(_NORMALIZE).lower(), (category, tag))
+        self._cache: Dict[str, Optional[TagMatch]] = {}
+
+        if HAS_AHOCORASICK:
+            self._automaton = ahocorasick.Automaton()
+            for phrase, (category, tag) in self._phrases.items():
+                self._automaton.add_word(phrase, (len(phrase), category, tag))
+            self._automaton.make_automaton()
+            self._pattern = None
+        else:
+            self._automaton = None
+            # Опережающая проверка: совпадения с каждой позиции, в том числе перекрывающиеся
+            self._pattern = re.compile(f"(?=({_regex_trie(self._phrases)}))")
+
+    def find_all(self, description: str) -> List[TagMatch]:
+        """Все упоминания тегов (самое длинное с каждой позиции)"""
+        text = description.translate(_NORMALIZE).lower()
+        if self._automaton is not None:
+            return [TagMatch(category, tag, end - length + 1, end + 1)
+                    for end, (length, category, tag) in self._automaton.iter(text)]
+        return [TagMatch(*self._phrases[m.group(1)], m.start(), m.end(1))
+                for m in self._pattern.finditer(text)]
+
+    def match(self, description: str) -> Optional[TagMatch]:
+        """Самое специфичное упоминание тега или None"""
+        if not description:
+            return None
+        cached = self._cache.get(description, False)
+        if cached is not False:
+            return cached
+
+        best = None
+        for found in self.find_all(description):
+            if best is None or (found.end - found.start, -found.start) > (best.end - best.start, -best.start):
+                best = found
+
+        if len(self._cache) >= _CACHE_LIMIT:
+            self._cache.clear()
+        self._cache[description] = best
+        return best
+
+    def classify(self, description: str, default: str = DEFAULT_CATEGORY) -> str:
+        """Категория таксономии по описанию"""
+        found = self.match(description)
+        return found.category if found is not None else default
+
+    def classify_many(self, descriptions: Iterable[str]) -> List[Optional[TagMatch]]:
+        """Самые специфичные теги для пачки описаний (повторяющиеся строки - из кэша)"""
+        return [self.match(description) for description in descriptions]
+
+
+# Индекс таксономии проекта, строится один раз при импорте
+TAXONOMY_INDEX = TaxonomyIndex()
+
+
+def match_tag(description: str) -> Optional[TagMatch]:
+    return TAXONOMY_INDEX.match(description)
+
+
+def classify_many(descriptions: Iterable[str]) -> List[Optional[TagMatch]]:
+    return TAXONOMY_INDEX.classify_many(descriptions)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Тест повторов пакетного анализа при ошибках бэкенда (429 от Claude)
+
+Имитация ClaudeVisionAgent возвращает ошибку строкой, как настоящий агент
+при RateLimitError, поэтому проверяется, что изображение повторяется и
+отмечается в манифесте как упавшее, а не выполненное.
+
+Запуск: python test_batch_retries.py  (или pytest)
+"""
+import asyncio
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+from PIL import Image
+
+import batch_manifest
+from batch_manifest import STATUS_DONE, STATUS_FAILED, BatchManifest
+from batch_writer import BatchResultWriter
+from config import BATCH_SETTINGS
+
+RATE_LIMITED = "Claude analysis error: Error code: 429 - {'type': 'rate_limit_error'}"
+
+
+class RateLimitedClaude:
+    """Первые failures вызовов отвечают ошибкой 429"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    async def analyze_ui_comprehensive(self, image_path, ui_taxonomy, gaming_tags):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return RATE_LIMITED
+        return '{"ui_elements": [{"type": "button", "confidence": 0.9}]}' + ' ' * 50
+
+
+def _setup(directory: Path):
+    image_path = directory / 'screen.png'
+    Image.new('RGB', (200, 100), 'white').save(image_path)
+    manifest = BatchManifest(directory / 'manifest.json', max_attempts=3)
+    return image_path, manifest
+
+
+@contextmanager
+def _no_delay():
+    """Повторы без пауз только внутри блока: retry_delay модуля восстанавливается"""
+    original = batch_manifest.retry_delay
+    batch_manifest.retry_delay = lambda attempt: 0.0
+    try:
+        yield
+    finally:
+        batch_manifest.retry_delay = original
+
+
+def _hybrid(claude):
+    from hybrid_vision_agent import HybridUIVisionAgent
+    agent = HybridUIVisionAgent(enable_phi=False, enable_claude=False, enable_local=False)
+    agent.claude_agent = claude
+    return agent
+
+
+def test_hybrid_batch_retries_rate_limited_image():
+    directory = Path(tempfile.mkdtemp())
+    image_path, manifest = _setup(directory)
+    claude = RateLimitedClaude(failures=1)
+
+    with _no_delay():
+        results = asyncio.run(_hybrid(claude).batch_ui_analysis(
+            [str(image_path)], use_smart_filtering=False, output_path=str(directory / 'out.jsonl'),
+            manifest_path=str(directory / 'manifest.json')
+        ))
+
+    assert claude.calls == 2
+    assert 'error' not in results[0]
+    item = BatchManifest(directory / 'manifest.json').items[str(image_path)]
+    assert item['status'] == STATUS_DONE and item['attempts'] == 2
+
+
+def test_hybrid_batch_marks_persistent_429_failed():
+    directory = Path(tempfile.mkdtemp())
+    image_path, _ = _setup(directory)
+    claude = RateLimitedClaude(failures=10)
+
+    with _no_delay():
+        results = asyncio.run(_hybrid(claude).batch_ui_analysis(
+            [str(image_path)], use_smart_filtering=False, output_path=str(directory / 'out.jsonl'),
+            manifest_path=str(directory / 'manifest.json')
+        ))
+
+    assert claude.calls == BATCH_SETTINGS['max_attempts']
+    assert '429' in results[0]['error']
+    item = BatchManifest(directory / 'manifest.json').items[str(image_path)]
+    assert item['status'] == STATUS_FAILED and '429' in item['error']
+
+
+def test_enhanced_batch_does_not_mark_429_done():
+    from enhanced_agent import EnhancedUIAnalysisAgent
+
+    directory = Path(tempfile.mkdtemp())
+    image_path, manifest = _setup(directory)
+    claude = RateLimitedClaude(failures=10)
+    agent = EnhancedUIAnalysisAgent(enable_hybrid=False)
+    agent.hybrid_agent = _hybrid(claude)
+    agent.hybrid_enabled = True
+
+    cwd = os.getcwd()
+    os.chdir(directory)  # learning_data пишется в текущую папку
+    try:
+        with _no_delay(), BatchResultWriter(directory / 'out.jsonl') as writer:
+            asyncio.run(agent._process_images(manifest.plan([image_path]), 'claude', writer, manifest))
+    finally:
+        os.chdir(cwd)
+
+    item = manifest.items[str(image_path)]
+    assert claude.calls == 3 and item['attempts'] == 3
+    assert item['status'] == STATUS_FAILED and '429' in item['error']
+    assert not (directory / 'learning_data' / 'enhanced').exists()
+
+
+class FakeVisionClient:
+    """Отвечает на batch_annotate_images одним словом на изображение, как Vision API"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def batch_annotate_images(self, requests):
+        self.calls += 1
+        poly = SimpleNamespace(vertices=[SimpleNamespace(x=x, y=y) for x, y in ((10, 10), (90, 10), (90, 40), (10, 40))],
+                               normalized_vertices=[])
+        word = SimpleNamespace(description='PLAY', bounding_poly=poly)
+        return SimpleNamespace(responses=[
+            SimpleNamespace(error=SimpleNamespace(code=0, message=''), text_annotations=[word, word],
+                            localized_object_annotations=[])
+            for _ in requests
+        ])
+
+
+def test_enhanced_google_only_marks_done():
+    from enhanced_agent import EnhancedUIAnalysisAgent
+
+    directory = Path(tempfile.mkdtemp())
+    image_path, manifest = _setup(directory)
+    agent = EnhancedUIAnalysisAgent(enable_hybrid=False)
+    agent.vision_client = FakeVisionClient()
+    results = []
+
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        with BatchResultWriter(directory / 'out.jsonl') as writer:
+            asyncio.run(agent._process_images(manifest.plan([image_path]), 'google_only', writer, manifest, results))
+    finally:
+        os.chdir(cwd)
+
+    assert 'error' not in results[0]
+    assert results[0]['combined_analysis']['summary']['google_texts'] >= 1
+    item = manifest.items[str(image_path)]
+    assert agent.vision_client.calls == 1
+    assert item['status'] == STATUS_DONE and item['attempts'] == 1
+    assert any((directory / 'learning_data' / 'enhanced').iterdir())
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"🎉 Все тесты прошли: {len(tests)}")
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Тест листов вырезок и разметки областей на локальной имитации бэкенда
+
+Имитация Claude принимает листы так же, как ClaudeVisionAgent.analyze_images,
+и отвечает тегом по номеру ячейки, поэтому проверяются раскладка, число
+запросов и возврат тегов к элементам без ключа API.
+
+Запуск: python test_contact_sheet.py  (или pytest)
+"""
+import asyncio
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from contact_sheet import build_sheets, pack_shelves
+from roi_analysis import RegionLabeler, parse_labels
+
+TAGS = ['button', 'icon_button', 'health_bar', 'close_button']
+
+
+class FakeClaudeAgent:
+    """Отвечает заранее заданными тегами (answers) по номерам ячеек"""
+
+    def __init__(self):
+        self.calls = []
+        self.max_tokens = []
+
+    async def analyze_images(self, images, prompt, max_tokens=1000):
+        self.calls.append(images)
+        self.max_tokens.append(max_tokens)
+        return '[' + ', '.join(f'{{"index": {number}, "tag": "{tag}"}}'
+                               for number, tag in enumerate(self.answers[len(self.calls) - 1], 1)) + ']'
+
+
+class FailingClaudeAgent(FakeClaudeAgent):
+    """Запросы с номерами из failing падают, как analyze_images при 429"""
+
+    def __init__(self, failing):
+        super().__init__()
+        self.failing = failing
+
+    async def analyze_images(self, images, prompt, max_tokens=1000):
+        if len(self.calls) + 1 in self.failing:
+            self.calls.append(images)
+            raise RuntimeError("Error code: 429 - rate_limit_error")
+        return await super().analyze_images(images, prompt, max_tokens)
+
+
+class FixedDetector:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+    def _find_ui_elements(self, image):
+        return [{'bounds': [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]} for x1, y1, x2, y2 in self.boxes]
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def test_shelves_do_not_overlap():
+    rng = np.random.default_rng(1)
+    sizes = [(int(w), int(h)) for w, h in rng.integers(10, 300, size=(300, 2))]
+    sheets = pack_shelves(sizes, 1536, 1536, 8, max_cells=60)
+
+    placed = sorted(i for sheet in sheets for i, _, _ in sheet)
+    assert placed == list(range(len(sizes)))
+    for sheet in sheets:
+        assert len(sheet) <= 60
+        rects = [(x, y, x + sizes[i][0], y + sizes[i][1]) for i, x, y in sheet]
+        assert all(r[2] <= 1536 and r[3] <= 1536 for r in rects)
+        assert not any(_overlaps(a, b) for k, a in enumerate(rects) for b in rects[k + 1:])
+
+
+def test_sheet_cells_keep_crop_pixels():
+    crops = [Image.new('RGB', (40 + 10 * i, 30), (20 * i, 100, 200)) for i in range(12)]
+    sheets = build_sheets(crops)
+    assert len(sheets) == 1
+
+    cells = sheets[0].cells
+    assert [cell.number for cell in cells] == list(range(1, 13))
+    assert sorted(cell.item for cell in cells) == list(range(12))
+    for cell in cells:
+        x1, y1, x2, y2 = cell.box
+        assert sheets[0].image.getpixel((x1 + 5, y1 + 5)) == crops[cell.item].getpixel((0, 0))
+
+
+def test_parse_labels_normalizes_tags():
+    text = '```json\n[{"index": 2, "tag": "Play Button"}, {"index": 9, "tag": "button"}]\n```'
+    assert parse_labels(text, 3) == [None, 'play_button', None]
+    assert parse_labels('1: close_button\n2) health bar', 2) == ['close_button', 'health_bar']
+
+
+def test_parse_labels_recovers_truncated_reply():
+    text = '[{"index": 1, "tag": "close_button"}, {"index": 2, "tag": "health_bar"}, {"index": 3, "ta'
+    assert parse_labels(text, 4) == ['close_button', 'health_bar', None, None]
+
+
+def test_labels_map_back_to_elements_across_screenshots():
+    directory = Path(tempfile.mkdtemp())
+    boxes = [(10 + 60 * k, 10, 60 + 60 * k, 50) for k in range(8)]
+    paths = []
+    for n in range(3):
+        image = Image.new('RGB', (600, 100), 'white')
+        for k, (x1, y1, x2, y2) in enumerate(boxes):
+            image.paste(((n * 8 + k) % 4 * 64 + 10, 0, 0), (x1, y1, x2, y2))
+        paths.append(directory / f'screen_{n}.png')
+        image.save(paths[-1])
+
+    agent = FakeClaudeAgent()
+    labeler = RegionLabeler(claude_agent=agent, settings={'crop_padding': 0})
+    labeler._detector = FixedDetector(boxes)
+
+    # Ответ на лист строится по цвету вырезок в ячейках
+    sheets = build_sheets(sum((labeler._prepare(str(path))['crops'] for path in paths), []), labeler.settings)
+    agent.answers = [[TAGS[sheet.image.getpixel((cell.box[0] + 2, cell.box[1] + 2))[0] // 64]
+                      for cell in sheet.cells] for sheet in sheets]
+
+    results = asyncio.run(labeler.analyze_many([str(path) for path in paths]))
+
+    assert len(agent.calls) == 1 and len(agent.calls[0]) == 1  # один лист на 24 элемента
+    for n, result in enumerate(results):
+        assert result['requests'] == 1 and result['crops_sent'] == 8
+        assert [element['type'] for element in result['elements']] == [TAGS[(n * 8 + k) % 4] for k in range(8)]
+        assert {element['source'] for element in result['elements']} == {'claude'}
+
+
+def test_crops_mode_sends_images_directly():
+    directory = Path(tempfile.mkdtemp())
+    path = directory / 'screen.png'
+    Image.new('RGB', (400, 100), 'white').save(path)
+
+    agent = FakeClaudeAgent()
+    agent.answers = [['button'] * 5]
+    labeler = RegionLabeler(claude_agent=agent, settings={'packing': 'crops', 'crops_per_request': 5})
+    labeler._detector = FixedDetector([(10 + 70 * k, 10, 70 + 70 * k, 60) for k in range(5)])
+
+    result = asyncio.run(labeler.analyze(str(path)))
+    assert len(agent.calls) == 1 and len(agent.calls[0]) == 5
+    assert [element['type'] for element in result['elements']] == ['button'] * 5
+
+
+def test_reply_budget_covers_full_sheet():
+    crops = [Image.new('RGB', (60, 40), 'white') for _ in range(60)]
+    agent = FakeClaudeAgent()
+    agent.answers = [['close_button'] * 60]
+    labeler = RegionLabeler(claude_agent=agent)
+
+    labels, stats = asyncio.run(labeler.label_crops(crops))
+    assert stats['requests'] == 1 and labels == ['close_button'] * 60
+    # Ответ на полный лист - около 20 токенов на ячейку
+    assert agent.max_tokens[0] >= 20 * 60
+
+
+def test_failed_request_keeps_other_labels():
+    directory = Path(tempfile.mkdtemp())
+    paths = []
+    for n in range(2):
+        paths.append(directory / f'screen_{n}.png')
+        Image.new('RGB', (400, 100), 'white').save(paths[-1])
+
+    agent = FailingClaudeAgent(failing={2})
+    agent.answers = [['button'] * 4, None]
+    labeler = RegionLabeler(claude_agent=agent, settings={'packing': 'crops', 'crops_per_request': 4,
+                                                          'concurrent_requests': 1})
+    labeler._detector = FixedDetector([(10 + 90 * k, 10, 80 + 90 * k, 60) for k in range(4)])
+
+    first, second = asyncio.run(labeler.analyze_many([str(path) for path in paths]))
+    assert len(agent.calls) == 2
+    assert 'error' not in first and [element['type'] for element in first['elements']] == ['button'] * 4
+    assert '429' in second['error'] and [element['type'] for element in second['elements']] == [None] * 4
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"🎉 Все тесты прошли: {len(tests)}")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Тест локальной модели в гибридном агенте
+
+Имитация LocalVisionAgent "обучается" после создания гибридного агента,
+поэтому проверяется, что модель подхватывается без перезапуска, а при
+автоматической стратегии без внешних бэкендов возвращается результат
+локальной модели даже с низкой уверенностью.
+
+Запуск: python test_hybrid_local.py  (или pytest)
+"""
+import asyncio
+
+from config import LOCAL_MODEL_SETTINGS
+from hybrid_vision_agent import HybridUIVisionAgent
+
+
+class FakeLocalAgent:
+    """Модель появляется после train(); уверенность задается в тесте"""
+
+    def __init__(self, confidence):
+        self.model = None
+        self.confidence = confidence
+        self.calls = 0
+
+    def train(self):
+        self.model = object()
+
+    def is_available(self):
+        return self.model is not None
+
+    def reload_if_updated(self):
+        return False
+
+    def analyze_ui_elements(self, image_path):
+        self.calls += 1
+        return {'elements': [], 'summary': '', 'confidence': self.confidence}
+
+
+def _hybrid(local_agent):
+    agent = HybridUIVisionAgent(enable_phi=False, enable_claude=False, enable_local=True)
+    agent.local_agent = local_agent
+    return agent
+
+
+def test_local_model_trained_after_start_is_used():
+    local = FakeLocalAgent(confidence=LOCAL_MODEL_SETTINGS['min_confidence'])
+    agent = _hybrid(local)
+    assert agent.get_available_services() == []
+
+    local.train()
+    results = asyncio.run(agent.smart_ui_analysis('screen.png'))
+    assert agent.get_available_services() == ['local']
+    assert local.calls == 1 and results['method_used'] == 'local_only'
+
+
+def test_auto_returns_low_confidence_local_without_external_backends():
+    local = FakeLocalAgent(confidence=0.1)
+    local.train()
+
+    results = asyncio.run(_hybrid(local).smart_ui_analysis('screen.png'))
+    assert local.calls == 1
+    assert results['method_used'] == 'local_only'
+    assert results['confidence_score'] == 0.1
+    assert 'error' not in results
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"🎉 Все тесты прошли: {len(tests)}")
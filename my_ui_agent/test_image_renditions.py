@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Тест копий изображений для анализа цветов
+
+Анализ вне веб-приложения (CLI, пакет, наблюдение за папкой) не должен
+писать пирамиду копий в хранилище; загрузка веб-приложения создает копии
+заранее (prefetch_renditions), и анализ берет готовую копию colors.
+
+Запуск: python test_image_renditions.py  (или pytest)
+"""
+import tempfile
+from pathlib import Path
+
+from PIL import Image
+
+import image_renditions
+from agent import UIAnalysisAgent
+from config import Config
+from image_renditions import existing_rendition, prefetch_renditions
+
+
+def _image(directory: Path) -> Path:
+    path = directory / 'screen.png'
+    Image.new('RGB', (800, 400), (200, 30, 30)).save(path)
+    return path
+
+
+def _colors_with_root(agent, path, root):
+    original = Config.RENDITIONS_FOLDER
+    Config.RENDITIONS_FOLDER = root
+    try:
+        with Image.open(path) as image:
+            image.load()
+            return agent._colors_image(str(path), image)
+    finally:
+        Config.RENDITIONS_FOLDER = original
+
+
+def test_analysis_does_not_create_renditions():
+    directory = Path(tempfile.mkdtemp())
+    path = _image(directory)
+    root = directory / 'renditions'
+
+    small = _colors_with_root(UIAnalysisAgent(), path, root)
+    assert small.size == (100, 50)
+    assert not root.exists()
+    assert existing_rendition(path, 'colors', root) is None
+
+
+def test_analysis_reuses_prefetched_rendition():
+    directory = Path(tempfile.mkdtemp())
+    path = _image(directory)
+    root = directory / 'renditions'
+
+    meta = prefetch_renditions(path, root).result()
+    expected = image_renditions.rendition_dir(meta['digest'], root) / meta['files']['colors']
+    assert existing_rendition(path, 'colors', root) == expected
+
+    small = _colors_with_root(UIAnalysisAgent(), path, root)
+    assert small.size == (100, 50)
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"🎉 Все тесты прошли: {len(tests)}")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Тест сохранения и чтения результатов во всех форматах result_io
+
+Результат содержит то, что реально пишет анализ: наивный datetime
+(timestamp), date, Path, числа numpy и ElementTable, - и проверяется,
+что каждый установленный формат с каждым сжатием читается обратно
+одинаково (даты - строки ISO, как в JSON).
+
+Запуск: python test_result_io.py  (или pytest)
+"""
+import tempfile
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+
+import result_io
+from element_table import ElementTable
+from result_io import COMPRESSION_EXTENSIONS, dump_results, encode_results, load_results
+
+TIMESTAMP = datetime(2024, 5, 17, 12, 30, 15)
+
+
+def _available_formats():
+    return ['json'] + [fmt for fmt, installed in (('msgpack', result_io.HAS_MSGPACK),
+                                                   ('cbor', result_io.HAS_CBOR)) if installed]
+
+
+def _available_compressions():
+    return [compression for compression in COMPRESSION_EXTENSIONS if compression != 'zstd' or result_io.HAS_ZSTD]
+
+
+def _results():
+    table = ElementTable.from_elements([
+        {'bounds': [(10, 20), (110, 20), (110, 60), (10, 60)], 'type': 'button', 'confidence': 0.9},
+        {'bounds': [(0, 0), (30, 0), (30, 30), (0, 30)], 'type': 'not_a_tag', 'confidence': 0.5}
+    ])
+    return {
+        'timestamp': TIMESTAMP,
+        'session': {'day': date(2024, 5, 17), 'image_path': Path('screens') / 'a.png'},
+        'statistics': {'ui_elements': np.int64(2), 'confidence': np.float32(0.5)},
+        'sizes': (1080, 1920),
+        'ui_elements': table
+    }
+
+
+def _check(loaded):
+    assert loaded['timestamp'] == TIMESTAMP.isoformat()
+    assert loaded['session'] == {'day': '2024-05-17', 'image_path': str(Path('screens') / 'a.png')}
+    assert loaded['statistics'] == {'ui_elements': 2, 'confidence': 0.5}
+    assert list(loaded['sizes']) == [1080, 1920]
+
+    table = loaded['ui_elements']
+    assert isinstance(table, ElementTable) and len(table) == 2
+    assert [table.type_name(i) for i in range(2)] == ['button', 'not_a_tag']
+    assert np.allclose(table.boxes[0], [10, 20, 110, 60])
+
+
+def test_every_format_round_trips():
+    directory = Path(tempfile.mkdtemp())
+    for fmt in _available_formats():
+        for compression in _available_compressions():
+            path = dump_results(_results(), directory / f'result_{fmt}_{compression}', fmt, compression)
+            _check(load_results(path, restore_tables=True))
+
+
+def test_cbor_encodes_naive_datetime():
+    if not result_io.HAS_CBOR:
+        return
+    payload = encode_results({'timestamp': datetime.now(), 'items': [{'day': date.today()}]}, 'cbor')
+    decoded = result_io.decode_results(payload, 'cbor')
+    assert isinstance(decoded['timestamp'], str) and isinstance(decoded['items'][0]['day'], str)
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"🎉 Все тесты прошли: {len(tests)}")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Тест пакетного клиента Google Vision на локальной имитации API
+
+Имитация отвечает на batch_annotate_images так же, как Vision API
+(text_annotations, localized_object_annotations, error), и запоминает
+запросы, поэтому проверяется число обращений и состав функций без
+учетных данных и сети.
+
+Запуск: python test_vision_batch_client.py  (или pytest)
+"""
+from types import SimpleNamespace
+
+from config import ANALYSIS_SETTINGS
+from vision_batch_client import (MAX_BATCH_IMAGES, OBJECT_LOCALIZATION, TEXT_DETECTION,
+                                 VisionBatchClient, enabled_features)
+
+
+def _vertices(x1, y1, x2, y2):
+    return SimpleNamespace(vertices=[SimpleNamespace(x=x, y=y) for x, y in ((x1, y1), (x2, y1), (x2, y2), (x1, y2))],
+                           normalized_vertices=[SimpleNamespace(x=x / 1000, y=y / 1000)
+                                                for x, y in ((x1, y1), (x2, y1), (x2, y2), (x1, y2))])
+
+
+class FakeVisionClient:
+    """Ответ на изображение зависит от его содержимого: b'bad' - ошибка изображения"""
+
+    def __init__(self):
+        self.calls = []
+
+    def batch_annotate_images(self, requests):
+        self.calls.append(requests)
+        responses = []
+        for request in requests:
+            content = request['image']['content']
+            if content == b'bad':
+                responses.append(SimpleNamespace(error=SimpleNamespace(code=3, message='Bad image data'),
+                                                 text_annotations=[], localized_object_annotations=[]))
+                continue
+            word = content[:8].decode('latin-1')
+            responses.append(SimpleNamespace(
+                error=SimpleNamespace(code=0, message=''),
+                # Первым идет блок полного текста, затем отдельные слова
+                text_annotations=[
+                    SimpleNamespace(description=f"{word} PLAY", bounding_poly=_vertices(10, 10, 200, 40)),
+                    SimpleNamespace(description=word, bounding_poly=_vertices(10, 10, 90, 40)),
+                    SimpleNamespace(description='PLAY', bounding_poly=_vertices(110, 10, 200, 40)),
+                ],
+                localized_object_annotations=[
+                    SimpleNamespace(name='Button', score=0.8, bounding_poly=_vertices(100, 0, 210, 50))
+                ]
+            ))
+        return SimpleNamespace(responses=responses)
+
+
+def test_single_request_with_all_features():
+    client = FakeVisionClient()
+    results = VisionBatchClient(client).annotate_contents([b'START'])
+
+    assert len(client.calls) == 1
+    feature_types = [feature['type_'] for feature in client.calls[0][0]['features']]
+    assert feature_types == [TEXT_DETECTION, OBJECT_LOCALIZATION]
+
+    texts = sorted(element['text'] for element in results[0]['text_elements'])
+    assert texts == ['PLAY', 'START']  # блок полного текста отброшен
+    assert results[0]['objects'][0]['name'] == 'Button'
+
+
+def test_features_follow_settings():
+    settings = {**ANALYSIS_SETTINGS, 'enable_object_detection': False}
+    assert [feature['type_'] for feature in enabled_features(settings)] == [TEXT_DETECTION]
+
+    client = FakeVisionClient()
+    results = VisionBatchClient(client, {**settings, 'enable_text_detection': False}).annotate_contents([b'A'])
+    assert client.calls == [] and results == [{'text_elements': [], 'objects': []}]
+
+
+def test_images_are_batched_and_split_back():
+    client = FakeVisionClient()
+    contents = [f"W{i}".encode() for i in range(MAX_BATCH_IMAGES + 4)]
+    batch_client = VisionBatchClient(client)
+    results = batch_client.annotate_contents(contents)
+
+    assert [len(requests) for requests in client.calls] == [MAX_BATCH_IMAGES, 4]
+    assert batch_client.round_trips == 2
+    for i, result in enumerate(results):
+        assert f"W{i}" in [element['text'] for element in result['text_elements']]
+
+
+def test_batch_limited_by_size():
+    client = FakeVisionClient()
+    settings = {**ANALYSIS_SETTINGS, 'vision_batch_max_bytes': 5}
+    VisionBatchClient(client, settings).annotate_contents([b'AAA', b'BBB', b'C'])
+    assert [len(requests) for requests in client.calls] == [1, 2]
+
+
+def test_error_of_one_image_does_not_break_batch():
+    client = FakeVisionClient()
+    results = VisionBatchClient(client).annotate_contents([b'OK', b'bad', b'FINE'])
+
+    assert len(client.calls) == 1
+    assert 'error' not in results[0] and 'error' not in results[2]
+    assert results[1]['error'] == 'Bad image data'
+    assert results[1]['text_elements'] == []
+
+
+def test_agent_uses_one_round_trip(tmp_path=None):
+    import tempfile
+    from pathlib import Path
+    from PIL import Image
+    from agent import UIAnalysisAgent
+
+    directory = Path(tmp_path or tempfile.mkdtemp())
+    image_path = directory / 'screen.png'
+    Image.new('RGB', (400, 300), 'white').save(image_path)
+
+    agent = UIAnalysisAgent()
+    client = FakeVisionClient()
+    agent.vision_client = client
+    results = agent._analyze_with_vision_api(str(image_path))
+
+    assert len(client.calls) == 1
+    assert results['objects'][0]['name'] == 'Button'
+
+
+def test_tiled_analysis_requests_text_only(tmp_path=None):
+    import tempfile
+    from pathlib import Path
+    from PIL import Image
+    from agent import UIAnalysisAgent
+
+    directory = Path(tmp_path or tempfile.mkdtemp())
+    image_path = directory / 'tall.png'
+    Image.new('RGB', (1000, 3000), 'white').save(image_path)
+
+    agent = UIAnalysisAgent()
+    client = FakeVisionClient()
+    agent.vision_client = client
+    results = agent.analyze_image(str(image_path), tiled=True)
+
+    assert results['metadata']['tiles'] > 1 and len(client.calls) == 1
+    features = {feature['type_'] for request in client.calls[0] for feature in request['features']}
+    assert features == {TEXT_DETECTION}  # объекты тайлов не используются - не запрашиваются
+
+
+if __name__ == "__main__":
+    tests = [value for name, value in sorted(globals().items()) if name.startswith('test_')]
+    for test in tests:
+        test()
+        print(f"✅ {test.__name__}")
+    print(f"🎉 Все тесты прошли: {len(tests)}")
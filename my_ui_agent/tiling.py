@@ -0,0 +1,47 @@
+"""
+Нарезка больших скриншотов на перекрывающиеся тайлы
+
+Используется тайловым режимом UIAnalysisAgent.analyze_image: каждый тайл
+анализируется отдельно, координаты найденных элементов переносятся
+обратно в систему координат исходного изображения. Дубликаты на стыках
+тайлов объединяются через box_ops.dedupe_elements.
+"""
+from typing import Dict, List, Tuple
+
+
+def compute_tiles(width: int, height: int, tile_size: int, overlap: int) -> List[Tuple[int, int, int, int]]:
+    """
+    Сетка тайлов, покрывающая изображение
+
+    Последний тайл в ряду/колонке прижимается к краю изображения, поэтому
+    все тайлы (кроме случая маленького изображения) имеют полный размер.
+
+    Returns:
+        Список (x, y, w, h)
+    """
+    if overlap >= tile_size:
+        raise ValueError("Перекрытие должно быть меньше размера тайла")
+
+    def axis_starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        stride = tile_size - overlap
+        starts = list(range(0, length - tile_size, stride))
+        starts.append(length - tile_size)
+        return starts
+
+    return [
+        (x, y, min(tile_size, width - x), min(tile_size, height - y))
+        for y in axis_starts(height)
+        for x in axis_starts(width)
+    ]
+
+
+def offset_elements(elements: List[Dict], dx: int, dy: int) -> List[Dict]:
+    """Переносит координаты элементов тайла в координаты изображения"""
+    shifted = []
+    for element in elements:
+        element = dict(element)
+        element['bounds'] = [(x + dx, y + dy) for x, y in element.get('bounds', [])]
+        shifted.append(element)
+    return shifted
@@ -0,0 +1,367 @@
+"""
+Экспорт обучающего датасета в форматы YOLO, COCO и Pascal VOC
+
+Записи training_dataset/entry_* обрабатываются параллельно в пуле
+процессов. Размер изображения берется из сохраненных метаданных или
+заголовка файла, пиксели не декодируются. Классы нумеруются по
+ALL_UI_TAGS, поэтому ID тега не зависит от состава датасета, а
+неизвестные теги пропускаются, а не получают ID 0.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from config import Config, DATASET_SETTINGS
+from constants import ALL_UI_TAGS
+from box_ops import nms
+from dataset_entries import (
+    iter_entry_dirs, load_entry, entry_image_path, entry_image_size, entry_elements
+)
+
+SUPPORTED_FORMATS = ('yolo', 'coco', 'voc')
+SPLITS = ('train', 'val', 'test')
+
+# Стабильная карта классов: порядок задается таксономией
+CLASS_MAP = {tag: class_id for class_id, tag in enumerate(ALL_UI_TAGS)}
+
+
+def get_class_id(tag: str) -> Optional[int]:
+    """ID класса для тега таксономии; None для неизвестных тегов"""
+    return CLASS_MAP.get(tag)
+
+
+def assign_split(entry_id: str, ratios: Tuple[float, float, float], seed: str = '') -> str:
+    """
+    Детерминированный выбор train/val/test по хэшу ID записи
+
+    Запись не меняет сплит при добавлении новых записей в датасет.
+    """
+    digest = hashlib.sha1(f"{seed}{entry_id}".encode('utf-8')).digest()
+    position = int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+    threshold = 0.0
+    for split, ratio in zip(SPLITS, ratios):
+        threshold += ratio
+        if position < threshold:
+            return split
+    return SPLITS[-1]
+
+
+def _link_or_copy(src: Path, dst: Path):
+    """
+    Жесткая ссылка, если возможно, иначе копирование
+
+    Существующий файл заменяется: изображение записи могли пересохранить
+    после прошлого экспорта.
+    """
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _voc_xml(filename: str, width: int, height: int, objects: List[Dict]) -> str:
+    """Разметка Pascal VOC для одного изображения"""
+    lines = [
+        '<annotation>',
+        '  <folder>images</folder>',
+        f'  <filename>{escape(filename)}</filename>',
+        '  <size>',
+        f'    <width>{width}</width>',
+        f'    <height>{height}</height>',
+        '    <depth>3</depth>',
+        '  </size>',
+        '  <segmented>0</segmented>',
+    ]
+    for obj in objects:
+        x1, y1, x2, y2 = obj['bbox']
+        lines.extend([
+            '  <object>',
+            f"    <name>{escape(obj['tag'])}</name>",
+            '    <pose>Unspecified</pose>',
+            '    <truncated>0</truncated>',
+            '    <difficult>0</difficult>',
+            '    <bndbox>',
+            f'      <xmin>{int(round(x1))}</xmin>',
+            f'      <ymin>{int(round(y1))}</ymin>',
+            f'      <xmax>{int(round(x2))}</xmax>',
+            f'      <ymax>{int(round(y2))}</ymax>',
+            '    </bndbox>',
+            '  </object>',
+        ])
+    lines.append('</annotation>')
+    return '\n'.join(lines) + '\n'
+
+
+def _export_entry(task: Dict) -> Dict:
+    """
+    Экспорт одной записи (выполняется в процессе-воркере)
+
+    YOLO и VOC файлы пишутся сразу, COCO-фрагмент возвращается в
+    родительский процесс для сборки общего JSON.
+    """
+    entry_dir = Path(task['entry_dir'])
+    output_dir = Path(task['output_dir'])
+    entry_id = entry_dir.name
+    result = {'entry_id': entry_id, 'status': 'skipped', 'objects': 0, 'unknown_tags': 0}
+
+    data = load_entry(entry_dir)
+    if data is None:
+        result['reason'] = 'broken data.json'
+        return result
+
+    image_path = entry_image_path(entry_dir, data)
+    size = entry_image_size(entry_dir, data)
+    if image_path is None or size is None:
+        result['reason'] = 'no image'
+        return result
+    width, height = size
+
+    objects = []
+    for element in entry_elements(data):
+        if not (element['verified'] or task['include_predicted']):
+            continue
+        tag = element['tag']
+        if tag is None or get_class_id(tag) is None:
+            result['unknown_tags'] += 1
+            continue
+
+        x1, y1, x2, y2 = element['bbox']
+        x1, x2 = max(0.0, min(x1, width)), max(0.0, min(x2, width))
+        y1, y2 = max(0.0, min(y1, height)), max(0.0, min(y2, height))
+        if x2 <= x1 or y2 <= y1:
+            continue
+        objects.append({
+            'tag': tag,
+            'class_id': get_class_id(tag),
+            'bbox': (x1, y1, x2, y2),
+            'score': 1.0 if element['verified'] else (element['confidence'] or 0.0)
+        })
+
+    # Один и тот же объект, размеченный дважды (блок и слова, дубли детектора)
+    if len(objects) > 1:
+        keep = nms(np.array([obj['bbox'] for obj in objects], dtype=np.float32),
+                   np.array([obj['score'] for obj in objects], dtype=np.float32),
+                   task['nms_iou'], classes=[obj['class_id'] for obj in objects])
+        objects = [objects[i] for i in sorted(keep)]
+
+    if not objects and not task['include_empty']:
+        result['reason'] = 'no labeled elements'
+        return result
+
+    split = task['split']
+    stem = entry_id
+    image_name = f"{stem}{image_path.suffix.lower()}"
+    formats = task['formats']
+
+    _link_or_copy(image_path, output_dir / 'images' / split / image_name)
+
+    if 'yolo' in formats:
+        with open(output_dir / 'labels' / split / f"{stem}.txt", 'w') as f:
+            for obj in objects:
+                x1, y1, x2, y2 = obj['bbox']
+                x_center = (x1 + x2) / 2 / width
+                y_center = (y1 + y2) / 2 / height
+                f.write(f"{obj['class_id']} {x_center:.6f} {y_center:.6f} "
+                        f"{(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}\n")
+
+    if 'voc' in formats:
+        with open(output_dir / 'voc' / split / f"{stem}.xml", 'w', encoding='utf-8') as f:
+            f.write(_voc_xml(image_name, width, height, objects))
+
+    result.update({
+        'status': 'exported',
+        'split': split,
+        'objects': len(objects),
+        'image': {'file_name': image_name, 'width': width, 'height': height},
+        'annotations': [
+            {'category_id': obj['class_id'], 'bbox': obj['bbox']}
+            for obj in objects
+        ] if 'coco' in formats else []
+    })
+    return result
+
+
+class TrainingFormatExporter:
+    """Параллельный экспорт датасета в форматы для обучения детекторов"""
+
+    def __init__(self, dataset_dir=None, output_dir=None, formats: Optional[List[str]] = None,
+                 split_ratios: Optional[Tuple[float, float, float]] = None,
+                 include_predicted: bool = False, include_empty: bool = False,
+                 workers: Optional[int] = None, split_seed: str = '',
+                 nms_iou: float = 0.7):
+        """
+        Args:
+            dataset_dir: Папка training_dataset
+            output_dir: Куда писать экспорт
+            formats: Подмножество ('yolo', 'coco', 'voc'); по умолчанию из DATASET_SETTINGS
+            split_ratios: Доли train/val/test
+            include_predicted: Экспортировать непроверенные предсказания агента
+            include_empty: Экспортировать изображения без размеченных элементов
+            workers: Число процессов (по умолчанию по числу ядер)
+            split_seed: Соль для хэша сплита
+            nms_iou: Порог IoU для удаления дублей одного класса
+        """
+        self.dataset_dir = Path(dataset_dir or Config.DATASET_FOLDER)
+        self.output_dir = Path(output_dir or DATASET_SETTINGS['export_dir'])
+
+        requested = formats or DATASET_SETTINGS['annotation_formats']
+        # 'json' - это исходный формат data.json, отдельно не экспортируется
+        self.formats = [f for f in requested if f in SUPPORTED_FORMATS]
+        unknown = [f for f in requested if f not in SUPPORTED_FORMATS and f != 'json']
+        if unknown:
+            raise ValueError(f"Неподдерживаемые форматы: {unknown}")
+
+        self.split_ratios = tuple(split_ratios or DATASET_SETTINGS['split_ratios'])
+        if abs(sum(self.split_ratios) - 1.0) > 1e-6:
+            raise ValueError("Сумма долей train/val/test должна быть равна 1")
+
+        self.include_predicted = include_predicted
+        self.include_empty = include_empty
+        self.workers = workers
+        self.split_seed = split_seed
+        self.nms_iou = nms_iou
+
+    def _prepare_dirs(self):
+        """
+        Создает структуру папок экспорта
+
+        Файлы прошлого экспорта в папках сплитов удаляются: иначе в них
+        остались бы изображения и разметка удаленных с тех пор записей.
+        """
+        for split in SPLITS:
+            for kind in ('images', 'labels', 'voc'):
+                split_dir = self.output_dir / kind / split
+                if split_dir.is_dir():
+                    for path in split_dir.iterdir():
+                        if path.is_file() or path.is_symlink():
+                            path.unlink()
+            (self.output_dir / 'images' / split).mkdir(parents=True, exist_ok=True)
+            if 'yolo' in self.formats:
+                (self.output_dir / 'labels' / split).mkdir(parents=True, exist_ok=True)
+            if 'voc' in self.formats:
+                (self.output_dir / 'voc' / split).mkdir(parents=True, exist_ok=True)
+        if 'coco' in self.formats:
+            (self.output_dir / 'coco').mkdir(parents=True, exist_ok=True)
+
+    def export(self) -> Dict:
+        """
+        Запуск экспорта
+
+        Returns:
+            Статистика экспорта по сплитам
+        """
+        self._prepare_dirs()
+
+        tasks = [
+            {
+                'entry_dir': str(entry_dir),
+                'output_dir': str(self.output_dir),
+                'split': assign_split(entry_dir.name, self.split_ratios, self.split_seed),
+                'formats': self.formats,
+                'include_predicted': self.include_predicted,
+                'include_empty': self.include_empty,
+                'nms_iou': self.nms_iou,
+            }
+            for entry_dir in iter_entry_dirs(self.dataset_dir)
+        ]
+
+        logging.info(f"🚀 Экспорт {len(tasks)} записей в форматы: {', '.join(self.formats)}")
+
+        # Результаты приходят в порядке задач, поэтому COCO ID стабильны
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(_export_entry, tasks, chunksize=32))
+
+        stats = {
+            'timestamp': datetime.now().isoformat(),
+            'formats': self.formats,
+            'exported': 0,
+            'skipped': 0,
+            'objects': 0,
+            'unknown_tags': 0,
+            'splits': {split: 0 for split in SPLITS}
+        }
+        for result in results:
+            stats['unknown_tags'] += result['unknown_tags']
+            if result['status'] == 'exported':
+                stats['exported'] += 1
+                stats['objects'] += result['objects']
+                stats['splits'][result['split']] += 1
+            else:
+                stats['skipped'] += 1
+
+        if 'coco' in self.formats:
+            self._write_coco(results)
+        self._write_class_files()
+
+        with open(self.output_dir / 'export_stats.json', 'w', encoding='utf-8') as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+
+        logging.info(f"🎉 Экспорт завершен: {stats['exported']} изображений, {stats['objects']} объектов")
+        return stats
+
+    def _write_coco(self, results: List[Dict]):
+        """Собирает COCO JSON по сплитам из фрагментов воркеров"""
+        categories = [
+            {'id': class_id, 'name': tag, 'supercategory': 'ui'}
+            for tag, class_id in CLASS_MAP.items()
+        ]
+
+        for split in SPLITS:
+            images, annotations = [], []
+            for result in results:
+                if result['status'] != 'exported' or result['split'] != split:
+                    continue
+                image_id = len(images) + 1
+                images.append({'id': image_id, **result['image']})
+                for annotation in result['annotations']:
+                    x1, y1, x2, y2 = annotation['bbox']
+                    annotations.append({
+                        'id': len(annotations) + 1,
+                        'image_id': image_id,
+                        'category_id': annotation['category_id'],
+                        'bbox': [round(x1, 2), round(y1, 2), round(x2 - x1, 2), round(y2 - y1, 2)],
+                        'area': round((x2 - x1) * (y2 - y1), 2),
+                        'iscrowd': 0
+                    })
+
+            coco = {
+                'info': {'description': 'Mobile gaming UI dataset', 'date_created': datetime.now().isoformat()},
+                'images': images,
+                'annotations': annotations,
+                'categories': categories
+            }
+            with open(self.output_dir / 'coco' / f"instances_{split}.json", 'w', encoding='utf-8') as f:
+                json.dump(coco, f, ensure_ascii=False)
+
+    def _write_class_files(self):
+        """classes.txt и data.yaml для YOLO"""
+        with open(self.output_dir / 'classes.txt', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(CLASS_MAP) + '\n')
+
+        if 'yolo' in self.formats:
+            lines = [f"path: {self.output_dir.resolve()}"]
+            lines += [f"{split}: images/{split}" for split in SPLITS]
+            lines.append(f"nc: {len(CLASS_MAP)}")
+            lines.append("names:")
+            lines += [f"  {class_id}: {tag}" for tag, class_id in CLASS_MAP.items()]
+            with open(self.output_dir / 'data.yaml', 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    formats = sys.argv[1].split(',') if len(sys.argv) > 1 else None
+    exporter = TrainingFormatExporter(formats=formats)
+    print(json.dumps(exporter.export(), ensure_ascii=False, indent=2))
@@ -0,0 +1,150 @@
+"""
+Пакетные запросы к Google Cloud Vision
+
+Вместо двух запросов на изображение (text_detection и
+object_localization) все включенные функции (ANALYSIS_SETTINGS
+enable_text_detection / enable_object_detection / enable_face_detection)
+запрашиваются одним AnnotateImageRequest, а запросы нескольких
+изображений объединяются в один вызов batch_annotate_images - до 16
+изображений и vision_batch_max_bytes содержимого на вызов. Ответы
+раскладываются обратно по изображениям в формате агента: text_elements
+и objects. Ошибка одного изображения не мешает остальным в пакете.
+
+Клиент передается готовым (vision.ImageAnnotatorClient или совместимый
+объект с методом batch_annotate_images), запросы - словарями, поэтому
+модуль не импортирует google-cloud-vision сам.
+"""
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from box_ops import dedupe_elements
+from config import ANALYSIS_SETTINGS
+
+# Предел API: изображений в одном batch_annotate_images
+MAX_BATCH_IMAGES = 16
+
+# Feature.Type Vision API
+TEXT_DETECTION = 5
+OBJECT_LOCALIZATION = 19
+FACE_DETECTION = 1
+
+
+def enabled_features(settings: Optional[Dict] = None) -> List[Dict]:
+    """Функции запроса по настройкам анализа"""
+    settings = settings or ANALYSIS_SETTINGS
+    features = []
+    if settings.get('enable_text_detection', True):
+        features.append({'type_': TEXT_DETECTION})
+    if settings.get('enable_object_detection', True):
+        features.append({'type_': OBJECT_LOCALIZATION, 'max_results': settings['max_results']})
+    if settings.get('enable_face_detection'):
+        features.append({'type_': FACE_DETECTION, 'max_results': settings['max_results']})
+    return features
+
+
+def parse_response(response) -> Dict[str, Any]:
+    """
+    Ответ на одно изображение -> text_elements, objects (и faces)
+
+    Полный текст, который Vision возвращает первым блоком, и перекрывающиеся
+    дубликаты отбрасываются в пользу отдельных слов.
+    """
+    result: Dict[str, Any] = {'text_elements': [], 'objects': []}
+    error = getattr(response, 'error', None)
+    if error is not None and getattr(error, 'code', 0):
+        result['error'] = error.message or f"Vision API error {error.code}"
+        return result
+
+    text_elements = []
+    for text in response.text_annotations:
+        if text.description.strip():
+            text_elements.append({
+                'text': text.description,
+                'bounds': [(v.x, v.y) for v in text.bounding_poly.vertices],
+                'confidence': getattr(text, 'confidence', 0) or ANALYSIS_SETTINGS['default_text_confidence']
+            })
+    result['text_elements'] = dedupe_elements(
+        text_elements, ANALYSIS_SETTINGS['nms_iou_threshold'], ANALYSIS_SETTINGS['containment_threshold'],
+        keep='inner', class_key=None
+    )
+
+    for obj in response.localized_object_annotations:
+        result['objects'].append({
+            'name': obj.name,
+            'confidence': obj.score,
+            'bounds': [(v.x, v.y) for v in obj.bounding_poly.normalized_vertices]
+        })
+
+    faces = getattr(response, 'face_annotations', None)
+    if faces:
+        result['faces'] = [{
+            'confidence': face.detection_confidence,
+            'bounds': [(v.x, v.y) for v in face.bounding_poly.vertices]
+        } for face in faces]
+    return result
+
+
+class VisionBatchClient:
+    """Все функции и несколько изображений в одном вызове Vision API"""
+
+    def __init__(self, client, settings: Optional[Dict] = None):
+        self.client = client
+        self.settings = settings or ANALYSIS_SETTINGS
+        self.features = enabled_features(self.settings)
+        self.batch_size = min(self.settings.get('vision_batch_size', MAX_BATCH_IMAGES), MAX_BATCH_IMAGES)
+        self.max_bytes = self.settings.get('vision_batch_max_bytes')
+        self.round_trips = 0
+
+    def _batches(self, contents: Sequence[bytes]) -> Iterator[range]:
+        """Диапазоны индексов пакетов с учетом числа изображений и объема"""
+        start, size = 0, 0
+        for i, content in enumerate(contents):
+            full = i - start >= self.batch_size
+            too_big = self.max_bytes and i > start and size + len(content) > self.max_bytes
+            if full or too_big:
+                yield range(start, i)
+                start, size = i, 0
+            size += len(content)
+        if start < len(contents):
+            yield range(start, len(contents))
+
+    def annotate_contents(self, contents: Sequence[bytes]) -> List[Dict[str, Any]]:
+        """
+        Анализ закодированных изображений
+
+        Returns:
+            По результату на изображение в порядке contents:
+            text_elements, objects и error при ошибке
+        """
+        if not self.features:
+            return [{'text_elements': [], 'objects': []} for _ in contents]
+
+        results: List[Dict[str, Any]] = []
+        for batch in self._batches(contents):
+            requests = [{'image': {'content': contents[i]}, 'features': self.features} for i in batch]
+            try:
+                response = self.client.batch_annotate_images(requests=requests)
+                self.round_trips += 1
+            except Exception as e:
+                logging.warning(f"⚠️ Vision API: пакет из {len(batch)} изображений не обработан: {e}")
+                results.extend({'text_elements': [], 'objects': [], 'error': str(e)} for _ in batch)
+                continue
+            results.extend(parse_response(item) for item in response.responses)
+        return results
+
+    def annotate_paths(self, image_paths: Sequence) -> List[Dict[str, Any]]:
+        """Анализ файлов изображений (чтение файла с ошибкой дает error в его результате)"""
+        contents: List[bytes] = []
+        errors: Dict[int, str] = {}
+        for i, image_path in enumerate(image_paths):
+            try:
+                contents.append(Path(image_path).read_bytes())
+            except OSError as e:
+                errors[i] = str(e)
+
+        annotated = iter(self.annotate_contents(contents))
+        return [
+            {'text_elements': [], 'objects': [], 'error': errors[i]} if i in errors else next(annotated)
+            for i in range(len(image_paths))
+        ]
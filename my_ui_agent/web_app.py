@@ -1,18 +1,27 @@
 """
 Flask Web Application for UI Analysis
 """
+import gc
+import io
 import os
 import json
 import uuid
 import shutil
+import threading
 from datetime import datetime
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_from_directory, redirect, url_for, session, flash
+from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, session, flash, abort
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
 from agent import UIAnalysisAgent
+from annotation_renderer import PIL_FORMATS, element_geometry, render_annotated_image
 from config import Config
 from constants import MOBILE_GAMING_UI_TAXONOMY
+from dataset_entries import iter_entry_dirs, load_entry
+from image_renditions import (content_digest, image_info, prefetch_renditions, rendition_path,
+                              set_immutable, set_revalidate)
+from result_io import to_serializable
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -24,13 +33,84 @@ os.makedirs(app.config['DATASET_FOLDER'], exist_ok=True)
 # Разрешенные расширения файлов - ВОССТАНОВЛЕНО
 ALLOWED_EXTENSIONS = app.config.get('ALLOWED_EXTENSIONS', {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp'})
 
-# Инициализация UI агента
-ui_agent = UIAnalysisAgent() # Удаляем глобальную инициализацию
+# UI агент создается один раз в каждом процессе-воркере (см. get_ui_agent)
+_ui_agent = None
+_ui_agent_pid = None
+_ui_agent_lock = threading.Lock()
+
+# Ответ /api/taxonomy, подготовленный заранее
+_taxonomy_json = None
+
+def get_ui_agent() -> UIAnalysisAgent:
+    """
+    UI агент текущего процесса
+    
+    В production-режиме воркеры создаются fork'ом мастера; клиенты внешних
+    API нельзя разделять между процессами, поэтому агент создается заново,
+    если PID изменился, и один раз на процесс - дальше переиспользуется
+    всеми потоками воркера.
+    """
+    global _ui_agent, _ui_agent_pid
+    if _ui_agent is None or _ui_agent_pid != os.getpid():
+        with _ui_agent_lock:
+            if _ui_agent is None or _ui_agent_pid != os.getpid():
+                agent = UIAnalysisAgent()
+                agent.vision_client  # клиент Vision API создается сразу, а не на первом запросе
+                _ui_agent, _ui_agent_pid = agent, os.getpid()
+    return _ui_agent
+
+def preload_shared_state():
+    """
+    Загрузка read-only состояния до fork воркеров
+    
+    Таксономия, словари классов и скомпилированные шаблоны загружаются в
+    мастер-процессе и достаются воркерам через copy-on-write. gc.freeze()
+    убирает эти объекты из обхода сборщика мусора, чтобы он не трогал их
+    страницы памяти в воркерах и не вызывал копирование.
+    """
+    global _taxonomy_json
+    import element_table
+    import training_export
+    
+    _taxonomy_json = json.dumps(MOBILE_GAMING_UI_TAXONOMY, ensure_ascii=False)
+    for template_name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(template_name)
+    
+    gc.collect()
+    gc.freeze()
+    app.logger.info(f"Общее состояние загружено: {len(training_export.CLASS_MAP)} классов, "
+                    f"{len(element_table.TYPE_NAMES)} типов элементов, "
+                    f"{len(app.jinja_env.list_templates())} шаблонов")
 
 def get_ui_taxonomy():
     """Возвращает таксономию UI элементов"""
     return MOBILE_GAMING_UI_TAXONOMY
 
+def _bounding_poly(bounds):
+    """Вершины [(x, y), ...] -> формат bounding_poly, который читает annotate.html"""
+    return {'vertices': [{'x': x, 'y': y} for x, y in bounds]}
+
+def build_session_analysis(results):
+    """Результаты UIAnalysisAgent в формате страницы аннотации"""
+    analysis = dict(results)
+    analysis['texts'] = [
+        {
+            'description': element.get('text', ''),
+            'bounding_poly': _bounding_poly(element['bounds']),
+            'confidence': element.get('confidence')
+        }
+        for element in results.get('text_elements', [])
+    ]
+    analysis['ui_elements'] = [
+        {
+            'type': element.get('type'),
+            'bounding_poly': _bounding_poly(element['bounds']),
+            'confidence': element.get('confidence')
+        }
+        for element in results.get('ui_elements', [])
+    ]
+    return analysis
+
 @app.route('/')
 def index():
     """Главная страница с формой загрузки"""
@@ -38,7 +118,13 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Обработка загруженного файла"""
+    """
+    Обработка загруженного файла
+
+    Запрос синхронный: изображение анализируется целиком, данные сессии
+    пишутся в <файл>.json для страницы аннотации, и только потом идет
+    редирект. Поток воркера занят на все время анализа.
+    """
     if 'file' not in request.files:
         return jsonify({'error': 'Не выбран файл'}), 400
     
@@ -53,6 +139,21 @@ def upload_file():
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
         file.save(filepath)
         
+        # Копии для страницы аннотации и анализа создаются в фоне, пока идет анализ
+        renditions = prefetch_renditions(filepath)
+        
+        # Анализ и данные сессии для страницы аннотации
+        results = get_ui_agent().analyze_image(filepath, tiled=tiled_option(request.form))
+        session_data = {
+            'filename': unique_filename,
+            'original_filename': original_filename,
+            'timestamp': results['timestamp'],
+            'image': image_info(renditions.result()),
+            'analysis_result': build_session_analysis(results)
+        }
+        with open(f"{filepath}.json", 'w', encoding='utf-8') as f:
+            json.dump(session_data, f, ensure_ascii=False, indent=2, default=to_serializable)
+        
         return redirect(url_for('annotate', filename=unique_filename))
     
     return jsonify({'error': 'Недопустимый тип файла'}), 400
@@ -60,19 +161,58 @@ def upload_file():
 @app.route('/annotate/<filename>')
 def annotate(filename):
     """Страница аннотации с результатами анализа"""
-    session_file = os.path.join(app.config['UPLOAD_FOLDER'], f"{filename}.json")
-    
-    if not os.path.exists(session_file):
+    session_data = load_session(filename)
+    if session_data is None:
         flash('Данные сессии не найдены')
         return redirect(url_for('index'))
     
-    with open(session_file, 'r', encoding='utf-8') as f:
-        session_data = json.load(f)
-    
     return render_template('annotate.html', 
                          session_data=session_data, 
                          taxonomy=get_ui_taxonomy())
 
+def load_session(filename):
+    """Данные сессии загрузки или None"""
+    session_file = os.path.join(app.config['UPLOAD_FOLDER'], f"{filename}.json")
+    if not os.path.exists(session_file):
+        return None
+    with open(session_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def session_geometry(session_data):
+    """Геометрия элементов сессии для отрисовки на клиенте"""
+    image = session_data.get('image') or session_data['analysis_result'].get('metadata', {})
+    return element_geometry(session_data['analysis_result'], image.get('width'), image.get('height'))
+
+@app.route('/api/elements/<filename>')
+def api_elements(filename):
+    """Компактная геометрия элементов: annotate.html рисует рамки сам"""
+    session_data = load_session(filename)
+    if session_data is None:
+        return jsonify({'error': 'Данные сессии не найдены'}), 404
+    
+    response = jsonify(session_geometry(session_data))
+    response.add_etag()
+    return set_revalidate(response.make_conditional(request))
+
+@app.route('/export/<filename>')
+def export_annotated(filename):
+    """Растровая копия с рамками - только для выгрузки (?format=png|jpeg|webp&scale=0.5)"""
+    session_data = load_session(filename)
+    if session_data is None:
+        abort(404)
+    fmt = request.args.get('format', 'png').lower()
+    if fmt not in PIL_FORMATS:
+        return jsonify({'error': f'Неподдерживаемый формат: {fmt}'}), 400
+    scale = min(max(request.args.get('scale', 1.0, type=float), 0.05), 1.0)
+    
+    buffer = io.BytesIO()
+    render_annotated_image(os.path.join(app.config['UPLOAD_FOLDER'], filename),
+                           session_data['analysis_result'], buffer, scale=scale, fmt=fmt)
+    buffer.seek(0)
+    download_name = f"{Path(session_data['original_filename']).stem}_annotated.{fmt}"
+    return send_file(buffer, mimetype=f"image/{PIL_FORMATS[fmt].lower()}",
+                     as_attachment=True, download_name=download_name)
+
 @app.route('/save_annotations', methods=['POST'])
 def save_annotations():
     """Сохранение аннотаций пользователя"""
@@ -96,7 +236,7 @@ def save_annotations():
     # Обновляем аннотации
     session_data['user_annotations'] = annotations
     session_data['user_feedback'] = feedback
-    session_data['annotation_timestamp'] = datetime.datetime.now().isoformat()
+    session_data['annotation_timestamp'] = datetime.now().isoformat()
     
     # Сохраняем обновленные данные
     with open(session_file, 'w', encoding='utf-8') as f:
@@ -115,8 +255,9 @@ def save_annotations():
 
 def save_to_dataset(session_data):
     """Сохраняет данные в финальный датасет"""
-    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-    entry_folder = os.path.join('training_dataset', f'entry_{timestamp}')
+    # Микросекунды: несколько аннотаторов могут сохранять одновременно
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    entry_folder = os.path.join(app.config['DATASET_FOLDER'], f'entry_{timestamp}')
     os.makedirs(entry_folder, exist_ok=True)
       # Копируем изображение
     original_path = os.path.join(app.config['UPLOAD_FOLDER'], session_data['filename'])
@@ -129,6 +270,7 @@ def save_to_dataset(session_data):
         'image_filename': session_data['original_filename'],
         'analysis_timestamp': session_data['timestamp'],
         'annotation_timestamp': session_data['annotation_timestamp'],
+        'image_sha256': session_data.get('image', {}).get('digest'),
         'vision_api_results': session_data['analysis_result'],
         'user_annotations': session_data['user_annotations'],
         'user_feedback': session_data['user_feedback'],
@@ -151,43 +293,67 @@ def cleanup_session_files(filename):
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    """Отдача загруженных файлов"""
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    """Отдача загруженных файлов с ETag по хешу содержимого"""
+    path = safe_join(str(app.config['UPLOAD_FOLDER']), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return set_revalidate(send_file(path, etag=content_digest(path), conditional=True))
 
-@app.route('/dataset')
-def dataset_overview():
-    """Обзор созданного датасета"""
+@app.route('/media/<digest>/<kind>')
+def media_file(digest, kind):
+    """Оригинал или уменьшенная копия по хешу содержимого (кэшируется навсегда)"""
+    path = rendition_path(digest, kind)
+    if path is None:
+        abort(404)
+    return set_immutable(send_file(path, etag=f"{digest}-{kind}", conditional=True))
+
+def list_dataset_entries():
+    """Краткие сведения о записях датасета для страницы обзора (новые сначала)"""
     entries = []
+    for entry_dir in iter_entry_dirs(app.config['DATASET_FOLDER']):
+        data = load_entry(entry_dir)
+        if data is None:
+            continue  # Пропускаем поврежденные записи
+        entries.append({
+            'entry_name': entry_dir.name,
+            'image_filename': data.get('image_filename', ''),
+            'image_sha256': data.get('image_sha256'),
+            'timestamp': data.get('annotation_timestamp') or data.get('analysis_timestamp', ''),
+            'annotations_count': len(data.get('user_annotations', [])),
+            'feedback': data.get('user_feedback', '')
+        })
     
-    for entry_dir in app.config['TRAINING_DATASET_FOLDER'].iterdir():
-        if entry_dir.is_dir() and entry_dir.name.startswith('entry_'):
-            annotation_file = entry_dir / "annotations.json"
-            if annotation_file.exists():
-                try:
-                    with open(annotation_file, 'r', encoding='utf-8') as f:
-                        annotations = json.load(f)
-                    entries.append({
-                        'id': entry_dir.name,
-                        'timestamp': annotations.get('timestamp', ''),
-                        'elements_count': len(annotations.get('annotations', [])),
-                        'has_image': (entry_dir / "image.png").exists()
-                    })
-                except:
-                    pass  # Пропускаем поврежденные записи
-    
-    # Сортируем по времени (новые сначала)
     entries.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    return render_template('dataset.html', entries=entries)
+    return entries
+
+@app.route('/dataset')
+def dataset_overview():
+    """Обзор созданного датасета"""
+    return render_template('dataset.html', entries=list_dataset_entries())
 
 @app.route('/api/taxonomy')
 def api_taxonomy():
     """API endpoint для получения таксономии"""
+    if _taxonomy_json is not None:
+        return app.response_class(_taxonomy_json, mimetype='application/json')
     return jsonify(get_ui_taxonomy())
 
 def allowed_file(filename):
     """Проверяет, разрешен ли тип файла"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def tiled_option(form):
+    """
+    Поле формы tiled: '1'/'true'/'on' - анализ тайлами, '0'/'false'/'off' -
+    целиком, иначе (нет поля, 'auto') - по размеру изображения (None)
+    """
+    value = (form.get('tiled') or 'auto').lower()
+    if value in ('1', 'true', 'on'):
+        return True
+    if value in ('0', 'false', 'off'):
+        return False
+    return None
+
 if __name__ == '__main__':
+    # Сервер разработки; для нескольких аннотаторов: python run_web_app.py --production
     app.run(debug=True, host='0.0.0.0', port=5000)